@@ -0,0 +1,148 @@
+""" Benchmarks of the layered DMFA pipeline on synthetic scenarios, written as JSON so runs on different
+    commits can be compared
+
+    python benchmark.py --years 71 200 --scenarios 6 --output benchmark.json
+    python benchmark.py --years 71 200 --scenarios 6 --compare benchmark.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import timeit
+from pathlib import Path
+from typing import Callable
+import numpy as np
+import pandas as pd
+import scipy
+from dmfa.dmfa_configuration import DMFAConfiguration, compute_survival_curve, compute_survival_function
+from dmfa.usephase import calculate_use_phase_inflowdriven, calculate_use_phase_stockdriven
+from dmfa.scenario_input import create_scenario_inputs, import_scenarios
+from dmfa.layered_dmfa import calculate_layered_DMFA
+from dmfa.impacts import calculate_impacts
+from dmfa.synthetic import create_synthetic_sheets, write_synthetic_workbook
+
+def create_benchmarks(n_years: int, n_scenarios: int, lifespan: int, directory: Path,
+                      seed: int) -> dict[str, Callable[[], object]]:
+    """ The timed functions for one problem size, by benchmark name """
+    sheets = create_synthetic_sheets(n_years=n_years, n_scenarios=n_scenarios, seed=seed)
+    scenario_inputs = create_scenario_inputs(sheets)
+    years = scenario_inputs[0].df_input.index
+    dmfa_configuration = DMFAConfiguration(time_start=years.min(), time_end=years.max(), lifespan=lifespan)
+    stock = scenario_inputs[0].plastic_stock.to_numpy()
+    inflow = calculate_use_phase_stockdriven(stock, dmfa_configuration).inflow
+    layered_dmfas = [calculate_layered_DMFA(scenario_input, lifespan=lifespan) for scenario_input in scenario_inputs]
+    excel_path = directory / f'synthetic_{n_years}_{n_scenarios}.xlsx'
+    write_synthetic_workbook(excel_path, sheets)
+
+    def dmfa_configuration_uncached():
+        compute_survival_curve.cache_clear()
+        compute_survival_function.cache_clear()
+        return DMFAConfiguration(time_start=years.min(), time_end=years.max(), lifespan=lifespan)
+
+    return {
+        'DMFAConfiguration': dmfa_configuration_uncached,
+        'DMFAConfiguration (cached survival)':
+            lambda: DMFAConfiguration(time_start=years.min(), time_end=years.max(), lifespan=lifespan),
+        'calculate_use_phase_stockdriven': lambda: calculate_use_phase_stockdriven(stock, dmfa_configuration),
+        'calculate_use_phase_inflowdriven': lambda: calculate_use_phase_inflowdriven(inflow, dmfa_configuration),
+        'calculate_layered_DMFA': lambda: [calculate_layered_DMFA(scenario_input, lifespan=lifespan)
+                                           for scenario_input in scenario_inputs],
+        'calculate_impacts': lambda: [calculate_impacts(layered_dmfa) for layered_dmfa in layered_dmfas],
+        'import_scenarios': lambda: import_scenarios(excel_path),
+    }
+
+def time_function(function: Callable[[], object], repeat: int, min_time: float) -> dict[str, float]:
+    """ Seconds per call: the best, median and mean of repeat runs, each run calls the function
+        as often as needed to take at least min_time """
+    timer = timeit.Timer(function)
+    number = 1
+    while (elapsed := timer.timeit(number)) < min_time:
+        number = max(number * 2, int(number * min_time / max(elapsed, 1e-9)))
+    times = np.array(timer.repeat(repeat=repeat, number=number)) / number
+    return {
+        'number': number,
+        'repeat': repeat,
+        'best': float(times.min()),
+        'median': float(np.median(times)),
+        'mean': float(times.mean()),
+    }
+
+def get_commit() -> str | None:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True,
+                              cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmarks(year_sizes: list[int], scenario_sizes: list[int], lifespan: int = 15, repeat: int = 5,
+                   min_time: float = 0.2, names: list[str] = None, seed: int = 0) -> dict:
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for n_years in year_sizes:
+            for n_scenarios in scenario_sizes:
+                benchmarks = create_benchmarks(n_years, n_scenarios, lifespan, Path(directory), seed)
+                for name, function in benchmarks.items():
+                    if names and name not in names:
+                        continue
+                    result = {'name': name, 'n_years': n_years, 'n_scenarios': n_scenarios, 'lifespan': lifespan}
+                    result.update(time_function(function, repeat, min_time))
+                    print(f"{name} (years={n_years}, scenarios={n_scenarios}): "
+                          f"{result['best'] * 1e3:.3f} ms", file=sys.stderr)
+                    results.append(result)
+    return {
+        'commit': get_commit(),
+        'date': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        'machine': {
+            'platform': platform.platform(),
+            'processor': platform.processor(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'scipy': scipy.__version__,
+            'pandas': pd.__version__,
+        },
+        'results': results,
+    }
+
+def compare_runs(baseline: dict, current: dict) -> pd.DataFrame:
+    """ Best times of both runs per benchmark and size, ratio > 1 means the current run is slower """
+    key = ['name', 'n_years', 'n_scenarios', 'lifespan']
+    df = pd.merge(
+        pd.DataFrame(baseline['results'])[key + ['best']],
+        pd.DataFrame(current['results'])[key + ['best']],
+        on=key, suffixes=('_baseline', '_current'),
+    )
+    df['ratio'] = df['best_current'] / df['best_baseline']
+    return df
+
+def parse_arguments(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--years', type=int, nargs='+', default=[71],
+                        help='number of years, which is also the number of cohorts (default: 71)')
+    parser.add_argument('--scenarios', type=int, nargs='+', default=[6], help='number of scenarios (default: 6)')
+    parser.add_argument('--lifespan', type=int, default=15, help='mean lifespan of the products in years (default: 15)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed runs per benchmark (default: 5)')
+    parser.add_argument('--min-time', type=float, default=0.2, help='minimum seconds per timed run (default: 0.2)')
+    parser.add_argument('--benchmark', action='append', dest='names', help='only run this benchmark, can be repeated')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the synthetic scenarios (default: 0)')
+    parser.add_argument('-o', '--output', type=Path, help='write the results to this JSON file instead of stdout')
+    parser.add_argument('--compare', type=Path, help='JSON results of an earlier run to compare with')
+    return parser.parse_args(argv)
+
+def main(argv: list[str] = None) -> int:
+    arguments = parse_arguments(argv)
+    run = run_benchmarks(arguments.years, arguments.scenarios, lifespan=arguments.lifespan, repeat=arguments.repeat,
+                         min_time=arguments.min_time, names=arguments.names, seed=arguments.seed)
+    if arguments.output:
+        arguments.output.write_text(json.dumps(run, indent=2))
+    else:
+        print(json.dumps(run, indent=2))
+    if arguments.compare:
+        baseline = json.loads(arguments.compare.read_text())
+        print(compare_runs(baseline, run).to_string(index=False), file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,100 @@
+""" Headless batch runner, solves the layered DMFA and impacts of workbooks without the streamlit app
+
+    python cli.py data/dmfa_data.xlsx --output results --format csv --workers 4
+"""
+import argparse
+import sys
+import json
+import time
+from contextlib import nullcontext
+from pathlib import Path
+import pandas as pd
+from dmfa.scenario_input import ScenarioInput, import_scenarios
+from dmfa.scenario_cache import import_scenarios_cached
+from dmfa.layered_dmfa import LayeredDMFA
+from dmfa.layered_dmfa_batch import calculate_layered_DMFA_batch
+from dmfa.parallel import calculate_layered_DMFA_parallel
+from dmfa.profiling import Profiler
+from dmfa.results_frame import create_flows_frame, create_impacts_frame, create_recycled_inflow_frame, create_usephase_frame
+
+FORMATS = ['csv', 'xlsx', 'parquet']
+
+def create_result_frames(layered_dmfas: list[LayeredDMFA]) -> dict[str, pd.DataFrame]:
+    """ The long format result tables written for every workbook """
+    return {
+        'usephase': create_usephase_frame(layered_dmfas),
+        'recycled_inflow': create_recycled_inflow_frame(layered_dmfas),
+        'flows_and_stocks': create_flows_frame(layered_dmfas),
+        'impacts': create_impacts_frame(layered_dmfas),
+    }
+
+def write_result_frames(frames: dict[str, pd.DataFrame], output_directory: Path, name: str, format: str) -> list[Path]:
+    output_directory.mkdir(parents=True, exist_ok=True)
+    if format == 'xlsx':
+        path = output_directory / f'{name}.xlsx'
+        with pd.ExcelWriter(path, engine='xlsxwriter') as writer:
+            for table, df in frames.items():
+                df.to_excel(writer, sheet_name=table, index=False)
+        return [path]
+
+    paths = []
+    for table, df in frames.items():
+        path = output_directory / f'{name}_{table}.{format}'
+        if format == 'csv':
+            df.to_csv(path, index=False)
+        elif format == 'parquet':
+            df.to_parquet(path, index=False)  # needs pyarrow or fastparquet
+        else:
+            raise ValueError(f"Unknown output format {format}, use one of {FORMATS}")
+        paths.append(path)
+    return paths
+
+def solve_scenarios(scenario_inputs: list[ScenarioInput], lifespan: int, workers: int) -> list[LayeredDMFA]:
+    if workers == 1:
+        return calculate_layered_DMFA_batch(scenario_inputs, lifespan=lifespan)
+    return calculate_layered_DMFA_parallel(scenario_inputs, lifespan=lifespan, max_workers=workers)
+
+def parse_arguments(argv: list[str] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('workbooks', nargs='+', type=Path, help='scenario workbooks (.xlsx)')
+    parser.add_argument('-o', '--output', type=Path, default=Path('results'), help='output directory (default: results)')
+    parser.add_argument('-f', '--format', choices=FORMATS, default='csv', help='output format (default: csv)')
+    parser.add_argument('-w', '--workers', type=int, default=1,
+                        help='worker processes for solving the scenarios, 0 uses all cpus (default: 1)')
+    parser.add_argument('--lifespan', type=int, default=15, help='mean lifespan of the products in years (default: 15)')
+    parser.add_argument('--no-cache', action='store_true', help='always parse the workbooks, skip the scenario cache')
+    parser.add_argument('--profile', action='store_true',
+                        help='print the time, peak memory and array sizes of every stage, the stages solved by '
+                             'worker processes (--workers other than 1) are not profiled')
+    parser.add_argument('--profile-output', type=Path, help='also write the profile of every workbook to this JSON file')
+    parser.add_argument('--no-trace-memory', action='store_true', help='profile the times only, tracing the memory is slower')
+    return parser.parse_args(argv)
+
+def main(argv: list[str] = None) -> int:
+    arguments = parse_arguments(argv)
+    workers = arguments.workers or None  # 0: all cpus
+
+    profiles = {}
+    for workbook in arguments.workbooks:
+        start = time.perf_counter()
+        profiler = Profiler(trace_memory=not arguments.no_trace_memory) if arguments.profile else nullcontext()
+        with profiler:
+            if arguments.no_cache:
+                scenario_inputs = import_scenarios(workbook)
+            else:
+                scenario_inputs = import_scenarios_cached(workbook)
+            layered_dmfas = solve_scenarios(scenario_inputs, arguments.lifespan, workers)
+            paths = write_result_frames(
+                create_result_frames(layered_dmfas), arguments.output, workbook.stem, arguments.format)
+        print(f"{workbook}: {len(scenario_inputs)} scenarios in {time.perf_counter() - start:.2f} s", file=sys.stderr)
+        for path in paths:
+            print(path)
+        if arguments.profile:
+            print(profiler.summary().to_string(index=False), file=sys.stderr)
+            profiles[str(workbook)] = profiler.to_dict()
+    if arguments.profile and arguments.profile_output:
+        arguments.profile_output.write_text(json.dumps(profiles, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,81 +1,129 @@
 import numpy as np
 from dmfa.usephase import UsePhase
 from dmfa.dmfa_configuration import DMFAConfiguration
+from dmfa.network import Network, LAYER_NETWORK
+from dmfa.profiling import profile_stage
 import pandas as pd
 
 class Stock:
-    def __init__(self, name: str, Nt: int, explanation: str = '') -> None:
+    """ View on one row of the values matrix of a DMFA """
+    def __init__(self, name: str, values_matrix: np.ndarray, row: int, explanation: str = '') -> None:
         self.name = name 
-        self.values = np.zeros(Nt)  # initialize to zeros
+        self.row = row
+        self.values_matrix = values_matrix
         self.explanation = explanation
 
+    @property
+    def values(self) -> np.ndarray:
+        return self.values_matrix[..., self.row, :]
+
+    @values.setter
+    def values(self, values: np.ndarray):
+        self.values_matrix[..., self.row, :] = values
+
 class Flow: 
-    def __init__(self, name: str, Nt: int, explanation: str = '') -> None:
+    """ View on one row of the values and transfer coefficient matrices of a DMFA """
+    def __init__(self, name: str, values_matrix: np.ndarray, transfer_coefficient_matrix: np.ndarray, 
+                 row: int, explanation: str = '') -> None:
         self.name = name 
-        self.values = np.zeros(Nt)  # initialize to zeros
-        self.transfer_coefficient = np.zeros(Nt)  # initialize to zeros
+        self.row = row
+        self.values_matrix = values_matrix
+        self.transfer_coefficient_matrix = transfer_coefficient_matrix
         self.explanation = explanation
+
+    @property
+    def values(self) -> np.ndarray:
+        return self.values_matrix[..., self.row, :]
+
+    @values.setter
+    def values(self, values: np.ndarray):
+        self.values_matrix[..., self.row, :] = values
+
+    @property
+    def transfer_coefficient(self) -> np.ndarray:
+        return self.transfer_coefficient_matrix[..., self.row, :]
+
+    @transfer_coefficient.setter
+    def transfer_coefficient(self, transfer_coefficient: np.ndarray):
+        self.set_transfer_coefficient(transfer_coefficient)
     
     def set_transfer_coefficient(self, transfer_coefficient: np.ndarray):
         if transfer_coefficient.shape != self.values.shape:
             raise AssertionError(f"""Transfer coefficient does not have same shape as 
                                  values {transfer_coefficient.shape}, {self.values.shape}
                                  """)
-        self.transfer_coefficient = transfer_coefficient
+        self.transfer_coefficient_matrix[..., self.row, :] = transfer_coefficient
 
 
 class DMFA:
 
-    def __init__(self, dmfa_configruation: DMFAConfiguration):
+    def __init__(self, dmfa_configruation: DMFAConfiguration, n_scenarios: int = None, 
+                 network: Network = LAYER_NETWORK):
+        """ All flow and stock values are stored in one values matrix with shape (n_flows + n_stocks, Nt), 
+            the flows first, and the transfer coefficients in one matrix with shape (n_flows, Nt). 
+            index maps the flow and stock names to their row. The Flow and Stock attributes (e.g. F_1_0) 
+            are views on these rows.
+            n_scenarios: if given, the matrices are stacked with shape (n_scenarios, n_rows, Nt)
+            network: the processes, flows and stocks, see dmfa.network """
 
         self.usephase: UsePhase = None
         self.dmfa_configruation = dmfa_configruation
+        self.n_scenarios = n_scenarios
+        self.network = network
+        shape = () if n_scenarios is None else (n_scenarios,)
         Nt = dmfa_configruation.Nt
-        
-        self.dS_0 = Stock('dS_0', Nt)
-        self.dS_8 = Stock('dS_8', Nt)
-        self.dS_9 = Stock('dS_9', Nt)
-        self.dS_10 = Stock('dS_10', Nt)
-
-        self.F_1_0 =  Flow('F_1_0', Nt, explanation='Flow from Use Phase to Air')
-        self.F_1_2 =  Flow('F_1_2', Nt, explanation='Flow from Use Phase to Dismantling')
-        self.F_1_9 =  Flow('F_1_9', Nt, explanation='Flow From Use Phase to Exports')
-        self.F_1_10 = Flow('F_1_9', Nt, explanation='Flow from Use Phase to Water')
-        self.F_2_0 =  Flow('F_2_0', Nt, explanation='Flow from Dismantling to Air')
-        self.F_2_1 =  Flow('F_2_1', Nt, explanation='Flow from Dismantling to Use Phase')
-        self.F_2_3 =  Flow('F_2_3', Nt, explanation='Flow from Dismantling to Incineration')
-        self.F_2_4 =  Flow('F_2_4', Nt, explanation='Flow from Dismantling to Mechanical Recycling')
-        self.F_3_0 =  Flow('F_3_0', Nt, explanation='Flow from Incineration to Air')
-        self.F_3_8 =  Flow('F_3_8', Nt, explanation='Flow from Incineration to Losses')
-        self.F_3_10 = Flow('F_3_10', Nt, explanation='Flow from Incineration to Water')
-        self.F_4_0 =  Flow('F_4_0', Nt, explanation='Flow from Mechanical Recycling to Air')
-        self.F_4_1 =  Flow('F_4_1', Nt, explanation='Flow from Mechanical Recycling to Use Phase')
-        self.F_4_3 =  Flow('F_4_3', Nt, explanation='Flow from Mechanical Recycling to Incineration')
-        self.F_4_10 = Flow('F_4_10', Nt, explanation='Flow from Mechanical Recycling to Water')
+        n_flows, n_stocks = len(network.flows), len(network.stocks)
+        self._set_matrices(
+            values=np.zeros(shape + (n_flows + n_stocks, Nt)),  # initialize to zeros
+            transfer_coefficients=np.zeros(shape + (n_flows, Nt)),
+        )
+
+    def _set_matrices(self, values: np.ndarray, transfer_coefficients: np.ndarray):
+        self.values = values
+        self.transfer_coefficients = transfer_coefficients
+        self.index: dict[str, int] = self.network.compiled.index
+
+        self.flows: dict[str, Flow] = {
+            flow.name: Flow(flow.name, values, transfer_coefficients, self.index[flow.name], flow.explanation)
+            for flow in self.network.flows
+        }
+        self.stocks: dict[str, Stock] = {
+            stock.name: Stock(stock.name, values, self.index[stock.name], stock.explanation)
+            for stock in self.network.stocks
+        }
+        # flows and stocks as attributes, e.g. self.F_1_0 and self.dS_0
+        for name, flow_or_stock in (self.flows | self.stocks).items():
+            setattr(self, name, flow_or_stock)
+
+    def rows(self, names: list[str]) -> list[int]:
+        return [self.index[name] for name in names]
 
     def set_transfer_coefficients(self, df: pd.DataFrame):
-        self.F_1_0.set_transfer_coefficient(df['F_1_0'].values)
-        self.F_1_2.set_transfer_coefficient(df['F_1_2'].values)
-        self.F_1_9.set_transfer_coefficient(df['F_1_9'].values)
-        self.F_1_10.set_transfer_coefficient(df['F_1_10'].values)
-        self.F_2_0.set_transfer_coefficient(df['F_2_0'].values)
-        self.F_2_1.set_transfer_coefficient(df['F_2_1'].values)
-        self.F_2_3.set_transfer_coefficient(df['F_2_3'].values)
-        self.F_2_4.set_transfer_coefficient(df['F_2_4'].values)
-        self.F_3_0.set_transfer_coefficient(df['F_3_0'].values)
-        self.F_3_8.set_transfer_coefficient(df['F_3_8'].values)
-        self.F_3_10.set_transfer_coefficient(df['F_3_10'].values)
-        self.F_4_0.set_transfer_coefficient(df['F_4_0'].values)
-        self.F_4_1.set_transfer_coefficient(df['F_4_1'].values)
-        self.F_4_3.set_transfer_coefficient(df['F_4_3'].values)
-        self.F_4_10.set_transfer_coefficient(df['F_4_10'].values)
-
-    def get_flows_and_stocks(self) -> list[Flow]:
-        attributes = self.__dict__
-        flow_attributes = [
-            value for key, value in attributes.items() 
-            if isinstance(value, Flow) or isinstance(value, Stock)]
-        return flow_attributes
+        transfer_coefficients = df[self.network.flow_names].to_numpy().T
+        if transfer_coefficients.shape != self.transfer_coefficients.shape:
+            raise AssertionError(f"""Transfer coefficients do not have the same shape as 
+                                 the flows {transfer_coefficients.shape}, {self.transfer_coefficients.shape}
+                                 """)
+        self.transfer_coefficients[...] = transfer_coefficients
+
+    def get_scenario(self, scenario_index: int, copy: bool = False) -> 'DMFA':
+        """ Returns the DMFA of one scenario of a stacked DMFA.
+            Its flows, stocks and usephase are views on the stacked arrays, or copies if copy is True,
+            e.g. to keep the scenario without keeping the arrays of all stacked scenarios alive. """
+        dmfa = DMFA(self.dmfa_configruation, network=self.network)
+        values, transfer_coefficients = self.values[scenario_index], self.transfer_coefficients[scenario_index]
+        if copy:
+            values, transfer_coefficients = values.copy(), transfer_coefficients.copy()
+        dmfa._set_matrices(values, transfer_coefficients)
+        if self.usephase is not None:
+            dmfa.usephase = self.usephase.get_scenario(scenario_index, copy=copy)
+        return dmfa
+
+    def get_flows_and_stocks(self) -> list[Flow | Stock]:
+        return list(self.stocks.values()) + list(self.flows.values())
+
+    def get_flow_or_stock(self, name: str) -> Flow | Stock:
+        return self.flows[name] if name in self.flows else self.stocks[name]
     
     def solve_flows_and_stocks(self, usephase: UsePhase, t: int):
         
@@ -116,10 +164,17 @@ class DMFA:
         # dS9
         self.dS_9.values[t] = self.F_1_9.values[t] 
         # dS10
-        self.dS_10.values[t] = self.F_1_10.values[t] + self.F_3_10.values[t] + self.F_4_10.values[t]  
-        
+        self.dS_10.values[t] = self.F_1_10.values[t] + self.F_3_10.values[t] + self.F_4_10.values[t]
+
+    def solve_all_flows_and_stocks(self, usephase: UsePhase):
+        """ Solves all flows and stocks for the whole time axis at once with the compiled network.
+            Gives the same result as calling solve_flows_and_stocks for every t,
+            which is kept as the per-year reference implementation. """
+        with profile_stage('flows') as stage:
+            stage.add_arrays(values=self.values, transfer_coefficients=self.transfer_coefficients)
+            self.network.compiled.solve(self.values, self.transfer_coefficients, usephase.stock, usephase.outflow)
+
     def shift_export_flow_and_stock(self, num_years: int):
-        self.F_1_9.values = np.roll(self.F_1_9.values, -num_years, axis=0)
-        self.F_1_9.values[-num_years:] = self.F_1_9.values[-num_years-1]
-        self.dS_9.values = np.roll(self.dS_9.values, -num_years, axis=0)
-        self.dS_9.values[-num_years:] = self.dS_9.values[-num_years-1]
+        rows = self.rows(['F_1_9', 'dS_9'])
+        self.values[..., rows, :] = np.roll(self.values[..., rows, :], -num_years, axis=-1)
+        self.values[..., rows, -num_years:] = self.values[..., rows, -num_years-1, None]
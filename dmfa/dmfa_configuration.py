@@ -1,5 +1,32 @@
 import numpy as np
+from functools import lru_cache
 from odym.modules.dynamic_stock_model import DynamicStockModel
+from dmfa.survival import ToeplitzSurvival
+from dmfa.profiling import profiled
+
+@lru_cache(maxsize=32)
+@profiled('survival function')  # only runs on a cache miss
+def compute_survival_function(lifetime_type: str, lifetime_parameters: tuple[tuple[str, float], ...], Nt: int) -> np.ndarray:
+    """ Survival function matrix (year x age-cohort) for a lifetime that is the same for all cohorts.
+        The result is cached for the whole process, keyed by the lifetime type, its parameters and Nt,
+        and is therefore returned read-only. """
+    lt = {'Type': lifetime_type}
+    lt.update({key: [value] for key, value in lifetime_parameters})
+    sf = DynamicStockModel(t=np.arange(Nt), lt=lt).compute_sf_time_invariant().copy()
+    np.fill_diagonal(sf, 1)
+    sf.setflags(write=False)
+    return sf
+
+@lru_cache(maxsize=32)
+@profiled('survival curve')
+def compute_survival_curve(lifetime_type: str, lifetime_parameters: tuple[tuple[str, float], ...], Nt: int) -> np.ndarray:
+    """ Survival curve by age (first column of the survival function matrix), cached like compute_survival_function """
+    lt = {'Type': lifetime_type}
+    lt.update({key: [value] for key, value in lifetime_parameters})
+    sf_age = np.array(DynamicStockModel(t=np.arange(Nt), lt=lt).compute_sf_by_age(np.arange(Nt), 0), dtype=float)
+    sf_age[0] = 1
+    sf_age.setflags(write=False)
+    return sf_age
 
 class DMFAConfiguration:
     """ Holds all dmfa related data to configure a dmfa """
@@ -17,7 +44,15 @@ class DMFAConfiguration:
             'StdDev': [self.lifespan]
         }
         
-        # create survival function matrix
-        self.sf = np.zeros((self.Nt, self.Nc))
-        self.sf[:, :] = DynamicStockModel(t=np.arange(self.Nt), lt=self.lt).compute_sf().copy()        
-        np.fill_diagonal(self.sf[:, :], 1)
\ No newline at end of file
+        self.lifetime_key = (
+            self.lt['Type'],
+            (('Mean', self.lifespan), ('StdDev', self.lifespan)),
+            self.Nt,
+        )
+        # survival function, only its survival curve by age is stored
+        self.survival = ToeplitzSurvival(compute_survival_curve(*self.lifetime_key))
+
+    @property
+    def sf(self) -> np.ndarray:
+        """ Dense survival function matrix, built on first use """
+        return compute_survival_function(*self.lifetime_key)
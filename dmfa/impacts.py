@@ -1,6 +1,9 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, fields
 from dmfa.layered_dmfa import LayeredDMFA 
+from dmfa.scenario_input import ScenarioInput
 import numpy as np 
+import pandas as pd
+from dmfa.profiling import profiled
 
 @dataclass
 class MidpointImpact:
@@ -26,68 +29,181 @@ class Impacts:
     midpoint_impact: MidpointImpact
     endpoint_impact: EndpointImpact
     
-def calculate_impacts(layered_dmfa: LayeredDMFA) -> Impacts:
-    scenario_input = layered_dmfa.scenario_input
-    
-    dS_0_decaBDE = layered_dmfa.decaBDE.dS_0.values
-    dS_0_TPP = layered_dmfa.TPP.dS_0.values
-    
-    incineration_flow_decaBDE = layered_dmfa.decaBDE.F_2_3.values - layered_dmfa.decaBDE.F_3_0.values
-    CO2_conversion_decaBDE = 0.055047
-    CO2_decaBDE = incineration_flow_decaBDE * CO2_conversion_decaBDE
-    incineration_flow_TPP = layered_dmfa.TPP.F_2_3.values - layered_dmfa.TPP.F_3_0.values
-    CO2_conversion_TPP = 2.4273
-    CO2_TPP = incineration_flow_TPP * CO2_conversion_TPP
-    CO2_global_warming = (CO2_decaBDE + CO2_TPP)
-    
-    midpoint_impact = MidpointImpact(
-        human_carcinogenic_toxicity = (dS_0_decaBDE * 
-            scenario_input.df_decaBDE_CFs.loc['human carcinogenic toxicity', 'mid point characterization factor (kg 1,4-DCB / kg)']
-        ),
-        human_non_carcinogenic_toxicity = (dS_0_decaBDE *
-            scenario_input.df_decaBDE_CFs.loc['human non-carcinogenic toxicity', 'mid point characterization factor (kg 1,4-DCB / kg)']
-        ),
-        terrestrial_ecotoxicity = (dS_0_TPP *
-            scenario_input.df_TPP_CFs.loc['terrestrial ecotoxicity', 'mid point characterization factor (kg 1,4-DCB / kg)']    
-        ),
-        freshwater_ecotoxicity = (dS_0_TPP *
-            scenario_input.df_TPP_CFs.loc['freshwater ecotoxicity', 'mid point characterization factor (kg 1,4-DCB / kg)']    
-        ),
-        marine_ecotoxicity = (dS_0_TPP *
-            scenario_input.df_TPP_CFs.loc['marine ecotoxicity', 'mid point characterization factor (kg 1,4-DCB / kg)']    
-        ),
-        CO2_global_warming = CO2_global_warming,
-    )
-    
+@dataclass
+class CharacterizationFactors:
+    """ Characterization factors of the impacts, floats or arrays that broadcast with the flows """
+    human_carcinogenic_toxicity_midpoint: float
+    human_non_carcinogenic_toxicity_midpoint: float
+    terrestrial_ecotoxicity_midpoint: float
+    freshwater_ecotoxicity_midpoint: float
+    marine_ecotoxicity_midpoint: float
     
-    human_health_without_global_warming = dS_0_decaBDE * (
-            scenario_input.df_decaBDE_CFs.loc['human carcinogenic toxicity', 'end point characterization factor (DALY/kg)']
-            + scenario_input.df_decaBDE_CFs.loc['human non-carcinogenic toxicity', 'end point characterization factor (DALY/kg)']
-        ) 
-    human_health_only_global_warming = scenario_input.CO2_endpoint_CF_health * CO2_global_warming
-    human_health = human_health_without_global_warming + human_health_only_global_warming 
+    human_carcinogenic_toxicity_endpoint: float
+    human_non_carcinogenic_toxicity_endpoint: float
+    terrestrial_ecotoxicity_endpoint: float
+    freshwater_ecotoxicity_endpoint: float
+    marine_ecotoxicity_endpoint: float
     
-    ecosystem_health_without_global_warming = dS_0_TPP * (
-            scenario_input.df_TPP_CFs.loc['terrestrial ecotoxicity', 'end point characterization factor (species.yr/kg)']
-            + scenario_input.df_TPP_CFs.loc['freshwater ecotoxicity', 'end point characterization factor (species.yr/kg)']
-            + scenario_input.df_TPP_CFs.loc['marine ecotoxicity', 'end point characterization factor (species.yr/kg)']
-        )
-    ecosystem_health_only_global_warming = CO2_global_warming * (
-        scenario_input.CO2_endpoint_CF_terrestrial 
-        + scenario_input.CO2_endpoint_CF_freshwater)
-    ecosystem_health = ecosystem_health_without_global_warming + ecosystem_health_only_global_warming
-    
-    endpoint_impact = EndpointImpact(
-        human_health = human_health,
-        human_health_without_global_warming = human_health_without_global_warming,
-        human_health_only_global_warming = human_health_only_global_warming,
-        ecosystem_health = ecosystem_health,
-        ecosystem_health_without_global_warming = ecosystem_health_without_global_warming,
-        ecosystem_health_only_global_warming = ecosystem_health_only_global_warming,
+    CO2_endpoint_health: float
+    CO2_endpoint_terrestrial: float
+    CO2_endpoint_freshwater: float
+
+def get_characterization_factors(scenario_input: ScenarioInput) -> CharacterizationFactors:
+    midpoint = 'mid point characterization factor (kg 1,4-DCB / kg)'
+    return CharacterizationFactors(
+        human_carcinogenic_toxicity_midpoint=scenario_input.df_decaBDE_CFs.loc['human carcinogenic toxicity', midpoint],
+        human_non_carcinogenic_toxicity_midpoint=scenario_input.df_decaBDE_CFs.loc['human non-carcinogenic toxicity', midpoint],
+        terrestrial_ecotoxicity_midpoint=scenario_input.df_TPP_CFs.loc['terrestrial ecotoxicity', midpoint],
+        freshwater_ecotoxicity_midpoint=scenario_input.df_TPP_CFs.loc['freshwater ecotoxicity', midpoint],
+        marine_ecotoxicity_midpoint=scenario_input.df_TPP_CFs.loc['marine ecotoxicity', midpoint],
+        
+        human_carcinogenic_toxicity_endpoint=scenario_input.df_decaBDE_CFs.loc[
+            'human carcinogenic toxicity', 'end point characterization factor (DALY/kg)'],
+        human_non_carcinogenic_toxicity_endpoint=scenario_input.df_decaBDE_CFs.loc[
+            'human non-carcinogenic toxicity', 'end point characterization factor (DALY/kg)'],
+        terrestrial_ecotoxicity_endpoint=scenario_input.df_TPP_CFs.loc[
+            'terrestrial ecotoxicity', 'end point characterization factor (species.yr/kg)'],
+        freshwater_ecotoxicity_endpoint=scenario_input.df_TPP_CFs.loc[
+            'freshwater ecotoxicity', 'end point characterization factor (species.yr/kg)'],
+        marine_ecotoxicity_endpoint=scenario_input.df_TPP_CFs.loc[
+            'marine ecotoxicity', 'end point characterization factor (species.yr/kg)'],
+        
+        CO2_endpoint_health=scenario_input.CO2_endpoint_CF_health,
+        CO2_endpoint_terrestrial=scenario_input.CO2_endpoint_CF_terrestrial,
+        CO2_endpoint_freshwater=scenario_input.CO2_endpoint_CF_freshwater,
     )
 
+# substances the characterization factors apply to: the emissions to the environment (dS_0) of decaBDE and TPP
+# and the CO2 from incinerating them
+SUBSTANCES = ['decaBDE', 'TPP', 'CO2']
+CO2_CONVERSION = {'decaBDE': 0.055047, 'TPP': 2.4273}  # kg CO2 / kg incinerated
+IMPACT_CATEGORIES = [field.name for field in fields(MidpointImpact)] + [field.name for field in fields(EndpointImpact)]
+
+def get_emissions(layered_dmfa: LayeredDMFA) -> np.ndarray:
+    """ Emissions of the SUBSTANCES with shape (n_substances, ..., Nt) """
+    CO2 = 0
+    for layer, CO2_conversion in CO2_CONVERSION.items():
+        dmfa = getattr(layered_dmfa, layer)
+        incineration_flow = dmfa.F_2_3.values - dmfa.F_3_0.values
+        CO2 = CO2 + incineration_flow * CO2_conversion
+    return np.stack([layered_dmfa.decaBDE.dS_0.values, layered_dmfa.TPP.dS_0.values, CO2])
+
+def get_characterization_matrix(cf: CharacterizationFactors) -> np.ndarray:
+    """ Characterization matrix with shape (n_categories, n_substances, ...), rows in the order of IMPACT_CATEGORIES
+        and columns in the order of SUBSTANCES. The trailing dimensions are those of the factors, none for floats """
+    human_health = [cf.human_carcinogenic_toxicity_endpoint + cf.human_non_carcinogenic_toxicity_endpoint, 0, 0]
+    human_health_global_warming = [0, 0, cf.CO2_endpoint_health]
+    ecosystem_health = [0, cf.terrestrial_ecotoxicity_endpoint + cf.freshwater_ecotoxicity_endpoint
+                        + cf.marine_ecotoxicity_endpoint, 0]
+    ecosystem_health_global_warming = [0, 0, cf.CO2_endpoint_terrestrial + cf.CO2_endpoint_freshwater]
+    rows = {
+        'human_carcinogenic_toxicity': [cf.human_carcinogenic_toxicity_midpoint, 0, 0],
+        'human_non_carcinogenic_toxicity': [cf.human_non_carcinogenic_toxicity_midpoint, 0, 0],
+        'terrestrial_ecotoxicity': [0, cf.terrestrial_ecotoxicity_midpoint, 0],
+        'freshwater_ecotoxicity': [0, cf.freshwater_ecotoxicity_midpoint, 0],
+        'marine_ecotoxicity': [0, cf.marine_ecotoxicity_midpoint, 0],
+        'CO2_global_warming': [0, 0, 1],
+        'human_health': [a + b for a, b in zip(human_health, human_health_global_warming)],
+        'human_health_without_global_warming': human_health,
+        'human_health_only_global_warming': human_health_global_warming,
+        'ecosystem_health': [a + b for a, b in zip(ecosystem_health, ecosystem_health_global_warming)],
+        'ecosystem_health_without_global_warming': ecosystem_health,
+        'ecosystem_health_only_global_warming': ecosystem_health_global_warming,
+    }
+    entries = [np.asarray(entry, dtype=float) for category in IMPACT_CATEGORIES for entry in rows[category]]
+    shape = np.broadcast_shapes(*[entry.shape for entry in entries])
+    return np.stack([np.broadcast_to(entry, shape) for entry in entries]).reshape(
+        (len(IMPACT_CATEGORIES), len(SUBSTANCES)) + shape)
+
+def characterize(characterization_matrix: np.ndarray, emissions: np.ndarray) -> np.ndarray:
+    """ Impacts (n_categories, ..., Nt) of the emissions (n_substances, ..., Nt) """
+    if characterization_matrix.ndim == 2:
+        return np.tensordot(characterization_matrix, emissions, axes=1)
+    # factors per sample, e.g. (n, 1) for stacked emissions (n_substances, n, Nt)
+    return np.sum(characterization_matrix * emissions[None], axis=1)
+
+@profiled('impacts')
+def calculate_impacts(layered_dmfa: LayeredDMFA, characterization_factors: CharacterizationFactors = None) -> Impacts:
+    """ characterization_factors: defaults to the factors of the scenario input of the layered_dmfa """
+    cf = characterization_factors or get_characterization_factors(layered_dmfa.scenario_input)
+    impacts = dict(zip(IMPACT_CATEGORIES, characterize(get_characterization_matrix(cf), get_emissions(layered_dmfa))))
     return Impacts(
-        midpoint_impact,
-        endpoint_impact,
+        MidpointImpact(**{field.name: impacts[field.name] for field in fields(MidpointImpact)}),
+        EndpointImpact(**{field.name: impacts[field.name] for field in fields(EndpointImpact)}),
     )
 
+@dataclass
+class ImpactsTable:
+    """ Impacts of several scenarios, with prefix sums over the years so the sum over any range of
+        years is a difference of two cumulative values """
+    scenario_numbers: list[int]
+    time_list: np.ndarray
+    values: np.ndarray  # (n_scenarios, n_categories, Nt), categories in the order of IMPACT_CATEGORIES
+    # cumulative[..., j] is the sum of the first j years, shape (n_scenarios, n_categories, Nt + 1),
+    # computed from the values when not given
+    cumulative: np.ndarray = None
+
+    def __post_init__(self):
+        if self.cumulative is None:
+            self.cumulative = np.zeros(self.values.shape[:-1] + (self.values.shape[-1] + 1,))
+            np.cumsum(self.values, axis=-1, out=self.cumulative[..., 1:])
+
+    @classmethod
+    def concatenate(cls, tables: list['ImpactsTable']) -> 'ImpactsTable':
+        """ Table of the scenarios of all tables, which must have the same time_list """
+        return cls(
+            scenario_numbers=[scenario for table in tables for scenario in table.scenario_numbers],
+            time_list=tables[0].time_list,
+            values=np.concatenate([table.values for table in tables]),
+            cumulative=np.concatenate([table.cumulative for table in tables]),
+        )
+
+    def select(self, scenario_numbers: list[int]) -> 'ImpactsTable':
+        """ Table of the given scenarios, in the order of this table """
+        rows = [i for i, scenario in enumerate(self.scenario_numbers) if scenario in scenario_numbers]
+        return ImpactsTable(
+            scenario_numbers=[self.scenario_numbers[i] for i in rows],
+            time_list=self.time_list,
+            values=self.values[rows],
+            cumulative=self.cumulative[rows],
+        )
+
+    def get(self, category: str) -> np.ndarray:
+        """ Impact timeseries of every scenario (n_scenarios, Nt) """
+        return self.values[:, IMPACT_CATEGORIES.index(category)]
+
+    def window(self, start_year: int = None, stop_year: int = None) -> tuple[int, int]:
+        """ Start and stop index in the time_list of the years from start_year up to (excluding) stop_year,
+            defaults to all years. Years outside the time_list are clipped to it """
+        start = 0 if start_year is None else int(np.searchsorted(self.time_list, start_year))
+        stop = len(self.time_list) if stop_year is None else int(np.searchsorted(self.time_list, stop_year))
+        return start, max(start, stop)
+
+    def window_sum(self, category: str, start_year: int = None, stop_year: int = None) -> np.ndarray:
+        """ Sum of one impact from start_year up to (excluding) stop_year for every scenario (n_scenarios,) """
+        start, stop = self.window(start_year, stop_year)
+        cumulative = self.cumulative[:, IMPACT_CATEGORIES.index(category)]
+        return cumulative[:, stop] - cumulative[:, start]
+
+    def window_sums(self, start_year: int = None, stop_year: int = None) -> pd.DataFrame:
+        """ Sums of the impacts from start_year up to (excluding) stop_year, defaults to all years.
+            One row per scenario and one column per category """
+        start, stop = self.window(start_year, stop_year)
+        return pd.DataFrame(
+            self.cumulative[:, :, stop] - self.cumulative[:, :, start],
+            index=pd.Index(self.scenario_numbers, name='scenario'),
+            columns=IMPACT_CATEGORIES,
+        )
+
+@profiled('impacts')
+def calculate_impacts_table(layered_dmfas: list[LayeredDMFA]) -> ImpactsTable:
+    """ Impacts of all scenarios as one stacked matrix product """
+    emissions = np.stack([get_emissions(layered_dmfa) for layered_dmfa in layered_dmfas])
+    characterization_matrices = np.stack([
+        get_characterization_matrix(get_characterization_factors(layered_dmfa.scenario_input))
+        for layered_dmfa in layered_dmfas])
+    return ImpactsTable(
+        scenario_numbers=[layered_dmfa.scenario_input.scenario_number for layered_dmfa in layered_dmfas],
+        time_list=np.asarray(layered_dmfas[0].decaBDE.dmfa_configruation.time_list),
+        values=characterization_matrices @ emissions,
+    )
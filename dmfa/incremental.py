@@ -0,0 +1,248 @@
+import hashlib
+import re
+import threading
+import zipfile
+import xml.etree.ElementTree as ElementTree
+from pathlib import PurePosixPath
+import numpy as np
+import pandas as pd
+from dmfa.dmfa_configuration import DMFAConfiguration
+from dmfa.scenario_input import ScenarioInput, create_scenario_inputs, get_sheet_index_columns, read_workbook
+from dmfa.scenario_cache import scenario_input_to_arrays
+from dmfa.result_cache import LRUCache
+from dmfa.layered_dmfa import LayeredDMFA
+from dmfa.layered_dmfa_batch import solve_stacked_additive_layer, solve_stacked_plastic_layer
+from dmfa.stacked_input import stack_transfer_coefficients
+from dmfa.impacts import ImpactsTable, calculate_impacts_table
+
+# stages of the layered DMFA and what they read: ScenarioInput fields ('years' is the index of df_input)
+# and the results of other stages, a stage is only recomputed when one of these changed
+STAGE_INPUTS = {
+    'plastic': ['years', 'plastic_stock', 'df_plastic_TFs'],
+    'decaBDE': ['plastic', 'years', 'decaBDE_inflow_share', 'df_decaBDE_TFs', 'production_emission_factor_decaBDE'],
+    'TPP': ['plastic', 'years', 'TPP_inflow_new_share', 'df_TPP_TFs', 'production_emission_factor_TPP'],
+    'impacts': ['decaBDE', 'TPP', 'df_decaBDE_CFs', 'df_TPP_CFs',
+                'CO2_endpoint_CF_health', 'CO2_endpoint_CF_terrestrial', 'CO2_endpoint_CF_freshwater'],
+}
+
+XLSX_NAMESPACES = {
+    'main': 'http://schemas.openxmlformats.org/spreadsheetml/2006/main',
+    'relationships': 'http://schemas.openxmlformats.org/officeDocument/2006/relationships',
+    'package': 'http://schemas.openxmlformats.org/package/2006/relationships',
+}
+# the value of a shared string cell is the index of its text in xl/sharedStrings.xml
+SHARED_STRING_CELL = re.compile(rb'(<c\s[^>]*?\bt="s"[^>]*>\s*<v>)(\d+)(</v>)')
+
+def hash_sheet(sheet_xml: bytes, shared_strings: list[str]) -> str:
+    """ sha256 of the xml of a sheet, with the shared string cells resolved to their text. The hash only
+        depends on the strings this sheet uses, not on the other sheets' strings or their order in sharedStrings """
+    resolved, n_cells = SHARED_STRING_CELL.subn(
+        lambda match: match[1] + shared_strings[int(match[2])].encode() + match[3], sheet_xml)
+    if n_cells != sheet_xml.count(b't="s"'):
+        # cells the pattern does not match (e.g. written with a namespace prefix), resolve them on the parsed xml
+        root = ElementTree.fromstring(sheet_xml)
+        for cell in root.iter(f"{{{XLSX_NAMESPACES['main']}}}c"):
+            value = cell.find('main:v', XLSX_NAMESPACES)
+            if cell.get('t') == 's' and value is not None:
+                value.text = shared_strings[int(value.text)]
+        resolved = ElementTree.tostring(root)
+    return hashlib.sha256(resolved).hexdigest()
+
+def hash_sheets(excel_path) -> dict[str, str]:
+    """ Hash of every sheet of a .xlsx workbook (see hash_sheet), by sheet name, without parsing the cells into frames """
+    if hasattr(excel_path, 'read'):
+        position = excel_path.tell()
+    with zipfile.ZipFile(excel_path) as workbook:
+        names = set(workbook.namelist())
+        shared_strings = [
+            ''.join(string.itertext())
+            for string in ElementTree.fromstring(workbook.read('xl/sharedStrings.xml')).iterfind('main:si', XLSX_NAMESPACES)
+        ] if 'xl/sharedStrings.xml' in names else []
+        relationships = {
+            relationship.get('Id'): relationship.get('Target')
+            for relationship in ElementTree.fromstring(workbook.read('xl/_rels/workbook.xml.rels'))
+            .findall('package:Relationship', XLSX_NAMESPACES)
+        }
+        hashes = {}
+        for sheet in ElementTree.fromstring(workbook.read('xl/workbook.xml')).iterfind('main:sheets/main:sheet', XLSX_NAMESPACES):
+            target = relationships[sheet.get(f"{{{XLSX_NAMESPACES['relationships']}}}id")]
+            path = target.lstrip('/') if target.startswith('/') else str(PurePosixPath('xl') / target)
+            hashes[sheet.get('name')] = hash_sheet(workbook.read(path), shared_strings)
+    if hasattr(excel_path, 'read'):
+        excel_path.seek(position)
+    return hashes
+
+class WorkbookReader:
+    """ Reads the sheets of workbooks like read_workbook, but keeps the parsed sheets by name and
+        content hash, so reading an edited workbook only parses the sheets that changed """
+
+    def __init__(self, maxsize: int = 512):
+        self._sheets = LRUCache(maxsize)  # parsed sheets by (sheet name, hash)
+        self._local = threading.local()  # streamlit runs every session in its own thread
+
+    @property
+    def changed_sheets(self) -> list[str]:
+        """ Sheets parsed by the last read in this thread """
+        return getattr(self._local, 'changed_sheets', [])
+
+    def read(self, excel_path) -> dict[str, pd.DataFrame]:
+        hashes = hash_sheets(excel_path)
+        keys = {sheet_name: (sheet_name, hashes[sheet_name]) for sheet_name in get_sheet_index_columns(list(hashes))}
+        cached = self._sheets.get_many(keys.values())
+        sheets = {sheet_name: cached[key] for sheet_name, key in keys.items() if key in cached}
+        changed_sheets = [sheet_name for sheet_name in keys if sheet_name not in sheets]
+        if changed_sheets:
+            sheets.update(read_workbook(excel_path, sheet_names=changed_sheets))
+            self._sheets.put_many({keys[sheet_name]: sheets[sheet_name] for sheet_name in changed_sheets})
+        self._local.changed_sheets = changed_sheets
+        return {sheet_name: sheets[sheet_name] for sheet_name in keys}
+
+def fingerprint_fields(scenario_input: ScenarioInput) -> dict[str, str]:
+    """ Hash of every ScenarioInput field, and of 'years' (the index of df_input) """
+    fingerprints = {}
+    for key, array in scenario_input_to_arrays(scenario_input).items():
+        field = 'years' if key.startswith('df_input/index') else key.split('/')[0]
+        for name in {field, key.split('/')[0]}:
+            fingerprint = fingerprints.setdefault(name, hashlib.sha256())
+            fingerprint.update(f"{key}:{array.dtype}:{array.shape}".encode())
+            fingerprint.update(np.ascontiguousarray(array).tobytes())
+    return {name: fingerprint.hexdigest() for name, fingerprint in fingerprints.items()}
+
+class IncrementalLayeredDMFA:
+    """ Calculates layered DMFAs and their impacts stage by stage (see STAGE_INPUTS). Every stage result
+        is kept by the fingerprint of its inputs, so when only some inputs change (e.g. the TPP transfer
+        coefficients) only the stages that depend on them are recomputed, here the TPP layer and the impacts """
+
+    def __init__(self, lifespan: int = 15, maxsize: int = 256):
+        self.lifespan = lifespan
+        self._results = LRUCache(maxsize)  # stage results by the key of the stage and its inputs
+        self._local = threading.local()  # streamlit runs every session in its own thread
+
+    @property
+    def recomputed(self) -> list[tuple[int, str]]:
+        """ (scenario number, stage) computed by the last call in this thread """
+        return getattr(self._local, 'recomputed', [])
+
+    def __len__(self) -> int:
+        return len(self._results)
+
+    def clear(self):
+        self._results.clear()
+
+    def _stage_keys(self, scenario_input: ScenarioInput) -> dict[str, str]:
+        """ Key of every stage of a scenario: the hash of the fingerprints of its inputs, where the inputs
+            that are stages are represented by their own key """
+        field_fingerprints = fingerprint_fields(scenario_input)
+        keys = {}
+        for stage, inputs in STAGE_INPUTS.items():  # a stage comes after the stages it reads
+            key = hashlib.sha256(f"{stage}:lifespan={self.lifespan}".encode())
+            for name in inputs:
+                key.update(f"{name}={keys[name] if name in STAGE_INPUTS else field_fingerprints[name]}".encode())
+            keys[stage] = key.hexdigest()
+        return keys
+
+    def _solve_stage(self, stage: str, scenario_inputs: list[ScenarioInput], results: list[dict[str, object]]) -> list:
+        """ Solves a stage for all scenarios at once with the stacked solvers. results holds the results of the
+            stages it reads for every scenario, all scenarios must have the same years """
+        years = scenario_inputs[0].df_input.index
+        dmfa_configuration = DMFAConfiguration(
+            time_start=years.min(),
+            time_end=years.max(),
+            lifespan=self.lifespan,
+        )
+        if stage == 'plastic':
+            dmfa = solve_stacked_plastic_layer(
+                plastic_stock=np.stack([scenario_input.plastic_stock.to_numpy() for scenario_input in scenario_inputs]),
+                plastic_TFs=stack_transfer_coefficients([scenario_input.df_plastic_TFs for scenario_input in scenario_inputs]),
+                dmfa_configuration=dmfa_configuration,
+            )
+        elif stage in ('decaBDE', 'TPP'):
+            share = 'decaBDE_inflow_share' if stage == 'decaBDE' else 'TPP_inflow_new_share'
+            dmfa = solve_stacked_additive_layer(
+                name=stage,
+                plastic_inflow=np.stack([result['plastic'].usephase.inflow for result in results]),
+                inflow_share=np.stack([getattr(scenario_input, share).to_numpy() for scenario_input in scenario_inputs]),
+                TFs=stack_transfer_coefficients([getattr(scenario_input, f'df_{stage}_TFs') for scenario_input in scenario_inputs]),
+                production_emission_factor=np.array(
+                    [[getattr(scenario_input, f'production_emission_factor_{stage}')] for scenario_input in scenario_inputs]),
+                dmfa_configuration=dmfa_configuration,
+            )
+        elif stage == 'impacts':
+            # with the cumulative sums, so year windows of the cached impacts are O(1),
+            # the impacts do not read the plastic layer, which is not loaded when both additive layers are cached
+            impacts_table = calculate_impacts_table([
+                LayeredDMFA(scenario_input, result.get('plastic'), result['decaBDE'], result['TPP'])
+                for scenario_input, result in zip(scenario_inputs, results)])
+            return [ImpactsTable(
+                scenario_numbers=[scenario_number],
+                time_list=impacts_table.time_list,
+                values=impacts_table.values[s:s+1].copy(),
+                cumulative=impacts_table.cumulative[s:s+1].copy(),
+            ) for s, scenario_number in enumerate(impacts_table.scenario_numbers)]
+        # copies, a cached scenario must not keep the stacked arrays of all solved scenarios alive
+        return [dmfa.get_scenario(s, copy=True) for s in range(len(scenario_inputs))]
+
+    def _calculate_stages(self, scenario_inputs: list[ScenarioInput], stages: list[str],
+                          recomputed: list[tuple[int, str]]) -> list[dict[str, object]]:
+        """ The results of the stages, and of the stages they read, for every scenario. A stage that is
+            not cached is solved at once for all scenarios that miss it (per set of years) """
+        keys = [self._stage_keys(scenario_input) for scenario_input in scenario_inputs]
+        results = [{} for _ in scenario_inputs]
+
+        def calculate(stage: str, indices: list[int]):
+            cached = self._results.get_many([keys[s][stage] for s in indices])
+            missing = []
+            for s in indices:
+                if keys[s][stage] in cached:
+                    results[s][stage] = cached[keys[s][stage]]
+                else:
+                    missing.append(s)
+            if not missing:
+                return
+            for name in STAGE_INPUTS[stage]:
+                if name in STAGE_INPUTS:
+                    calculate(name, [s for s in missing if name not in results[s]])
+
+            groups = {}  # the stacked solvers need the same years for all scenarios
+            for s in missing:
+                groups.setdefault(tuple(scenario_inputs[s].df_input.index), []).append(s)
+            for group in groups.values():
+                solved = self._solve_stage(stage, [scenario_inputs[s] for s in group], [results[s] for s in group])
+                for s, result in zip(group, solved):
+                    results[s][stage] = result
+                    recomputed.append((scenario_inputs[s].scenario_number, stage))
+            self._results.put_many({keys[s][stage]: results[s][stage] for s in missing})
+
+        for stage in stages:
+            calculate(stage, list(range(len(scenario_inputs))))
+        return results
+
+    def calculate(self, scenario_inputs: list[ScenarioInput]) -> list[LayeredDMFA]:
+        """ The layered DMFA of every scenario, only the stages whose inputs changed are solved """
+        recomputed = []
+        layered_dmfas = [
+            LayeredDMFA(scenario_input, results['plastic'], results['decaBDE'], results['TPP'])
+            for scenario_input, results in zip(
+                scenario_inputs, self._calculate_stages(scenario_inputs, ['plastic', 'decaBDE', 'TPP'], recomputed))
+        ]
+        self._local.recomputed = recomputed
+        return layered_dmfas
+
+    def calculate_impacts_table(self, scenario_inputs: list[ScenarioInput]) -> ImpactsTable:
+        """ The impacts of all scenarios, like calculate """
+        recomputed = []
+        impacts_table = ImpactsTable.concatenate(
+            [results['impacts'] for results in self._calculate_stages(scenario_inputs, ['impacts'], recomputed)])
+        # a cached table is shared by all scenarios with the same inputs and carries the number of the scenario
+        # that computed it, so the rows are numbered by the scenarios asked for
+        impacts_table.scenario_numbers = [scenario_input.scenario_number for scenario_input in scenario_inputs]
+        self._local.recomputed = recomputed
+        return impacts_table
+
+# shared by all streamlit sessions and reruns, as imported modules are not reloaded on a rerun
+WORKBOOK_READER = WorkbookReader()
+INCREMENTAL_LAYERED_DMFA = IncrementalLayeredDMFA()
+
+def import_scenarios_incremental(excel_path) -> list[ScenarioInput]:
+    """ import_scenarios that only parses the sheets that changed since a previous import """
+    return create_scenario_inputs(WORKBOOK_READER.read(excel_path))
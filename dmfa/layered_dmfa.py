@@ -1,8 +1,11 @@
 
+import numpy as np
+import pandas as pd
 from dataclasses import dataclass
 from dmfa.dmfa import DMFA, DMFAConfiguration
 from dmfa.scenario_input import ScenarioInput
 from dmfa.usephase import calculate_use_phase_inflowdriven, calculate_use_phase_stockdriven
+from dmfa.profiling import profile_stage, profiled
 
 @dataclass 
 class LayeredDMFA:
@@ -12,7 +15,8 @@ class LayeredDMFA:
     decaBDE: DMFA
     TPP: DMFA
 
-def calculate_layered_DMFA(scenario_input: ScenarioInput) -> LayeredDMFA:
+@profiled('calculate_layered_DMFA')
+def calculate_layered_DMFA(scenario_input: ScenarioInput, lifespan: int = 15) -> LayeredDMFA:
 
     years = scenario_input.df_input.index
 
@@ -20,10 +24,25 @@ def calculate_layered_DMFA(scenario_input: ScenarioInput) -> LayeredDMFA:
     dmfa_configuration = DMFAConfiguration(
         time_start=years.min(),
         time_end=years.max(),
-        lifespan=15,
+        lifespan=lifespan,
     )
     
-    ### PLASTIC ### 
+    dmfa_plastic = calculate_plastic_layer(scenario_input, dmfa_configuration)
+    dmfa_decaBDE = calculate_decaBDE_layer(scenario_input, dmfa_configuration, dmfa_plastic)
+    dmfa_TPP = calculate_TPP_layer(scenario_input, dmfa_configuration, dmfa_plastic)
+
+    layered_dmfa = LayeredDMFA(
+        scenario_input=scenario_input,
+        plastic=dmfa_plastic,
+        decaBDE=dmfa_decaBDE,
+        TPP=dmfa_TPP
+    )
+    return layered_dmfa
+
+@profiled('plastic layer')
+def calculate_plastic_layer(scenario_input: ScenarioInput, dmfa_configuration: DMFAConfiguration) -> DMFA:
+    """ Only depends on the plastic stock and the plastic transfer coefficients """
+    
     # create plastic dmfa and set coefficients
     dmfa_plastic = DMFA(dmfa_configuration)
     dmfa_plastic.set_transfer_coefficients(scenario_input.df_plastic_TFs)
@@ -34,8 +53,7 @@ def calculate_layered_DMFA(scenario_input: ScenarioInput) -> LayeredDMFA:
         dmfa_configuration=dmfa_configuration
     )
     # solve the remaining plastic flows and stocks 
-    for t in range(dmfa_configuration.Nt):
-        dmfa_plastic.solve_flows_and_stocks(usephase_plastic, t=t)
+    dmfa_plastic.solve_all_flows_and_stocks(usephase_plastic)
 
     # shift the export flow and stock by 5 years, and 
     # correct the inflow according to:
@@ -47,70 +65,61 @@ def calculate_layered_DMFA(scenario_input: ScenarioInput) -> LayeredDMFA:
         (dmfa_plastic.F_1_2.values + dmfa_plastic.F_1_9.values)                    
     )
     dmfa_plastic.usephase = usephase_plastic
+    return dmfa_plastic
 
-    ### DECABDE ###
-    # create decaBDE dmfa and set transfer coefficients 
-    dmfa_decaBDE = DMFA(dmfa_configuration)
-    dmfa_decaBDE.set_transfer_coefficients(scenario_input.df_decaBDE_TFs)
-    
-    # calculate the decaBDE inflow by multiplying the plastic inflow by the decaBDE inflow share
-    inflow_decaDBE = usephase_plastic.inflow * scenario_input.decaBDE_inflow_share.to_numpy()
-    
-    # calculate the decaBDE stock and outflow from the inflow (inflowdriven)
-    usephase_decaBDE = calculate_use_phase_inflowdriven(
-        inflow=inflow_decaDBE,
+@profiled('decaBDE layer')
+def calculate_decaBDE_layer(scenario_input: ScenarioInput, dmfa_configuration: DMFAConfiguration, 
+                            dmfa_plastic: DMFA) -> DMFA:
+    """ Depends on the plastic layer and the decaBDE share, transfer coefficients and emission factor """
+    return calculate_additive_layer(
         dmfa_configuration=dmfa_configuration,
+        dmfa_plastic=dmfa_plastic,
+        inflow_share=scenario_input.decaBDE_inflow_share.to_numpy(),
+        df_TFs=scenario_input.df_decaBDE_TFs,
+        production_emission_factor=scenario_input.production_emission_factor_decaBDE,
     )
-    # solve the remaining decaBDE flows and stocks 
-    for t in range(dmfa_configuration.Nt):
-        dmfa_decaBDE.solve_flows_and_stocks(usephase_decaBDE, t=t)
-    dmfa_decaBDE.usephase = usephase_decaBDE   
-    
-    # add the emissions to the environment from the Production process (outside dmfa)
-    inflow_recycled = dmfa_decaBDE.F_2_1.values + dmfa_decaBDE.F_4_1.values 
-    inflow_new = dmfa_decaBDE.usephase.inflow - inflow_recycled
-    # ef: emission_factor
-    # dS_0_from_production = ef * production_inflow 
-    # inflow_new = (1-ef) * production_inflow
-    # dS_0_from_production = ef / (1-ef) * inflow_new 
-    ef_decaBDE = scenario_input.production_emission_factor_decaBDE
-    dS_0_from_production = inflow_new * ef_decaBDE / (1-ef_decaBDE)
-    dmfa_decaBDE.dS_0.values += dS_0_from_production
-    
-    ### TPP ###
-    # create TPP dmfa and set transfer coefficients 
-    dmfa_TPP = DMFA(dmfa_configuration)
-    dmfa_TPP.set_transfer_coefficients(scenario_input.df_TPP_TFs)
 
-    # calculate the TPP inflow by multiplying the plastic inflow by the TPP inflow share
-    inflow_TPP = usephase_plastic.inflow * scenario_input.TPP_inflow_new_share.to_numpy()
-    # calculate the TPP stock and outflow from the inflow (inflowdriven)
-    usephase_TPP = calculate_use_phase_inflowdriven(
-        inflow=inflow_TPP,
+@profiled('TPP layer')
+def calculate_TPP_layer(scenario_input: ScenarioInput, dmfa_configuration: DMFAConfiguration, 
+                        dmfa_plastic: DMFA) -> DMFA:
+    """ Depends on the plastic layer and the TPP share, transfer coefficients and emission factor """
+    return calculate_additive_layer(
         dmfa_configuration=dmfa_configuration,
+        dmfa_plastic=dmfa_plastic,
+        inflow_share=scenario_input.TPP_inflow_new_share.to_numpy(),
+        df_TFs=scenario_input.df_TPP_TFs,
+        production_emission_factor=scenario_input.production_emission_factor_TPP,
     )
-    # solve the remaining TPP flows and stocks 
-    for t in range(dmfa_configuration.Nt):
-        dmfa_TPP.solve_flows_and_stocks(usephase_TPP, t=t)
+
+def calculate_additive_layer(dmfa_configuration: DMFAConfiguration, dmfa_plastic: DMFA, inflow_share: np.ndarray,
+                             df_TFs: pd.DataFrame, production_emission_factor: float) -> DMFA:
+    """ Layer of an additive (decaBDE, TPP) in the plastic """
+
+    # create the additive dmfa and set transfer coefficients 
+    dmfa = DMFA(dmfa_configuration)
+    dmfa.set_transfer_coefficients(df_TFs)
     
-    dmfa_TPP.usephase = usephase_TPP    
+    # calculate the additive inflow by multiplying the plastic inflow by the additive inflow share
+    inflow = dmfa_plastic.usephase.inflow * inflow_share
     
-    # add the emissions to the environment from the Production process (outside dmfa)
-    inflow_recycled = dmfa_TPP.F_2_1.values + dmfa_TPP.F_4_1.values 
-    inflow_new = dmfa_TPP.usephase.inflow - inflow_recycled
+    # calculate the additive stock and outflow from the inflow (inflowdriven)
+    usephase = calculate_use_phase_inflowdriven(
+        inflow=inflow,
+        dmfa_configuration=dmfa_configuration,
+    )
+    # solve the remaining additive flows and stocks 
+    dmfa.solve_all_flows_and_stocks(usephase)
+    dmfa.usephase = usephase   
     
+    # add the emissions to the environment from the Production process (outside dmfa)
+    inflow_recycled = dmfa.F_2_1.values + dmfa.F_4_1.values 
+    inflow_new = dmfa.usephase.inflow - inflow_recycled
     # ef: emission_factor
     # dS_0_from_production = ef * production_inflow 
     # inflow_new = (1-ef) * production_inflow
     # dS_0_from_production = ef / (1-ef) * inflow_new 
-    ef_TPP = scenario_input.production_emission_factor_TPP
-    dS_0_from_production = inflow_new * ef_TPP / (1-ef_TPP)
-    dmfa_TPP.dS_0.values += dS_0_from_production
-        
-    layered_dmfa = LayeredDMFA(
-        scenario_input=scenario_input,
-        plastic=dmfa_plastic,
-        decaBDE=dmfa_decaBDE,
-        TPP=dmfa_TPP
-    )
-    return layered_dmfa
+    with profile_stage('production emissions'):
+        ef = production_emission_factor
+        dS_0_from_production = inflow_new * ef / (1-ef)
+        dmfa.dS_0.values += dS_0_from_production
+    return dmfa
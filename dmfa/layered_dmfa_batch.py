@@ -0,0 +1,125 @@
+import numpy as np
+from dmfa.dmfa import DMFA, DMFAConfiguration
+from dmfa.scenario_input import ScenarioInput
+from dmfa.stacked_input import StackedInput, stack_scenario_inputs
+from dmfa.layered_dmfa import LayeredDMFA
+from dmfa.usephase import calculate_use_phase_inflowdriven_stacked, calculate_use_phase_stockdriven_stacked
+from dmfa.profiling import profile_stage, profiled
+
+LAYERS = ['plastic', 'decaBDE', 'TPP']  # order of the DMFAs returned by calculate_stacked_layers and solve_stacked_layers
+
+def calculate_layered_DMFA_batch(scenario_inputs: list[ScenarioInput], lifespan: int = 15) -> list[LayeredDMFA]:
+    """ Calculates the layered DMFA of all scenarios at once. The inputs of all scenarios are 
+        stacked into (scenario, time) arrays and every layer is solved for all scenarios with 
+        array operations. Gives the same results as calculate_layered_DMFA for each scenario,
+        the returned LayeredDMFAs are views on the stacked arrays. """
+
+    dmfa_plastic, dmfa_decaBDE, dmfa_TPP = calculate_stacked_layers(scenario_inputs, lifespan=lifespan)
+    return [
+        LayeredDMFA(
+            scenario_input=scenario_input,
+            plastic=dmfa_plastic.get_scenario(s),
+            decaBDE=dmfa_decaBDE.get_scenario(s),
+            TPP=dmfa_TPP.get_scenario(s),
+        )
+        for s, scenario_input in enumerate(scenario_inputs)
+    ]
+
+def calculate_stacked_layers(scenario_inputs: list[ScenarioInput], lifespan: int = 15) -> tuple[DMFA, DMFA, DMFA]:
+    """ The stacked plastic, decaBDE and TPP DMFAs of all scenarios, see calculate_layered_DMFA_batch """
+
+    years = scenario_inputs[0].df_input.index
+    for scenario_input in scenario_inputs:
+        if not scenario_input.df_input.index.equals(years):
+            raise AssertionError(f"""Scenario {scenario_input.scenario_number} does not have 
+                                 the same years as scenario {scenario_inputs[0].scenario_number}
+                                 """)
+
+    # create dmfa configuration
+    dmfa_configuration = DMFAConfiguration(
+        time_start=years.min(),
+        time_end=years.max(),
+        lifespan=lifespan,
+    )
+    return solve_stacked_layers(stack_scenario_inputs(scenario_inputs), dmfa_configuration)
+
+@profiled('solve_stacked_layers')
+def solve_stacked_layers(stacked_input: StackedInput, dmfa_configuration: DMFAConfiguration) -> tuple[DMFA, DMFA, DMFA]:
+    """ Solves the plastic, decaBDE and TPP layers of all stacked scenarios, like calculate_layered_DMFA """
+    dmfa_plastic = solve_stacked_plastic_layer(
+        plastic_stock=stacked_input.plastic_stock,
+        plastic_TFs=stacked_input.plastic_TFs,
+        dmfa_configuration=dmfa_configuration,
+    )
+    dmfa_decaBDE = solve_stacked_additive_layer(
+        name='decaBDE',
+        plastic_inflow=dmfa_plastic.usephase.inflow,
+        inflow_share=stacked_input.decaBDE_inflow_share,
+        TFs=stacked_input.decaBDE_TFs,
+        production_emission_factor=stacked_input.production_emission_factor_decaBDE,
+        dmfa_configuration=dmfa_configuration,
+    )
+    dmfa_TPP = solve_stacked_additive_layer(
+        name='TPP',
+        plastic_inflow=dmfa_plastic.usephase.inflow,
+        inflow_share=stacked_input.TPP_inflow_new_share,
+        TFs=stacked_input.TPP_TFs,
+        production_emission_factor=stacked_input.production_emission_factor_TPP,
+        dmfa_configuration=dmfa_configuration,
+    )
+    return dmfa_plastic, dmfa_decaBDE, dmfa_TPP
+
+def solve_stacked_plastic_layer(plastic_stock: np.ndarray, plastic_TFs: np.ndarray,
+                                dmfa_configuration: DMFAConfiguration) -> DMFA:
+    """ The plastic layer of all stacked scenarios, like calculate_plastic_layer.
+        plastic_stock: (n, Nt), plastic_TFs: (n, n_flows, Nt) """
+
+    # create stacked plastic dmfa and set coefficients
+    dmfa_plastic = DMFA(dmfa_configuration, n_scenarios=len(plastic_stock))
+    dmfa_plastic.transfer_coefficients[...] = plastic_TFs
+
+    # calculate the plastic inflow and outflows from the stock (stockdriven)
+    usephase_plastic = calculate_use_phase_stockdriven_stacked(
+        stock=plastic_stock,
+        dmfa_configuration=dmfa_configuration
+    )
+    # solve the remaining plastic flows and stocks
+    dmfa_plastic.solve_all_flows_and_stocks(usephase_plastic)
+
+    # shift the export flow and stock by 5 years and correct the inflow, see calculate_plastic_layer
+    dmfa_plastic.shift_export_flow_and_stock(num_years=5)
+    usephase_plastic.inflow = (
+        usephase_plastic.stock_change +
+        (dmfa_plastic.F_1_2.values + dmfa_plastic.F_1_9.values)
+    )
+    dmfa_plastic.usephase = usephase_plastic
+    return dmfa_plastic
+
+def solve_stacked_additive_layer(name: str, plastic_inflow: np.ndarray, inflow_share: np.ndarray, TFs: np.ndarray,
+                                 production_emission_factor: np.ndarray, dmfa_configuration: DMFAConfiguration) -> DMFA:
+    """ The layer of an additive (decaBDE, TPP) of all stacked scenarios, like calculate_additive_layer.
+        plastic_inflow, inflow_share: (n, Nt), TFs: (n, n_flows, Nt), production_emission_factor: (n, 1) """
+
+    # create stacked additive dmfa and set transfer coefficients
+    dmfa = DMFA(dmfa_configuration, n_scenarios=len(plastic_inflow))
+    dmfa.transfer_coefficients[...] = TFs
+
+    # calculate the additive inflow by multiplying the plastic inflow by the additive inflow share
+    inflow = plastic_inflow * inflow_share
+
+    # calculate the additive stock and outflow from the inflow (inflowdriven)
+    usephase = calculate_use_phase_inflowdriven_stacked(
+        inflow=inflow,
+        dmfa_configuration=dmfa_configuration,
+    )
+    # solve the remaining additive flows and stocks
+    dmfa.solve_all_flows_and_stocks(usephase)
+    dmfa.usephase = usephase
+
+    # add the emissions to the environment from the Production process (outside dmfa)
+    inflow_recycled = dmfa.F_2_1.values + dmfa.F_4_1.values
+    inflow_new = dmfa.usephase.inflow - inflow_recycled
+    with profile_stage(f'{name} production emissions'):
+        ef = production_emission_factor
+        dmfa.dS_0.values += inflow_new * ef / (1-ef)
+    return dmfa
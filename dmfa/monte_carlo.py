@@ -0,0 +1,133 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, fields
+from dmfa.dmfa_configuration import DMFAConfiguration
+from dmfa.network import Network, LAYER_NETWORK
+from dmfa.scenario_input import ScenarioInput
+from dmfa.layered_dmfa import LayeredDMFA
+from dmfa.layered_dmfa_batch import solve_stacked_layers
+from dmfa.stacked_input import StackedInput, stack_scenario_inputs
+from dmfa.impacts import calculate_impacts
+from dmfa.results_frame import LAYERS, create_long_frame
+
+USEPHASE_TOTALS = ['inflow', 'stock', 'outflow']
+
+@dataclass
+class Uncertainty:
+    """ Relative standard deviations of the sampled inputs. Each input is multiplied by a lognormal
+        factor with mean 1, which is the same for all years of a sample. """
+    transfer_coefficients: float = 0.1
+    inflow_shares: float = 0.1
+    emission_factors: float = 0.3
+    lifespan: float = 0.2
+    # sampled lifespans are rounded to this resolution (years), the samples with the same
+    # lifespan share their survival function and are solved together
+    lifespan_resolution: float = 0.5
+
+@dataclass
+class MonteCarloResult:
+    time_list: np.ndarray
+    percentiles: tuple[float, ...]
+    lifespans: np.ndarray  # sampled lifespan of every sample
+    # percentile bands with shape (n_percentiles, Nt), keyed by (layer or 'impacts', name)
+    bands: dict[tuple[str, str], np.ndarray]
+
+    def to_frame(self) -> pd.DataFrame:
+        """ Long frame with the columns layer, name, percentile, year and value """
+        values = []
+        labels = {'layer': [], 'name': [], 'percentile': []}
+        for (layer, name), band in self.bands.items():
+            for percentile, band_values in zip(self.percentiles, band):
+                values.append(band_values)
+                labels['layer'].append(layer)
+                labels['name'].append(name)
+                labels['percentile'].append(percentile)
+        return create_long_frame(values, self.time_list, labels)
+
+def lognormal_factors(rng: np.random.Generator, relative_sd: float, size: tuple[int, ...]) -> np.ndarray:
+    """ Positive factors with mean 1 and the given relative standard deviation """
+    sigma = np.sqrt(np.log(1 + relative_sd**2))
+    return rng.lognormal(mean=-sigma**2 / 2, sigma=sigma, size=size)
+
+def sample_transfer_coefficients(transfer_coefficients: np.ndarray, factors: np.ndarray,
+                                 network: Network = LAYER_NETWORK) -> np.ndarray:
+    """ Multiplies the transfer coefficients (..., n_flows, Nt) by the factors (..., n_flows, 1), the
+        coefficients of the flows that leave the same process are scaled back to their original sum """
+    origins = np.array([flow.origin for flow in network.flows])
+    membership = (origins[None, :] == np.unique(origins)[:, None]).astype(float)  # (n_processes, n_flows)
+    sampled = transfer_coefficients * factors
+    original_sum = membership @ transfer_coefficients
+    sampled_sum = membership @ sampled
+    scale = np.divide(original_sum, sampled_sum, out=np.ones(sampled_sum.shape), where=(sampled_sum != 0))
+    return sampled * (membership.T @ scale)
+
+def sample_stacked_input(stacked_input: StackedInput, n_samples: int, uncertainty: Uncertainty,
+                         rng: np.random.Generator) -> StackedInput:
+    """ n_samples draws of the inputs of one scenario (stacked_input of length 1) """
+    n_flows = stacked_input.plastic_TFs.shape[-2]
+
+    def sample_shares(shares: np.ndarray, relative_sd: float, maximum: float) -> np.ndarray:
+        return np.clip(shares * lognormal_factors(rng, relative_sd, (n_samples, 1)), 0, maximum)
+
+    return StackedInput(
+        plastic_stock=np.repeat(stacked_input.plastic_stock, n_samples, axis=0),
+        plastic_TFs=sample_transfer_coefficients(
+            stacked_input.plastic_TFs, lognormal_factors(rng, uncertainty.transfer_coefficients, (n_samples, n_flows, 1))),
+        decaBDE_inflow_share=sample_shares(stacked_input.decaBDE_inflow_share, uncertainty.inflow_shares, 1),
+        decaBDE_TFs=sample_transfer_coefficients(
+            stacked_input.decaBDE_TFs, lognormal_factors(rng, uncertainty.transfer_coefficients, (n_samples, n_flows, 1))),
+        TPP_inflow_new_share=sample_shares(stacked_input.TPP_inflow_new_share, uncertainty.inflow_shares, 1),
+        TPP_TFs=sample_transfer_coefficients(
+            stacked_input.TPP_TFs, lognormal_factors(rng, uncertainty.transfer_coefficients, (n_samples, n_flows, 1))),
+        # an emission factor of 1 would leave no new inflow, dS_0 scales with ef / (1 - ef)
+        production_emission_factor_decaBDE=sample_shares(
+            stacked_input.production_emission_factor_decaBDE, uncertainty.emission_factors, 0.99),
+        production_emission_factor_TPP=sample_shares(
+            stacked_input.production_emission_factor_TPP, uncertainty.emission_factors, 0.99),
+    )
+
+def calculate_monte_carlo(scenario_input: ScenarioInput, n_samples: int = 1000, lifespan: int = 15,
+                          uncertainty: Uncertainty = Uncertainty(), percentiles: tuple[float, ...] = (5, 50, 95),
+                          seed: int = None) -> MonteCarloResult:
+    """ Samples the transfer coefficients, inflow shares, emission factors and mean lifespan of a scenario
+        and returns percentile bands of every flow, stock, use phase total and impact over the samples.
+        The samples are solved as stacked arrays with solve_stacked_layers, one batch per sampled lifespan. """
+    rng = np.random.default_rng(seed)
+    years = scenario_input.df_input.index
+    stacked_input = sample_stacked_input(stack_scenario_inputs([scenario_input]), n_samples, uncertainty, rng)
+    resolution = uncertainty.lifespan_resolution
+    lifespans = np.maximum(
+        resolution, np.round(lifespan * lognormal_factors(rng, uncertainty.lifespan, (n_samples,)) / resolution) * resolution)
+
+    samples: dict[tuple[str, str], np.ndarray] = {}
+
+    def store(key: tuple[str, str], group: np.ndarray, values: np.ndarray):
+        if key not in samples:
+            samples[key] = np.zeros((n_samples, len(years)))
+        samples[key][group] = values
+
+    for group_lifespan in np.unique(lifespans):
+        group = np.flatnonzero(lifespans == group_lifespan)
+        dmfa_configuration = DMFAConfiguration(
+            time_start=years.min(),
+            time_end=years.max(),
+            lifespan=float(group_lifespan),
+        )
+        layered_dmfa = LayeredDMFA(scenario_input, *solve_stacked_layers(stacked_input.select(group), dmfa_configuration))
+        for layer in LAYERS:
+            dmfa = getattr(layered_dmfa, layer)
+            for flow in dmfa.get_flows_and_stocks():
+                store((layer, flow.name), group, flow.values)
+            for name in USEPHASE_TOTALS:
+                store((layer, f'usephase_{name}'), group, getattr(dmfa.usephase, name))
+        impacts = calculate_impacts(layered_dmfa)
+        for impact in [impacts.midpoint_impact, impacts.endpoint_impact]:
+            for field in fields(impact):
+                store(('impacts', field.name), group, getattr(impact, field.name))
+
+    return MonteCarloResult(
+        time_list=np.asarray(years),
+        percentiles=tuple(percentiles),
+        lifespans=lifespans,
+        bands={key: np.percentile(values, percentiles, axis=0) for key, values in samples.items()},
+    )
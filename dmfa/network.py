@@ -0,0 +1,177 @@
+import numpy as np
+from dataclasses import dataclass
+from functools import cached_property
+
+# use phase quantities a transfer coefficient can apply to, next to the flows
+USEPHASE_QUANTITIES = ('stock', 'outflow')
+
+@dataclass(frozen=True)
+class FlowDefinition:
+    name: str
+    origin: int  # process the flow leaves
+    destination: int  # process the flow enters
+    # the transfer coefficient applies to the sum of these flows or use phase quantities
+    base: tuple[str, ...]
+    explanation: str = ''
+
+@dataclass(frozen=True)
+class StockDefinition:
+    name: str
+    process: int  # the stock change is the sum of all flows into this process
+    explanation: str = ''
+
+@dataclass(frozen=True, eq=False)
+class Network:
+    """ Declarative description of the dmfa network: its processes, flows and (sink) stocks """
+    processes: dict[int, str]
+    flows: tuple[FlowDefinition, ...]
+    stocks: tuple[StockDefinition, ...]
+
+    @property
+    def flow_names(self) -> list[str]:
+        return [flow.name for flow in self.flows]
+
+    @property
+    def stock_names(self) -> list[str]:
+        return [stock.name for stock in self.stocks]
+
+    @cached_property
+    def compiled(self) -> 'CompiledNetwork':
+        return CompiledNetwork(self)
+
+
+class CompiledNetwork:
+    """ The network compiled into matrices. Rows are the flows followed by the stocks, like the
+        values matrix of a DMFA. The flows are grouped into topological levels, every flow of a level
+        only depends on the use phase and on flows of earlier levels, so each level is solved for
+        all years (and scenarios) at once:
+            values[level] = tc[level] * (usephase_selection @ usephase + flow_selection @ flows)
+        where selections that pick a single row are applied as an index instead of a product
+        and the stocks follow from the incidence matrix: stocks = incidence @ flows """
+
+    def __init__(self, network: Network):
+        names = network.flow_names + network.stock_names
+        if len(set(names)) != len(names):
+            raise AssertionError(f"Flow and stock names are not unique: {names}")
+        for flow in network.flows:
+            for process in (flow.origin, flow.destination):
+                if process not in network.processes:
+                    raise AssertionError(f"Flow {flow.name} uses unknown process {process}")
+
+        self.n_flows = len(network.flows)
+        self.n_stocks = len(network.stocks)
+        self.index: dict[str, int] = {name: row for row, name in enumerate(names)}
+
+        levels = self._compute_levels(network)
+        # per level: the rows of its flows and the terms (source, selection) that sum to their bases
+        self.levels: list[tuple[np.ndarray | slice, list[tuple[str, np.ndarray]]]] = []
+        for level in range(max(levels.values(), default=-1) + 1):
+            flows = [flow for flow in network.flows if levels[flow.name] == level]
+            usephase_selection = np.zeros((len(flows), len(USEPHASE_QUANTITIES)))
+            flow_selection = np.zeros((len(flows), self.n_flows))
+            for i, flow in enumerate(flows):
+                for base in flow.base:
+                    if base in USEPHASE_QUANTITIES:
+                        usephase_selection[i, USEPHASE_QUANTITIES.index(base)] = 1
+                    else:
+                        flow_selection[i, self.index[base]] = 1
+            terms = [(source, self._compile_selection(selection))
+                     for source, selection in [('usephase', usephase_selection), ('flows', flow_selection)]
+                     if np.any(selection)]
+            rows = self._compile_selection(np.eye(self.n_flows)[[self.index[flow.name] for flow in flows]])
+            self.levels.append((rows, terms))
+
+        self.incidence = np.zeros((self.n_stocks, self.n_flows))
+        for i, stock in enumerate(network.stocks):
+            for flow in network.flows:
+                if flow.destination == stock.process:
+                    self.incidence[i, self.index[flow.name]] = 1
+
+    @staticmethod
+    def _compile_selection(selection: np.ndarray) -> np.ndarray | slice:
+        """ Selection matrices that pick a single row each are applied as an index (or slice), 
+            which is much faster than a matrix product on stacked values """
+        if not np.all(np.sum(selection != 0, axis=1) == 1) or not np.all(selection[selection != 0] == 1):
+            return selection
+        index = np.argmax(selection, axis=1)
+        if len(index) > 0 and np.all(np.diff(index) == 1):
+            return slice(int(index[0]), int(index[-1]) + 1)
+        return index
+
+    @staticmethod
+    def _select(selection: np.ndarray | slice, values: np.ndarray) -> np.ndarray:
+        if isinstance(selection, np.ndarray) and selection.ndim == 2:
+            return selection @ values
+        return values[..., selection, :]
+
+    @staticmethod
+    def _compute_levels(network: Network) -> dict[str, int]:
+        """ Level of each flow: 0 if it only depends on the use phase, else one more than its bases """
+        flows = {flow.name: flow for flow in network.flows}
+        for flow in network.flows:
+            for base in flow.base:
+                if base not in flows and base not in USEPHASE_QUANTITIES:
+                    raise AssertionError(f"Flow {flow.name} has unknown base {base}")
+
+        levels = {}
+        while len(levels) < len(flows):
+            solved = {
+                name: 1 + max([levels[base] for base in flow.base if base in flows], default=-1)
+                for name, flow in flows.items()
+                if name not in levels and all(base in levels or base not in flows for base in flow.base)
+            }
+            if not solved:
+                raise AssertionError(f"Flows {sorted(set(flows) - set(levels))} depend on each other (cycle)")
+            levels.update(solved)
+        return levels
+
+    def solve(self, values: np.ndarray, transfer_coefficients: np.ndarray,
+              stock: np.ndarray, outflow: np.ndarray):
+        """ Solves the values matrix (..., n_flows + n_stocks, Nt) in place from the transfer
+            coefficients (..., n_flows, Nt) and the use phase stock and outflow (..., Nt) """
+        sources = {
+            'usephase': np.stack(np.broadcast_arrays(stock, outflow), axis=-2),
+            'flows': values[..., :self.n_flows, :],
+        }
+        for rows, terms in self.levels:
+            base = sum(self._select(selection, sources[source]) for source, selection in terms)
+            values[..., rows, :] = transfer_coefficients[..., rows, :] * base
+        flows = sources['flows']
+        values[..., self.n_flows:, :] = self.incidence @ flows
+
+
+LAYER_NETWORK = Network(
+    processes={
+        0: 'Air',
+        1: 'Use Phase',
+        2: 'Dismantling',
+        3: 'Incineration',
+        4: 'Mechanical Recycling',
+        8: 'Losses',
+        9: 'Exports',
+        10: 'Water',
+    },
+    flows=(
+        FlowDefinition('F_1_0', 1, 0, ('stock',), 'Flow from Use Phase to Air'),
+        FlowDefinition('F_1_2', 1, 2, ('outflow',), 'Flow from Use Phase to Dismantling'),
+        FlowDefinition('F_1_9', 1, 9, ('outflow',), 'Flow From Use Phase to Exports'),
+        FlowDefinition('F_1_10', 1, 10, ('outflow',), 'Flow from Use Phase to Water'),
+        FlowDefinition('F_2_0', 2, 0, ('F_1_2',), 'Flow from Dismantling to Air'),
+        FlowDefinition('F_2_1', 2, 1, ('F_1_2',), 'Flow from Dismantling to Use Phase'),
+        FlowDefinition('F_2_3', 2, 3, ('F_1_2',), 'Flow from Dismantling to Incineration'),
+        FlowDefinition('F_2_4', 2, 4, ('F_1_2',), 'Flow from Dismantling to Mechanical Recycling'),
+        FlowDefinition('F_3_0', 3, 0, ('F_2_3',), 'Flow from Incineration to Air'),
+        FlowDefinition('F_3_8', 3, 8, ('F_2_3',), 'Flow from Incineration to Losses'),
+        FlowDefinition('F_3_10', 3, 10, ('F_2_3',), 'Flow from Incineration to Water'),
+        FlowDefinition('F_4_0', 4, 0, ('F_2_4',), 'Flow from Mechanical Recycling to Air'),
+        FlowDefinition('F_4_1', 4, 1, ('F_2_4',), 'Flow from Mechanical Recycling to Use Phase'),
+        FlowDefinition('F_4_3', 4, 3, ('F_2_4',), 'Flow from Mechanical Recycling to Incineration'),
+        FlowDefinition('F_4_10', 4, 10, ('F_2_4',), 'Flow from Mechanical Recycling to Water'),
+    ),
+    stocks=(
+        StockDefinition('dS_0', 0),
+        StockDefinition('dS_8', 8),
+        StockDefinition('dS_9', 9),
+        StockDefinition('dS_10', 10),
+    ),
+)
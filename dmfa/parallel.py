@@ -0,0 +1,88 @@
+import math
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from functools import cache, partial
+import numpy as np
+from dmfa.dmfa import DMFA, DMFAConfiguration
+from dmfa.scenario_input import ScenarioInput
+from dmfa.scenario_cache import scenario_input_from_arrays, scenario_input_to_arrays
+from dmfa.layered_dmfa import LayeredDMFA
+from dmfa.layered_dmfa_batch import LAYERS, calculate_stacked_layers
+from dmfa.usephase import USEPHASE_TOTALS, UsePhase
+
+def _solve_chunk(arrays: dict[str, np.ndarray], lifespan: int) -> dict[str, np.ndarray]:
+    """ Runs in a worker process: solves one chunk of scenarios, shipped as numpy arrays, and returns
+        the stacked flow and stock matrices and use phase totals of every layer as numpy arrays """
+    scenario_inputs = [scenario_input_from_arrays(arrays, prefix=f'scenario_{i}/')
+                       for i in range(int(arrays['n_scenarios']))]
+    results = {}
+    for layer, dmfa in zip(LAYERS, calculate_stacked_layers(scenario_inputs, lifespan=lifespan)):
+        results[f'{layer}/values'] = dmfa.values
+        results[f'{layer}/transfer_coefficients'] = dmfa.transfer_coefficients
+        for name in USEPHASE_TOTALS:
+            results[f'{layer}/{name}'] = getattr(dmfa.usephase, name)
+    return results
+
+def _chunk_to_layered_dmfas(scenario_inputs: list[ScenarioInput], results: dict[str, np.ndarray],
+                            lifespan: int) -> list[LayeredDMFA]:
+    years = scenario_inputs[0].df_input.index
+    dmfa_configuration = DMFAConfiguration(time_start=years.min(), time_end=years.max(), lifespan=lifespan)
+
+    dmfas = {}
+    for layer in LAYERS:
+        dmfa = DMFA(dmfa_configuration, n_scenarios=len(scenario_inputs))
+        dmfa.values[...] = results[f'{layer}/values']
+        dmfa.transfer_coefficients[...] = results[f'{layer}/transfer_coefficients']
+        dmfa.usephase = UsePhase(**{name: results[f'{layer}/{name}'] for name in USEPHASE_TOTALS})
+        dmfas[layer] = dmfa
+
+    layered_dmfas = []
+    for s, scenario_input in enumerate(scenario_inputs):
+        # the by cohort values are not shipped back, when accessed this scenario is solved again in this process
+        solve_locally = cache(partial(calculate_stacked_layers, [scenario_input], lifespan=lifespan))
+        layers = {}
+        for i, (layer, dmfa) in enumerate(dmfas.items()):
+            layers[layer] = dmfa.get_scenario(s)
+            usephase = layers[layer].usephase
+            usephase.stock_by_cohort_model = lambda i=i, solve=solve_locally: solve()[i].usephase.stock_by_cohort[0]
+            usephase.outflow_by_cohort_model = lambda i=i, solve=solve_locally: solve()[i].usephase.outflow_by_cohort[0]
+        layered_dmfas.append(LayeredDMFA(scenario_input=scenario_input, **layers))
+    return layered_dmfas
+
+def calculate_layered_DMFA_parallel(scenario_inputs: list[ScenarioInput], lifespan: int = 15,
+                                    max_workers: int = None, chunk_size: int = None,
+                                    executor: Executor = None) -> list[LayeredDMFA]:
+    """ Solves the layered DMFA of all scenarios on a process pool and returns them in scenario order.
+        The scenarios are split into chunks that are solved with calculate_layered_DMFA_batch in the workers.
+        Inputs and results are shipped as plain numpy arrays (see scenario_input_to_arrays), not as
+        pickled DataFrames. The by cohort values of the use phases are not shipped back: the first access
+        to them solves that scenario again in this process.
+        max_workers: size of the process pool, defaults to the number of cpus
+        chunk_size: scenarios per task, defaults to about four tasks per worker
+        executor: an existing executor to reuse instead of starting a new process pool """
+    if not scenario_inputs:
+        return []
+    max_workers = max_workers or os.cpu_count() or 1
+    chunk_size = chunk_size or math.ceil(len(scenario_inputs) / (4 * max_workers))
+    chunks = [scenario_inputs[i:i+chunk_size] for i in range(0, len(scenario_inputs), chunk_size)]
+
+    chunk_arrays = []
+    for chunk in chunks:
+        arrays = {'n_scenarios': np.array(len(chunk))}
+        for i, scenario_input in enumerate(chunk):
+            arrays.update(scenario_input_to_arrays(scenario_input, prefix=f'scenario_{i}/'))
+        chunk_arrays.append(arrays)
+
+    lifespans = [lifespan] * len(chunks)
+    if executor is not None:
+        chunk_results = list(executor.map(_solve_chunk, chunk_arrays, lifespans))
+    elif max_workers == 1 or len(chunks) == 1:
+        chunk_results = list(map(_solve_chunk, chunk_arrays, lifespans))  # a process pool only adds overhead
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            chunk_results = list(executor.map(_solve_chunk, chunk_arrays, lifespans))
+
+    layered_dmfas = []
+    for chunk, results in zip(chunks, chunk_results):
+        layered_dmfas.extend(_chunk_to_layered_dmfas(chunk, results, lifespan))
+    return layered_dmfas
@@ -0,0 +1,175 @@
+import contextvars
+import functools
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterator
+import numpy as np
+import pandas as pd
+
+@dataclass
+class StageRecord:
+    """ One run of a profiled stage. peak_bytes is the peak traced memory above the memory at the
+        start of the stage, None without memory tracing. arrays: shapes of the input and output arrays """
+    path: str  # names of the enclosing stages and the stage, joined by '/'
+    depth: int
+    seconds: float = 0.0
+    peak_bytes: int | None = None
+    arrays: dict[str, tuple[int, ...]] = field(default_factory=dict)
+    array_bytes: int = 0
+
+    @property
+    def name(self) -> str:
+        return self.path.rsplit('/', 1)[-1]
+
+    def add_arrays(self, **arrays):
+        """ Records the shapes and sizes of numpy arrays and pandas frames, other values are ignored """
+        for name, array in arrays.items():
+            if isinstance(array, np.ndarray):
+                self.arrays[name] = array.shape
+                self.array_bytes += array.nbytes
+            elif isinstance(array, (pd.DataFrame, pd.Series)):
+                self.arrays[name] = array.shape
+                self.array_bytes += int(np.sum(array.memory_usage(index=True)))
+
+class _DisabledStage:
+    """ Stands in for a StageRecord when no profiler is active """
+    def add_arrays(self, **arrays):
+        pass
+
+_DISABLED_STAGE = _DisabledStage()
+_active_profiler: contextvars.ContextVar['Profiler | None'] = contextvars.ContextVar('active_profiler', default=None)
+
+class Profiler:
+    """ Records the wall time, peak memory and array sizes of the stages run inside it, e.g.
+
+        with Profiler() as profiler:
+            layered_dmfa = calculate_layered_DMFA(scenario_input)
+        print(profiler.to_frame())
+
+        Profiling is opt-in, outside a Profiler the stages cost a context variable lookup. The memory
+        is traced with tracemalloc (which numpy reports its allocations to) and slows the stages down,
+        trace_memory=False only records the times and array sizes. """
+
+    def __init__(self, trace_memory: bool = True):
+        self.trace_memory = trace_memory
+        self.records: list[StageRecord] = []
+        self._stack: list[tuple[StageRecord, int, list[int]]] = []  # record, memory at start, running peak
+        self._started_tracing = False
+        self._token = None
+
+    def __enter__(self) -> 'Profiler':
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+        self._token = _active_profiler.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _active_profiler.reset(self._token)
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageRecord]:
+        depth = len(self._stack)
+        path = f"{self._stack[-1][0].path}/{name}" if self._stack else name
+        record = StageRecord(path=path, depth=depth)
+        self.records.append(record)
+
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                # keep the peak of the enclosing stage before the peak is reset for this stage
+                running_peak = self._stack[-1][2]
+                running_peak[0] = max(running_peak[0], peak)
+            tracemalloc.reset_peak()
+        else:
+            current = 0
+        running_peak = [current]
+        self._stack.append((record, current, running_peak))
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record.seconds = time.perf_counter() - start
+            self._stack.pop()
+            if tracing:
+                stage_peak = max(running_peak[0], tracemalloc.get_traced_memory()[1])
+                record.peak_bytes = stage_peak - current
+                if self._stack:
+                    enclosing_peak = self._stack[-1][2]
+                    enclosing_peak[0] = max(enclosing_peak[0], stage_peak)
+
+    def to_frame(self) -> pd.DataFrame:
+        """ One row per stage run, in the order the stages started """
+        return pd.DataFrame({
+            'stage': [record.path for record in self.records],
+            'depth': [record.depth for record in self.records],
+            'seconds': [record.seconds for record in self.records],
+            'peak_bytes': pd.array([record.peak_bytes for record in self.records], dtype='Int64'),
+            'array_bytes': [record.array_bytes for record in self.records],
+            'arrays': [', '.join(f'{name}{list(shape)}' for name, shape in record.arrays.items())
+                       for record in self.records],
+        })
+
+    def summary(self) -> pd.DataFrame:
+        """ Runs, total and maximum time and the maximum peak memory per stage, slowest stages first """
+        df = self.to_frame()
+        return df.groupby('stage', sort=False).agg(
+            runs=('seconds', 'size'),
+            seconds=('seconds', 'sum'),
+            max_seconds=('seconds', 'max'),
+            peak_bytes=('peak_bytes', 'max'),
+            array_bytes=('array_bytes', 'max'),
+        ).sort_values('seconds', ascending=False).reset_index()
+
+    def to_dict(self) -> dict:
+        """ Structured report that can be written as JSON """
+        return {
+            'trace_memory': self.trace_memory,
+            'stages': [{
+                'stage': record.path,
+                'depth': record.depth,
+                'seconds': record.seconds,
+                'peak_bytes': record.peak_bytes,
+                'array_bytes': record.array_bytes,
+                'arrays': {name: list(shape) for name, shape in record.arrays.items()},
+            } for record in self.records],
+        }
+
+@contextmanager
+def profile_stage(name: str) -> Iterator[StageRecord | _DisabledStage]:
+    """ Profiles the enclosed code as a stage of the active Profiler, does nothing without one """
+    profiler = _active_profiler.get()
+    if profiler is None:
+        yield _DISABLED_STAGE
+        return
+    with profiler.stage(name) as record:
+        yield record
+
+def _result_arrays(result) -> dict[str, np.ndarray]:
+    """ The result if it is an array, otherwise the arrays among its attributes (e.g. of a UsePhase or DMFA) """
+    if isinstance(result, np.ndarray):
+        return {'result': result}
+    return {f'result.{name}': value for name, value in getattr(result, '__dict__', {}).items()
+            if isinstance(value, np.ndarray)}
+
+def profiled(name: str) -> Callable[[Callable], Callable]:
+    """ Decorator that profiles every call as a stage with the given name, recording the
+        array arguments and the arrays of the result """
+    def decorator(function: Callable) -> Callable:
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if _active_profiler.get() is None:
+                return function(*args, **kwargs)
+            with profile_stage(name) as record:
+                record.add_arrays(**{f'arg{i}': arg for i, arg in enumerate(args)}, **kwargs)
+                result = function(*args, **kwargs)
+                record.add_arrays(**_result_arrays(result))
+                return result
+        return wrapper
+    return decorator
@@ -0,0 +1,34 @@
+import threading
+from collections import OrderedDict
+
+class LRUCache:
+    """ Keeps the most recently used values by key and evicts the least recently used beyond maxsize,
+        shared by the streamlit sessions, which run in separate threads """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._values: OrderedDict[object, object] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def get_many(self, keys) -> dict:
+        """ The cached values of the keys that are cached, by key """
+        with self._lock:
+            values = {key: self._values[key] for key in keys if key in self._values}
+            for key in values:
+                self._values.move_to_end(key)
+        return values
+
+    def put_many(self, values: dict):
+        with self._lock:
+            for key, value in values.items():
+                self._values[key] = value
+                self._values.move_to_end(key)
+            while len(self._values) > self.maxsize:
+                self._values.popitem(last=False)
@@ -0,0 +1,108 @@
+import numpy as np
+import pandas as pd
+from dmfa.layered_dmfa import LayeredDMFA
+from dmfa.impacts import IMPACT_CATEGORIES, ImpactsTable, calculate_impacts_table
+from dmfa.layered_dmfa_batch import LAYERS
+
+def create_long_frame(values: list[np.ndarray], time_list: np.ndarray, labels: dict[str, list]) -> pd.DataFrame:
+    """ Tidy frame with one row per (series, year) from a list of timeseries.
+        labels holds one label per series for every categorical column, e.g. {'scenario': [...], 'layer': [...]} """
+    values = np.stack(values) if values else np.zeros((0, len(time_list)))
+    n_series, Nt = values.shape
+    df = pd.DataFrame()
+    for column, column_labels in labels.items():
+        # categories in order of appearance, which keeps the legend order of the plots
+        categorical = pd.Categorical(column_labels, categories=pd.unique(pd.Series(column_labels)))
+        df[column] = pd.Categorical.from_codes(np.repeat(categorical.codes, Nt), categorical.categories)
+    df['year'] = np.tile(time_list, n_series)
+    df['value'] = values.ravel()
+    return df
+
+def select_rows(df: pd.DataFrame, **selection: list) -> pd.DataFrame:
+    """ Rows whose column values are in the given selection, e.g. select_rows(df, layer=['TPP']) """
+    mask = np.ones(len(df), dtype=bool)
+    for column, values in selection.items():
+        mask &= df[column].isin(values).to_numpy()
+    df = df[mask]
+    return df.assign(**{
+        column: df[column].cat.remove_unused_categories()
+        for column in df.columns if isinstance(df[column].dtype, pd.CategoricalDtype)
+    })
+
+def create_usephase_frame(layered_dmfas: list[LayeredDMFA]) -> pd.DataFrame:
+    """ inflow, outflow and stock of the use phase of every scenario and layer """
+    values = []
+    labels = {'scenario': [], 'layer': [], 'quantity': [], 'name': []}
+    for layered_dmfa in layered_dmfas:
+        scenario = layered_dmfa.scenario_input.scenario_number
+        for layer in LAYERS:
+            for quantity in ['inflow', 'outflow', 'stock']:
+                values.append(getattr(getattr(layered_dmfa, layer).usephase, quantity))
+                labels['scenario'].append(scenario)
+                labels['layer'].append(layer)
+                labels['quantity'].append(quantity)
+                labels['name'].append(f'scenario={scenario}_{quantity}_{layer}')
+    return create_long_frame(values, layered_dmfas[0].plastic.dmfa_configruation.time_list, labels)
+
+def create_recycled_inflow_frame(layered_dmfas: list[LayeredDMFA]) -> pd.DataFrame:
+    """ Percentage of the use phase inflow that is recycled (F_2_1 + F_4_1), for every scenario and layer """
+    values = []
+    labels = {'scenario': [], 'layer': [], 'name': []}
+    for layered_dmfa in layered_dmfas:
+        scenario = layered_dmfa.scenario_input.scenario_number
+        for layer in LAYERS:
+            dmfa = getattr(layered_dmfa, layer)
+            inflow = dmfa.usephase.inflow
+            inflow_recycled = dmfa.F_2_1.values + dmfa.F_4_1.values
+            values.append(np.divide(100 * inflow_recycled, inflow,
+                                    out=np.zeros(inflow.shape), where=(inflow != 0)))
+            labels['scenario'].append(scenario)
+            labels['layer'].append(layer)
+            labels['name'].append(f'{scenario}_percentage_recycled_inflow_{layer}')
+    return create_long_frame(values, layered_dmfas[0].plastic.dmfa_configruation.time_list, labels)
+
+def create_flows_frame(layered_dmfas: list[LayeredDMFA]) -> pd.DataFrame:
+    """ All flows and stocks of every scenario and layer """
+    values = []
+    labels = {'scenario': [], 'layer': [], 'flow': [], 'name': []}
+    for layered_dmfa in layered_dmfas:
+        scenario = layered_dmfa.scenario_input.scenario_number
+        for layer in LAYERS:
+            for flow in getattr(layered_dmfa, layer).get_flows_and_stocks():
+                values.append(flow.values)
+                labels['scenario'].append(scenario)
+                labels['layer'].append(layer)
+                labels['flow'].append(flow.name)
+                labels['name'].append(f'{flow.name}_{layer}_scenario={scenario}')
+    return create_long_frame(values, layered_dmfas[0].plastic.dmfa_configruation.time_list, labels)
+
+# impact timeseries in the impacts frame: (kind, attribute of MidpointImpact or EndpointImpact, label in the name)
+IMPACT_SERIES = [
+    ('midpoint', 'human_carcinogenic_toxicity', 'human_carcinogenic'),
+    ('midpoint', 'human_non_carcinogenic_toxicity', 'human_non_carcinogenic'),
+    ('midpoint', 'freshwater_ecotoxicity', 'freshwata'),
+    ('midpoint', 'marine_ecotoxicity', 'marine'),
+    ('midpoint', 'terrestrial_ecotoxicity', 'terrestrial'),
+    ('global warming', 'CO2_global_warming', 'gloabal_warming'),
+    ('endpoint', 'human_health', 'human_health'),
+    ('endpoint', 'ecosystem_health', 'ecosystem_health'),
+    ('endpoint split', 'human_health_without_global_warming', 'human_health_without_global_warming'),
+    ('endpoint split', 'human_health_only_global_warming', 'human_health_only_global_warming'),
+    ('endpoint split', 'ecosystem_health_without_global_warming', 'ecosystem_health_without_global_warming'),
+    ('endpoint split', 'ecosystem_health_only_global_warming', 'ecosystem_health_only_global_warming'),
+]
+
+def create_impacts_frame(layered_dmfas: list[LayeredDMFA], impacts_table: ImpactsTable = None) -> pd.DataFrame:
+    """ Midpoint, global warming and endpoint impact timeseries of every scenario,
+        impacts_table: defaults to the impacts of the layered_dmfas """
+    impacts_table = impacts_table or calculate_impacts_table(layered_dmfas)
+    values = []
+    labels = {'scenario': [], 'kind': [], 'impact': [], 'name': []}
+    for scenario, scenario_values in zip(impacts_table.scenario_numbers, impacts_table.values):
+        for kind, attribute, label in IMPACT_SERIES:
+            values.append(scenario_values[IMPACT_CATEGORIES.index(attribute)])
+            labels['scenario'].append(scenario)
+            labels['kind'].append(kind)
+            labels['impact'].append(attribute)
+            labels['name'].append(f'scenario={scenario}_{label}')
+    return create_long_frame(values, impacts_table.time_list, labels)
@@ -0,0 +1,121 @@
+import hashlib
+import os
+import tempfile
+import zipfile
+from dataclasses import fields
+from pathlib import Path
+from typing import Callable
+import numpy as np
+import pandas as pd
+from dmfa.scenario_input import ScenarioInput, import_scenarios
+
+# on-disk cache of parsed workbooks, one .npz file per workbook content hash
+CACHE_DIRECTORY = Path(os.environ.get('DMFA_CACHE_DIR', Path.home() / '.cache' / 'layered-dynamic-mfa'))
+CACHE_VERSION = 1  # increase when ScenarioInput or the stored format changes
+
+def workbook_hash(excel_path) -> str:
+    """ sha256 of the workbook content, excel_path is a path or a file-like object (e.g. a streamlit upload) """
+    if hasattr(excel_path, 'read'):
+        position = excel_path.tell()
+        content = excel_path.read()
+        excel_path.seek(position)
+    else:
+        content = Path(excel_path).read_bytes()
+    return hashlib.sha256(content).hexdigest()
+
+def _column_to_arrays(values: pd.Series | pd.Index, prefix: str) -> dict[str, np.ndarray]:
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        return {prefix: values.to_numpy()}
+    # text columns, stored as fixed width unicode with a mask for the missing values
+    isna = values.isna()
+    return {
+        prefix: np.array(values.where(~isna, '').astype(str).to_numpy(), dtype=str),
+        prefix + '/isna': np.asarray(isna),
+    }
+
+def _column_from_arrays(arrays: dict[str, np.ndarray], prefix: str) -> np.ndarray:
+    values = arrays[prefix]
+    if prefix + '/isna' in arrays:
+        values = values.astype(object)
+        values[arrays[prefix + '/isna']] = np.nan
+    return values
+
+def _frame_to_arrays(df: pd.DataFrame, prefix: str) -> dict[str, np.ndarray]:
+    arrays = {
+        prefix + '/columns': np.array(df.columns, dtype=str),
+        prefix + '/index_name': np.array(df.index.name or '', dtype=str),
+    }
+    arrays.update(_column_to_arrays(df.index.to_series(), prefix + '/index'))
+    for i, column in enumerate(df.columns):
+        arrays.update(_column_to_arrays(df[column], prefix + f'/column_{i}'))
+    return arrays
+
+def _frame_from_arrays(arrays: dict[str, np.ndarray], prefix: str) -> pd.DataFrame:
+    index = pd.Index(_column_from_arrays(arrays, prefix + '/index'),
+                     name=str(arrays[prefix + '/index_name']) or None)
+    return pd.DataFrame(
+        {column: _column_from_arrays(arrays, prefix + f'/column_{i}')
+         for i, column in enumerate(arrays[prefix + '/columns'].tolist())},
+        index=index,
+    )
+
+def scenario_input_to_arrays(scenario_input: ScenarioInput, prefix: str = '') -> dict[str, np.ndarray]:
+    """ Flattens a ScenarioInput into named numpy arrays, without python objects (no pickle needed) """
+    arrays = {}
+    for field in fields(ScenarioInput):
+        value = getattr(scenario_input, field.name)
+        key = prefix + field.name
+        if isinstance(value, pd.DataFrame):
+            arrays.update(_frame_to_arrays(value, key))
+        elif isinstance(value, pd.Series):
+            arrays.update(_frame_to_arrays(value.to_frame(), key))
+        else:
+            arrays[key] = np.array(value)
+    return arrays
+
+def scenario_input_from_arrays(arrays: dict[str, np.ndarray], prefix: str = '') -> ScenarioInput:
+    """ Inverse of scenario_input_to_arrays """
+    values = {}
+    for field in fields(ScenarioInput):
+        key = prefix + field.name
+        if field.type is pd.DataFrame:
+            values[field.name] = _frame_from_arrays(arrays, key)
+        elif field.type is pd.Series:
+            values[field.name] = _frame_from_arrays(arrays, key).iloc[:, 0]
+        else:
+            values[field.name] = field.type(arrays[key])
+    return ScenarioInput(**values)
+
+def save_scenario_inputs(scenario_inputs: list[ScenarioInput], path: Path):
+    arrays = {'n_scenarios': np.array(len(scenario_inputs))}
+    for i, scenario_input in enumerate(scenario_inputs):
+        arrays.update(scenario_input_to_arrays(scenario_input, prefix=f'scenario_{i}/'))
+    # write to a temporary file first, so other processes never read a partially written cache
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile(dir=path.parent, suffix='.npz', delete=False) as file:
+        np.savez(file, **arrays)
+    os.replace(file.name, path)
+
+def load_scenario_inputs(path: Path) -> list[ScenarioInput]:
+    with np.load(path, allow_pickle=False) as npz:
+        arrays = dict(npz)
+    return [scenario_input_from_arrays(arrays, prefix=f'scenario_{i}/')
+            for i in range(int(arrays['n_scenarios']))]
+
+def import_scenarios_cached(excel_path, cache_directory: Path = CACHE_DIRECTORY,
+                            import_function: Callable = import_scenarios) -> list[ScenarioInput]:
+    """ import_scenarios with a persistent cache keyed by the workbook content,
+        reopening the same workbook does not parse the excel again.
+        import_function parses the workbook on a cache miss """
+    path = Path(cache_directory) / f"{workbook_hash(excel_path)}.v{CACHE_VERSION}.npz"
+    if path.exists():
+        try:
+            return load_scenario_inputs(path)
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            pass  # unreadable cache file, parse the workbook again
+    scenario_inputs = import_function(excel_path)
+    try:
+        save_scenario_inputs(scenario_inputs, path)
+    except OSError:
+        pass  # cache directory not writable, the cache is optional
+    return scenario_inputs
@@ -1,6 +1,6 @@
 import pandas as pd
 from dataclasses import dataclass
-import streamlit as st 
+from dmfa.profiling import profile_stage, profiled
 
 @dataclass
 class ScenarioInput:
@@ -24,50 +24,81 @@ class ScenarioInput:
     CO2_endpoint_CF_terrestrial: float 
     CO2_endpoint_CF_freshwater: float
 
-@st.cache
+# index column of every sheet that is read, the scenario sheets are prefixed with "<scenario number>_"
+GLOBAL_SHEET_INDEX_COLUMNS = {
+    "EFs": "life cycle phase",
+    "decaBDE_CFs": "impact category",
+    "CO2_CFs": "impact category",
+    "TPP_CFs": "impact category",
+}
+SCENARIO_SHEET_INDEX_COLUMNS = {
+    "fleet": "year",
+    "plastic_share": "year",
+    "plastics_TFs": "year",
+    "decaBDE_share": "year",
+    "decaBDE_TFs": "year",
+    "TPP_TFs": "year",
+    "TPP_share": "year",
+}
+
+def get_scenario_numbers(sheet_names: list[str]) -> list[int]:
+    return sorted(set([int(prefix)
+                       for sheet_name in sheet_names
+                       if (prefix := sheet_name.split('_')[0]).isdigit()]))
+
+def get_sheet_index_columns(sheet_names: list[str]) -> dict[str, str]:
+    """ Index column of every sheet needed for the scenarios, by sheet name """
+    index_columns = dict(GLOBAL_SHEET_INDEX_COLUMNS)
+    for scenario_number in get_scenario_numbers(sheet_names):
+        for sheet_suffix, index_column in SCENARIO_SHEET_INDEX_COLUMNS.items():
+            index_columns[f"{scenario_number}_{sheet_suffix}"] = index_column
+    return index_columns
+
+def read_workbook(excel_path, sheet_names: list[str] = None) -> dict[str, pd.DataFrame]:
+    """ Opens the workbook once and reads all sheets needed for the scenarios, by sheet name.
+        sheet_names: only read these sheets """
+    with pd.ExcelFile(excel_path, engine='openpyxl') as workbook:
+        index_columns = get_sheet_index_columns(workbook.sheet_names)
+        sheets = {}
+        for sheet_name, index_column in index_columns.items():
+            if sheet_names is None or sheet_name in sheet_names:
+                with profile_stage(f'read sheet {sheet_name}') as stage:
+                    sheets[sheet_name] = workbook.parse(sheet_name, index_col=index_column)
+                    stage.add_arrays(sheet=sheets[sheet_name])
+        return sheets
+
+@profiled('import_scenarios')
 def import_scenarios(excel_path) -> list[ScenarioInput]:
     """ Reads the excel with all provided sheets and scenarios and outputs it 
         as a ScenarioInput class used for calculating the layered DMFA effects """
+    return create_scenario_inputs(read_workbook(excel_path))
+
+@profiled('create_scenario_inputs')
+def create_scenario_inputs(sheets: dict[str, pd.DataFrame]) -> list[ScenarioInput]:
+    """ Creates the ScenarioInputs from the sheets read by read_workbook """
     # emission factors 
-    df_emission_factors = pd.read_excel(
-        excel_path, sheet_name="EFs", index_col="life cycle phase", engine='openpyxl'
-    )
+    df_emission_factors = sheets["EFs"]
     
     production_emission_factor_decaBDE = df_emission_factors.loc['production', 'decaBDE']
     production_emission_factor_TPP = df_emission_factors.loc['production', 'TPP']
     
-    
-    df_decaBDE_CFs = pd.read_excel(
-        excel_path, sheet_name="decaBDE_CFs", index_col="impact category", engine='openpyxl'
-    )
+    df_decaBDE_CFs = sheets["decaBDE_CFs"]
     
     # co2 characterization factors
-    df_CO2_CFs = pd.read_excel(
-        excel_path, sheet_name="CO2_CFs", index_col="impact category", engine='openpyxl'
-    )
+    df_CO2_CFs = sheets["CO2_CFs"]
     CO2_endpoint_CF_health = df_CO2_CFs.loc['global warming, human health', 'end point characterization factor (DALY / kg)']
     CO2_endpoint_CF_terrestrial = df_CO2_CFs.loc['global warming, terrestrial ecosystems', 'end point characterization factor (species.yr/kg)']
     CO2_endpoint_CF_freshwater = df_CO2_CFs.loc['global warming, freshwater ecosystems', 'end point characterization factor (species.yr/kg)']
     
     # TPP CFS
-    df_TPP_CFs = pd.read_excel(
-        excel_path, sheet_name="TPP_CFs", index_col="impact category", engine='openpyxl'
-    )
-
-    
-    sheet_names = pd.ExcelFile(excel_path).sheet_names
-    scenario_numbers = sorted(set([int(num)
-                                   for sheet_name in sheet_names
-                                   if (num := sheet_name[0]).isdigit()]))
+    df_TPP_CFs = sheets["TPP_CFs"]
 
     scenario_inputs: list[ScenarioInput] = []
-    for scenario_number in scenario_numbers:
-        df_fleet = pd.read_excel(
-            excel_path, sheet_name=f"{scenario_number}_fleet", index_col='year', engine='openpyxl')
+    for scenario_number in get_scenario_numbers(list(sheets)):
+        df_fleet = sheets[f"{scenario_number}_fleet"]
         df_fleet = df_fleet[['vehicle stock']]
 
-        df_plastic = pd.read_excel(
-            excel_path, sheet_name=f"{scenario_number}_plastic_share", index_col='year', engine='openpyxl')
+        df_plastic = sheets[f"{scenario_number}_plastic_share"]
 
         df_plastic = df_plastic[[
             'plastic share', 'average vehicle weight']]
@@ -82,22 +113,17 @@ def import_scenarios(excel_path) -> list[ScenarioInput]:
             df_input['average vehicle weight']
         )
         
-        df_plastic_TFs = pd.read_excel(
-            excel_path, sheet_name=f"{scenario_number}_plastics_TFs", index_col='year', engine='openpyxl')
+        df_plastic_TFs = sheets[f"{scenario_number}_plastics_TFs"]
         
         # decaBDE specific
-        df_decaBDE_share = pd.read_excel(
-            excel_path, sheet_name=f"{scenario_number}_decaBDE_share", index_col='year', engine='openpyxl')
+        df_decaBDE_share = sheets[f"{scenario_number}_decaBDE_share"]
 
-        df_decaBDE_TFs = pd.read_excel(
-            excel_path, sheet_name=f"{scenario_number}_decaBDE_TFs", index_col='year', engine='openpyxl')
+        df_decaBDE_TFs = sheets[f"{scenario_number}_decaBDE_TFs"]
         
         # TPP specific
-        df_TPP_TFs = pd.read_excel(
-            excel_path, sheet_name=f"{scenario_number}_TPP_TFs", index_col='year', engine='openpyxl')
+        df_TPP_TFs = sheets[f"{scenario_number}_TPP_TFs"]
 
-        df_TPP_share = pd.read_excel(
-            excel_path, sheet_name=f"{scenario_number}_TPP_share", index_col='year', engine='openpyxl')
+        df_TPP_share = sheets[f"{scenario_number}_TPP_share"]
 
         scenario_inputs.append(
             ScenarioInput(
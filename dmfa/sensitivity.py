@@ -0,0 +1,168 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, replace
+from scipy.stats import qmc
+from dmfa.dmfa_configuration import DMFAConfiguration
+from dmfa.network import LAYER_NETWORK
+from dmfa.scenario_input import ScenarioInput
+from dmfa.layered_dmfa import LayeredDMFA
+from dmfa.layered_dmfa_batch import solve_stacked_layers
+from dmfa.stacked_input import StackedInput, stack_scenario_inputs
+from dmfa.impacts import calculate_impacts, get_characterization_factors
+from dmfa.monte_carlo import sample_transfer_coefficients
+
+SENSITIVITY_OUTPUTS = ['human_health', 'ecosystem_health']
+# characterization factors that affect the endpoint impacts
+ENDPOINT_CHARACTERIZATION_FACTORS = [
+    'human_carcinogenic_toxicity_endpoint',
+    'human_non_carcinogenic_toxicity_endpoint',
+    'terrestrial_ecotoxicity_endpoint',
+    'freshwater_ecotoxicity_endpoint',
+    'marine_ecotoxicity_endpoint',
+    'CO2_endpoint_health',
+    'CO2_endpoint_terrestrial',
+    'CO2_endpoint_freshwater',
+]
+
+@dataclass
+class SobolResult:
+    parameters: list[str]
+    outputs: list[str]
+    # indices with shape (n_outputs, n_parameters), conf: half width of the 95% bootstrap interval
+    first_order: np.ndarray
+    first_order_conf: np.ndarray
+    total_order: np.ndarray
+    total_order_conf: np.ndarray
+    n_evaluations: int
+
+    def to_frame(self) -> pd.DataFrame:
+        """ One row per output and parameter """
+        n_outputs, n_parameters = self.first_order.shape
+        return pd.DataFrame({
+            'output': np.repeat(self.outputs, n_parameters),
+            'parameter': np.tile(self.parameters, n_outputs),
+            'first_order': self.first_order.ravel(),
+            'first_order_conf': self.first_order_conf.ravel(),
+            'total_order': self.total_order.ravel(),
+            'total_order_conf': self.total_order_conf.ravel(),
+        })
+
+class LayeredDMFAEvaluator:
+    """ Evaluates the total endpoint impacts of one scenario for a batch of relative parameter factors.
+        The parameters are the nonzero transfer coefficients of every layer, the inflow shares, the
+        production emission factors and the endpoint characterization factors. A factor of 1 is the
+        scenario value, all rows of a batch are solved as stacked arrays. """
+
+    def __init__(self, scenario_input: ScenarioInput, lifespan: int = 15):
+        years = scenario_input.df_input.index
+        self.scenario_input = scenario_input
+        self.stacked_input = stack_scenario_inputs([scenario_input])
+        self.characterization_factors = get_characterization_factors(scenario_input)
+        self.dmfa_configuration = DMFAConfiguration(
+            time_start=years.min(),
+            time_end=years.max(),
+            lifespan=lifespan,
+        )
+
+        # parameters: (name, kind, target), kind 'TFs', 'input' or 'CF'
+        self.parameters: list[tuple[str, str, tuple]] = []
+        for layer in ['plastic', 'decaBDE', 'TPP']:
+            transfer_coefficients = getattr(self.stacked_input, f'{layer}_TFs')[0]
+            for row, flow_name in enumerate(LAYER_NETWORK.flow_names):
+                if np.any(transfer_coefficients[row] != 0):
+                    self.parameters.append((f'{layer} {flow_name}', 'TFs', (layer, row)))
+        for name in ['decaBDE_inflow_share', 'TPP_inflow_new_share',
+                     'production_emission_factor_decaBDE', 'production_emission_factor_TPP']:
+            self.parameters.append((name, 'input', (name,)))
+        for name in ENDPOINT_CHARACTERIZATION_FACTORS:
+            self.parameters.append((name, 'CF', (name,)))
+
+    @property
+    def parameter_names(self) -> list[str]:
+        return [name for name, _, _ in self.parameters]
+
+    def __call__(self, factors: np.ndarray, start_year: int = None, stop_year: int = None) -> np.ndarray:
+        """ factors (n, n_parameters) -> sums of the endpoint impacts over the years (n, n_outputs),
+            from start_year up to (excluding) stop_year, defaults to all years """
+        n = len(factors)
+        n_flows = len(LAYER_NETWORK.flows)
+        stacked_input = self.stacked_input
+        tf_factors = {layer: np.ones((n, n_flows, 1)) for layer in ['plastic', 'decaBDE', 'TPP']}
+        inputs = {}
+        cf_factors = {}
+        for i, (_, kind, target) in enumerate(self.parameters):
+            if kind == 'TFs':
+                layer, row = target
+                tf_factors[layer][:, row, 0] = factors[:, i]
+            elif kind == 'input':
+                # an emission factor of 1 would leave no new inflow, see sample_stacked_input
+                maximum = 0.99 if target[0].startswith('production_emission_factor') else 1
+                inputs[target[0]] = np.clip(getattr(stacked_input, target[0]) * factors[:, i, None], 0, maximum)
+            else:
+                cf_factors[target[0]] = getattr(self.characterization_factors, target[0]) * factors[:, i, None]
+
+        batch_input = StackedInput(
+            plastic_stock=np.repeat(stacked_input.plastic_stock, n, axis=0),
+            plastic_TFs=sample_transfer_coefficients(stacked_input.plastic_TFs, tf_factors['plastic']),
+            decaBDE_TFs=sample_transfer_coefficients(stacked_input.decaBDE_TFs, tf_factors['decaBDE']),
+            TPP_TFs=sample_transfer_coefficients(stacked_input.TPP_TFs, tf_factors['TPP']),
+            **inputs,
+        )
+        layered_dmfa = LayeredDMFA(self.scenario_input, *solve_stacked_layers(batch_input, self.dmfa_configuration))
+        impacts = calculate_impacts(layered_dmfa, replace(self.characterization_factors, **cf_factors))
+
+        years = self.dmfa_configuration.time_list
+        window = (years >= (start_year or years[0])) & (years < (stop_year or years[-1] + 1))
+        return np.stack([getattr(impacts.endpoint_impact, output)[:, window].sum(axis=-1)
+                         for output in SENSITIVITY_OUTPUTS], axis=-1)
+
+def calculate_sobol_indices(scenario_input: ScenarioInput, n_base_samples: int = 1024, relative_range: float = 0.1,
+                            lifespan: int = 15, start_year: int = None, stop_year: int = None,
+                            n_bootstrap: int = 100, batch_size: int = 4096, seed: int = None) -> SobolResult:
+    """ First and total order Sobol indices of the summed endpoint impacts (human_health, ecosystem_health)
+        with respect to the parameters of LayeredDMFAEvaluator. Every parameter is multiplied by a
+        uniform factor in [1 - relative_range, 1 + relative_range].
+        Uses a scrambled Sobol sequence for the A and B matrices of the Saltelli design, which takes
+        n_base_samples * (n_parameters + 2) model evaluations, solved in stacked batches of batch_size,
+        and the Saltelli (2010) and Jansen estimators. n_base_samples should be a power of 2. """
+    evaluator = LayeredDMFAEvaluator(scenario_input, lifespan=lifespan)
+    k = len(evaluator.parameters)
+
+    design = qmc.Sobol(d=2 * k, scramble=True, seed=seed).random(n_base_samples)
+    design = 1 - relative_range + 2 * relative_range * design
+    A, B = design[:, :k], design[:, k:]
+    # rows: A, B, then A with column i from B for every parameter i
+    AB = np.repeat(A[None, :, :], k, axis=0)
+    AB[np.arange(k), :, np.arange(k)] = B.T
+    X = np.concatenate([A, B, AB.reshape(-1, k)])
+
+    Y = np.concatenate([evaluator(X[i:i+batch_size], start_year, stop_year)
+                        for i in range(0, len(X), batch_size)])
+    N = n_base_samples
+    f_A, f_B, f_AB = Y[:N], Y[N:2*N], Y[2*N:].reshape(k, N, -1)
+
+    def indices(rows: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """ first and total order indices (..., n_outputs, k) from the base sample rows (..., N) """
+        a, b, ab = f_A[rows], f_B[rows], f_AB[:, rows]  # ab: (k, ..., N, n_outputs)
+        # centering the outputs does not change the estimators, but reduces their variance
+        mean = np.concatenate([a, b], axis=-2).mean(axis=-2, keepdims=True)
+        a, b, ab = a - mean, b - mean, ab - mean
+        variance = np.concatenate([a, b], axis=-2).var(axis=-2)
+        variance = np.where(variance == 0, np.nan, variance)
+        first_order = np.mean(b * (ab - a), axis=-2) / variance
+        total_order = 0.5 * np.mean((a - ab) ** 2, axis=-2) / variance
+        return np.moveaxis(first_order, 0, -1), np.moveaxis(total_order, 0, -1)
+
+    first_order, total_order = indices(np.arange(N))
+    rng = np.random.default_rng(seed)
+    first_order_bootstrap, total_order_bootstrap = indices(rng.integers(0, N, size=(n_bootstrap, N)))
+
+    return SobolResult(
+        parameters=evaluator.parameter_names,
+        outputs=SENSITIVITY_OUTPUTS,
+        first_order=first_order,
+        first_order_conf=1.96 * first_order_bootstrap.std(axis=0),
+        total_order=total_order,
+        total_order_conf=1.96 * total_order_bootstrap.std(axis=0),
+        n_evaluations=len(X),
+    )
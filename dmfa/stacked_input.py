@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+from dataclasses import dataclass, fields
+from dmfa.network import Network, LAYER_NETWORK
+from dmfa.scenario_input import ScenarioInput
+
+@dataclass
+class StackedInput:
+    """ The inputs of the layered DMFA of several scenarios (or samples), stacked along the first axis """
+    plastic_stock: np.ndarray  # (n, Nt)
+    plastic_TFs: np.ndarray  # (n, n_flows, Nt)
+    decaBDE_inflow_share: np.ndarray  # (n, Nt)
+    decaBDE_TFs: np.ndarray  # (n, n_flows, Nt)
+    TPP_inflow_new_share: np.ndarray  # (n, Nt)
+    TPP_TFs: np.ndarray  # (n, n_flows, Nt)
+    production_emission_factor_decaBDE: np.ndarray  # (n, 1)
+    production_emission_factor_TPP: np.ndarray  # (n, 1)
+
+    def __len__(self) -> int:
+        return len(self.plastic_stock)
+
+    def select(self, samples: np.ndarray) -> 'StackedInput':
+        """ The stacked input of a subset of the scenarios, samples is an index or mask on the first axis """
+        return StackedInput(**{field.name: getattr(self, field.name)[samples] for field in fields(StackedInput)})
+
+def stack_transfer_coefficients(dfs: list[pd.DataFrame], network: Network = LAYER_NETWORK) -> np.ndarray:
+    """ Transfer coefficient frames (year x flow) stacked into an (n, n_flows, Nt) array """
+    return np.stack([df[network.flow_names].to_numpy().T for df in dfs])
+
+def stack_scenario_inputs(scenario_inputs: list[ScenarioInput], network: Network = LAYER_NETWORK) -> StackedInput:
+    return StackedInput(
+        plastic_stock=np.stack([scenario_input.plastic_stock.to_numpy() for scenario_input in scenario_inputs]),
+        plastic_TFs=stack_transfer_coefficients(
+            [scenario_input.df_plastic_TFs for scenario_input in scenario_inputs], network),
+        decaBDE_inflow_share=np.stack(
+            [scenario_input.decaBDE_inflow_share.to_numpy() for scenario_input in scenario_inputs]),
+        decaBDE_TFs=stack_transfer_coefficients(
+            [scenario_input.df_decaBDE_TFs for scenario_input in scenario_inputs], network),
+        TPP_inflow_new_share=np.stack(
+            [scenario_input.TPP_inflow_new_share.to_numpy() for scenario_input in scenario_inputs]),
+        TPP_TFs=stack_transfer_coefficients(
+            [scenario_input.df_TPP_TFs for scenario_input in scenario_inputs], network),
+        production_emission_factor_decaBDE=np.array(
+            [[scenario_input.production_emission_factor_decaBDE] for scenario_input in scenario_inputs]),
+        production_emission_factor_TPP=np.array(
+            [[scenario_input.production_emission_factor_TPP] for scenario_input in scenario_inputs]),
+    )
@@ -0,0 +1,83 @@
+import numpy as np
+import scipy.linalg
+import scipy.signal
+from functools import cached_property
+
+class ToeplitzSurvival:
+    """ Survival function of a lifetime that is the same for all cohorts.
+        sf[t, c] = sf_age[t - c] for t >= c and 0 otherwise, so only the survival curve
+        by age is stored instead of the dense Nt x Nt matrix. Stock and outflow totals
+        are discrete convolutions of the inflow with the survival and pdf curves.
+        All methods accept a single time series (Nt,) or stacked time series (..., Nt). """
+
+    def __init__(self, sf_age: np.ndarray):
+        self.sf_age = sf_age
+        self.Nt = len(sf_age)
+
+    @property
+    def shape(self) -> tuple[int, int]:
+        return (self.Nt, self.Nt)
+
+    @cached_property
+    def pdf_age(self) -> np.ndarray:
+        """ Share of a cohort leaving the stock at each age """
+        pdf_age = np.zeros(self.Nt)
+        pdf_age[0] = 1 - self.sf_age[0]  # outflow during the first year
+        pdf_age[1::] = -1 * np.diff(self.sf_age)
+        return pdf_age
+
+    @cached_property
+    def inverse_sf_age(self) -> np.ndarray:
+        """ Coefficients of the inverse of the (lower triangular Toeplitz) survival matrix,
+            which is again lower triangular Toeplitz """
+        if self.sf_age[0] == 0:
+            raise AssertionError("Survival matrix is not invertible, sf_age[0] == 0")
+        # the coefficients are those of the power series 1 / sf_age(x), Newton's iteration g = g * (2 - sf_age * g)
+        # doubles the number of correct coefficients in every step
+        inverse_sf_age = np.array([1 / self.sf_age[0]])
+        while len(inverse_sf_age) < self.Nt:
+            n = min(2 * len(inverse_sf_age), self.Nt)
+            residual = -1 * np.convolve(self.sf_age[:n], inverse_sf_age)[:n]
+            residual[0] += 2
+            inverse_sf_age = np.convolve(inverse_sf_age, residual)[:n]
+        return inverse_sf_age
+
+    def diagonal(self) -> np.ndarray:
+        return np.full(self.Nt, self.sf_age[0])
+
+    def to_dense(self) -> np.ndarray:
+        """ Dense year x age-cohort survival matrix """
+        return scipy.linalg.toeplitz(self.sf_age, np.zeros(self.Nt))
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        # allows the object to be used where a dense sf is expected, e.g. in DynamicStockModel
+        return self.to_dense().astype(dtype, copy=False) if dtype is not None else self.to_dense()
+
+    def convolve(self, values: np.ndarray, curve: np.ndarray, method: str = 'direct') -> np.ndarray:
+        """ result[..., t] = sum_c curve[t - c] * values[..., c], method is passed to scipy.signal.convolve """
+        if method == 'direct' and values.ndim > 1:
+            # scipy convolves stacked values as N-d arrays, which is slow, a matrix product is the same sum
+            return values @ scipy.linalg.toeplitz(curve, np.zeros(self.Nt)).T
+        curve = curve.reshape((1,) * (values.ndim - 1) + (-1,))
+        return scipy.signal.convolve(values, curve, mode='full', method=method)[..., :self.Nt]
+
+    def stock(self, inflow: np.ndarray, method: str = 'direct') -> np.ndarray:
+        """ Total stock from the inflow, stock[t] = sum_c sf[t, c] * inflow[c] """
+        return self.convolve(inflow, self.sf_age, method=method)
+
+    def outflow(self, inflow: np.ndarray, method: str = 'direct') -> np.ndarray:
+        """ Total outflow from the inflow, outflow[t] = sum_c pdf[t, c] * inflow[c] """
+        return self.convolve(inflow, self.pdf_age, method=method)
+
+    def inflow(self, stock: np.ndarray, method: str = 'direct') -> np.ndarray:
+        """ Inflow that builds the given total stock, i.e. solves stock = sf @ inflow """
+        return self.convolve(stock, self.inverse_sf_age, method=method)
+
+    def stock_by_cohort(self, inflow: np.ndarray) -> np.ndarray:
+        """ Stock by cohort (..., t, c) = inflow[..., c] * sf[t, c] """
+        return np.einsum('...c,tc->...tc', inflow, self.to_dense())
+
+    def outflow_by_cohort(self, inflow: np.ndarray) -> np.ndarray:
+        """ Outflow by cohort (..., t, c) = inflow[..., c] * pdf[t, c] """
+        pdf = scipy.linalg.toeplitz(self.pdf_age, np.zeros(self.Nt))
+        return np.einsum('...c,tc->...tc', inflow, pdf)
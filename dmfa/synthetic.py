@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+from dmfa.network import Network, LAYER_NETWORK
+from dmfa.scenario_input import ScenarioInput, create_scenario_inputs
+
+# characterization and emission factors of the synthetic workbooks, in the order of magnitude of data/dmfa_data.xlsx
+SYNTHETIC_EMISSION_FACTORS = {'production': (4.3e-05, 1.5e-05), 'use phase': (7.33e-07, 1.33e-04)}
+SYNTHETIC_DECABDE_CFS = {
+    'human carcinogenic toxicity': (0.486, 2.2e-06),
+    'human non-carcinogenic toxicity': (493.0, 1.12e-04),
+}
+SYNTHETIC_TPP_CFS = {
+    'terrestrial ecotoxicity': (38.9, 4.43e-10),
+    'freshwater ecotoxicity': (0.212, 1.47e-10),
+    'marine ecotoxicity': (0.0413, 2.48e-11),
+}
+SYNTHETIC_CO2_CFS = {
+    'global warming, human health': (9.28e-07, np.nan),
+    'global warming, terrestrial ecosystems': (np.nan, 2.8e-09),
+    'global warming, freshwater ecosystems': (np.nan, 7.65e-14),
+}
+
+def create_synthetic_transfer_coefficients(rng: np.random.Generator, years: np.ndarray,
+                                           network: Network = LAYER_NETWORK) -> pd.DataFrame:
+    """ Random transfer coefficients that sum to 1 per origin process and drift slowly over the years """
+    df_TFs = pd.DataFrame(index=pd.Index(years, name='year'))
+    for origin in sorted(set(flow.origin for flow in network.flows)):
+        flow_names = [flow.name for flow in network.flows if flow.origin == origin]
+        start, end = rng.dirichlet(np.ones(len(flow_names)), size=2)
+        weights = np.linspace(0, 1, len(years))[:, None]
+        shares = (1 - weights) * start + weights * end
+        for flow_name, share in zip(flow_names, shares.T):
+            df_TFs[flow_name] = share
+    return df_TFs[network.flow_names]
+
+def create_synthetic_sheets(n_years: int = 71, n_scenarios: int = 6, start_year: int = 1980,
+                            seed: int = None) -> dict[str, pd.DataFrame]:
+    """ Sheets like read_workbook returns them, with random scenarios of any size """
+    rng = np.random.default_rng(seed)
+    years = np.arange(start_year, start_year + n_years)
+
+    def factors_frame(factors: dict[str, tuple], index_name: str, columns: list[str]) -> pd.DataFrame:
+        return pd.DataFrame(list(factors.values()), index=pd.Index(list(factors), name=index_name), columns=columns)
+
+    sheets = {
+        'EFs': factors_frame(SYNTHETIC_EMISSION_FACTORS, 'life cycle phase', ['decaBDE', 'TPP']),
+        'decaBDE_CFs': factors_frame(SYNTHETIC_DECABDE_CFS, 'impact category', [
+            'mid point characterization factor (kg 1,4-DCB / kg)', 'end point characterization factor (DALY/kg)']),
+        'CO2_CFs': factors_frame(SYNTHETIC_CO2_CFS, 'impact category', [
+            'end point characterization factor (DALY / kg)', 'end point characterization factor (species.yr/kg)']),
+        'TPP_CFs': factors_frame(SYNTHETIC_TPP_CFS, 'impact category', [
+            'mid point characterization factor (kg 1,4-DCB / kg)', 'end point characterization factor (species.yr/kg)']),
+    }
+    for scenario_number in range(n_scenarios):
+        index = pd.Index(years, name='year')
+        # a growing fleet with yearly noise, the plastic share is interpolated between a few anchor years
+        growth = 1 + rng.normal(0.02, 0.01, n_years)
+        anchor_years = years[::max(1, n_years // 3)]
+        sheets[f'{scenario_number}_fleet'] = pd.DataFrame(
+            {'vehicle stock': 4e6 * np.cumprod(growth)}, index=index)
+        sheets[f'{scenario_number}_plastic_share'] = pd.DataFrame({
+            'average vehicle weight': rng.uniform(1100, 1300, len(anchor_years)),
+            'plastic share': np.sort(rng.uniform(0.08, 0.2, len(anchor_years))),
+        }, index=pd.Index(anchor_years, name='year'))
+        sheets[f'{scenario_number}_decaBDE_share'] = pd.DataFrame(
+            {'decaBDE content in new plastics': np.where(years < years[n_years // 2], 4.06e-4, 0)}, index=index)
+        sheets[f'{scenario_number}_TPP_share'] = pd.DataFrame(
+            {'TPP content in new plastics': np.where(years < years[n_years // 2], 0, 1.2e-3)}, index=index)
+        for layer in ['plastics', 'decaBDE', 'TPP']:
+            sheets[f'{scenario_number}_{layer}_TFs'] = create_synthetic_transfer_coefficients(rng, years)
+    return sheets
+
+def create_synthetic_scenario_inputs(n_years: int = 71, n_scenarios: int = 6, start_year: int = 1980,
+                                     seed: int = None) -> list[ScenarioInput]:
+    return create_scenario_inputs(create_synthetic_sheets(n_years, n_scenarios, start_year, seed))
+
+def write_synthetic_workbook(excel_path, sheets: dict[str, pd.DataFrame]):
+    """ Writes the sheets as a workbook that import_scenarios reads back """
+    with pd.ExcelWriter(excel_path, engine='openpyxl') as writer:
+        for sheet_name, df in sheets.items():
+            df.to_excel(writer, sheet_name=sheet_name)
@@ -1,46 +1,137 @@
 import numpy as np
 from dmfa.dmfa_configuration import DMFAConfiguration
 from odym.modules.dynamic_stock_model import DynamicStockModel
-from dataclasses import dataclass 
+from dataclasses import dataclass, field
+from functools import partial
+from typing import Callable
+from dmfa.profiling import profiled
 
+USEPHASE_TOTALS = ['inflow', 'stock', 'stock_change', 'outflow']  # the UsePhase fields that are not by cohort
 
 @dataclass
 class UsePhase:
-    stock_by_cohort: np.ndarray
-    stock_change_by_cohort: np.ndarray
-    outflow_by_cohort: np.ndarray
-    
     inflow: np.ndarray
     stock: np.ndarray
     stock_change: np.ndarray
-    outflow: np.ndarray 
+    outflow: np.ndarray
 
+    # build the by cohort values, only called when these are accessed
+    stock_by_cohort_model: Callable[[], np.ndarray] = field(default=None, repr=False)
+    outflow_by_cohort_model: Callable[[], np.ndarray] = field(default=None, repr=False)
+    # keep the by cohort values once built, else they are rebuilt on every access
+    cache_by_cohort: bool = field(default=True, repr=False)
+    # of a stacked use phase: the stock and outflow by cohort models of one scenario, see get_scenario
+    scenario_by_cohort_models: Callable[[int], tuple[Callable, Callable]] = field(default=None, repr=False)
+    _by_cohort: dict[str, np.ndarray] = field(default_factory=dict, init=False, repr=False)
+
+    def _get_by_cohort(self, name: str, model: Callable[[], np.ndarray]) -> np.ndarray:
+        if name in self._by_cohort:
+            return self._by_cohort[name]
+        values = model()
+        if self.cache_by_cohort:
+            self._by_cohort[name] = values
+        return values
+
+    @property
+    def stock_by_cohort(self) -> np.ndarray:
+        return self._get_by_cohort('stock_by_cohort', self.stock_by_cohort_model)
+
+    @property
+    def outflow_by_cohort(self) -> np.ndarray:
+        return self._get_by_cohort('outflow_by_cohort', self.outflow_by_cohort_model)
+
+    @property
+    def stock_change_by_cohort(self) -> np.ndarray:
+        return self._get_by_cohort('stock_change_by_cohort', self._compute_stock_change_by_cohort)
+
+    def _compute_stock_change_by_cohort(self) -> np.ndarray:
+        S_C = self.stock_by_cohort
+        DS_C = np.zeros(S_C.shape)
+        DS_C[..., 0, :] = S_C[..., 0, :]
+        DS_C[..., 1::, :] = np.diff(S_C, axis=-2)
+        return DS_C
+
+    def get_scenario(self, scenario_index: int, copy: bool = False) -> 'UsePhase':
+        """ Returns the use phase of one scenario of a stacked use phase, as views on the stacked arrays.
+            copy: copies the totals and builds the by cohort values of this scenario only, so the use phase
+            does not keep the stacked arrays alive """
+        if copy and self.scenario_by_cohort_models is not None:
+            stock_by_cohort_model, outflow_by_cohort_model = self.scenario_by_cohort_models(scenario_index)
+            return UsePhase(
+                inflow=self.inflow[scenario_index].copy(),
+                stock=self.stock[scenario_index].copy(),
+                stock_change=self.stock_change[scenario_index].copy(),
+                outflow=self.outflow[scenario_index].copy(),
+                stock_by_cohort_model=stock_by_cohort_model,
+                outflow_by_cohort_model=outflow_by_cohort_model,
+                cache_by_cohort=self.cache_by_cohort,
+            )
+        return UsePhase(
+            inflow=self.inflow[scenario_index],
+            stock=self.stock[scenario_index],
+            stock_change=self.stock_change[scenario_index],
+            outflow=self.outflow[scenario_index],
+            stock_by_cohort_model=lambda: self.stock_by_cohort[scenario_index],
+            outflow_by_cohort_model=lambda: self.outflow_by_cohort[scenario_index],
+            cache_by_cohort=self.cache_by_cohort,
+        )
+
+@profiled('use phase (stock driven)')
 def calculate_use_phase_stockdriven(stock: np.ndarray, dmfa_configuration: DMFAConfiguration) -> UsePhase:
-    
-    dsm = DynamicStockModel(
-        t=np.arange(dmfa_configuration.Nt),
-        lt=dmfa_configuration.lt,
-        s=stock,
-        sf=dmfa_configuration.sf
-    )
 
-    S_C, O_C, inflow = dsm.compute_stock_driven_model(NegativeInflowCorrect=True)
-    DS_C = np.zeros(S_C.shape)
-    DS_C[0, :] = S_C[0, :]
-    DS_C[1::, :] = np.diff(S_C, axis=0)
-    
+    survival = dmfa_configuration.survival
+    inflow = survival.inflow(stock)
+    if np.any(inflow < 0):
+        # the negative inflow correction needs the year-by-year stock driven model
+        dsm = DynamicStockModel(
+            t=np.arange(dmfa_configuration.Nt),
+            lt=dmfa_configuration.lt,
+            s=stock,
+            sf=dmfa_configuration.sf
+        )
+        S_C, O_C, inflow = dsm.compute_stock_driven_model_vectorized(NegativeInflowCorrect=True)
+        total_stock = np.einsum('tc->t', S_C)
+        return UsePhase(
+            inflow=inflow,
+            stock=total_stock,
+            stock_change=np.diff(total_stock, prepend=0),
+            outflow=np.einsum('tc->t', O_C),
+            stock_by_cohort_model=lambda: S_C,
+            outflow_by_cohort_model=lambda: O_C,
+        )
+
+    total_stock = survival.stock(inflow)
     return UsePhase(
-        stock_by_cohort=S_C,
-        stock_change_by_cohort=DS_C,
-        outflow_by_cohort=O_C,
         inflow=inflow,
-        stock=np.einsum('tc->t', S_C),
-        stock_change=np.einsum('tc->t', DS_C),
-        outflow=np.einsum('tc->t', O_C),
+        stock=total_stock,
+        stock_change=np.diff(total_stock, prepend=0),
+        outflow=survival.outflow(inflow),
+        stock_by_cohort_model=lambda: survival.stock_by_cohort(inflow),
+        outflow_by_cohort_model=lambda: survival.outflow_by_cohort(inflow),
     )
 
 
-def calculate_use_phase_inflowdriven(inflow: np.ndarray, dmfa_configuration: DMFAConfiguration) -> UsePhase:
+@profiled('use phase (inflow driven)')
+def calculate_use_phase_inflowdriven(inflow: np.ndarray, dmfa_configuration: DMFAConfiguration,
+                                     convolution_method: str = 'direct') -> UsePhase:
+    """ convolution_method: 'direct', 'fft' or 'auto' (see scipy.signal.convolve) computes the stock and
+        outflow totals as convolutions of the inflow with the survival and pdf curves. The by cohort values
+        are then only computed when accessed. None uses the DynamicStockModel, which builds them directly.
+        'direct' gives the sums of the DynamicStockModel up to rounding. 'fft' (and 'auto', which picks it
+        for long series) is faster for long series but adds FFT round-off, e.g. small negative stocks
+        where the inflow is zero. """
+
+    if convolution_method is not None:
+        survival = dmfa_configuration.survival
+        total_stock = survival.stock(inflow, method=convolution_method)
+        return UsePhase(
+            inflow=inflow,
+            stock=total_stock,
+            stock_change=np.diff(total_stock, prepend=0),
+            outflow=survival.outflow(inflow, method=convolution_method),
+            stock_by_cohort_model=lambda: survival.stock_by_cohort(inflow),
+            outflow_by_cohort_model=lambda: survival.outflow_by_cohort(inflow),
+        )
 
     dsm = DynamicStockModel(
         t=np.arange(dmfa_configuration.Nt),
@@ -48,21 +139,82 @@ def calculate_use_phase_inflowdriven(inflow: np.ndarray, dmfa_configuration: DMF
         i=inflow,
         sf=dmfa_configuration.sf,
     )
-    
+
     S_C = dsm.compute_s_c_inflow_driven()
     O_C = dsm.compute_o_c_from_s_c()
-    S = dsm.compute_stock_total()
-    DS = dsm.compute_stock_change()
-    DS_C = np.zeros(S_C.shape)
-    DS_C[0, :] = S_C[0, :]
-    DS_C[1::, :] = np.diff(S_C, axis=0)
-    
+    total_stock = np.einsum('tc->t', S_C)
+
     return UsePhase(
-        stock_by_cohort=S_C,
-        stock_change_by_cohort=DS_C,
-        outflow_by_cohort=O_C,
         inflow=inflow,
-        stock=np.einsum('tc->t', S_C),
-        stock_change=np.einsum('tc->t', DS_C),
+        stock=total_stock,
+        stock_change=np.diff(total_stock, prepend=0),
         outflow=np.einsum('tc->t', O_C),
-    )
\ No newline at end of file
+        stock_by_cohort_model=lambda: S_C,
+        outflow_by_cohort_model=lambda: O_C,
+    )
+
+
+@profiled('use phase (stock driven)')
+def calculate_use_phase_stockdriven_stacked(stock: np.ndarray, dmfa_configuration: DMFAConfiguration) -> UsePhase:
+    """ Stock-driven use phase for stacked stocks with shape (n_scenarios, Nt).
+        All scenarios share the survival function, so the inflows of all scenarios follow from one
+        convolution with its inverse. Scenarios that need the negative inflow correction are solved one by one. """
+
+    survival = dmfa_configuration.survival
+    inflow = survival.inflow(stock)
+    total_stock = survival.stock(inflow)
+    total_outflow = survival.outflow(inflow)
+
+    corrected_usephases = {
+        s: calculate_use_phase_stockdriven(stock[s], dmfa_configuration)
+        for s in np.flatnonzero(np.any(inflow < 0, axis=1))
+    }
+    for s, usephase in corrected_usephases.items():
+        inflow[s], total_stock[s], total_outflow[s] = usephase.inflow, usephase.stock, usephase.outflow
+
+    def stock_by_cohort_model() -> np.ndarray:
+        S_C = survival.stock_by_cohort(inflow)
+        for s, usephase in corrected_usephases.items():
+            S_C[s] = usephase.stock_by_cohort
+        return S_C
+
+    def outflow_by_cohort_model() -> np.ndarray:
+        O_C = survival.outflow_by_cohort(inflow)
+        for s, usephase in corrected_usephases.items():
+            O_C[s] = usephase.outflow_by_cohort
+        return O_C
+
+    def scenario_by_cohort_models(s: int) -> tuple[Callable, Callable]:
+        if s in corrected_usephases:
+            return corrected_usephases[s].stock_by_cohort_model, corrected_usephases[s].outflow_by_cohort_model
+        return partial(survival.stock_by_cohort, inflow[s].copy()), partial(survival.outflow_by_cohort, inflow[s].copy())
+
+    return UsePhase(
+        inflow=inflow,
+        stock=total_stock,
+        stock_change=np.diff(total_stock, axis=-1, prepend=0),
+        outflow=total_outflow,
+        stock_by_cohort_model=stock_by_cohort_model,
+        outflow_by_cohort_model=outflow_by_cohort_model,
+        scenario_by_cohort_models=scenario_by_cohort_models,
+    )
+
+
+@profiled('use phase (inflow driven)')
+def calculate_use_phase_inflowdriven_stacked(inflow: np.ndarray, dmfa_configuration: DMFAConfiguration,
+                                             convolution_method: str = 'direct') -> UsePhase:
+    """ Inflow-driven use phase for stacked inflows with shape (n_scenarios, Nt).
+        convolution_method: 'direct', 'fft' or 'auto', see calculate_use_phase_inflowdriven """
+
+    survival = dmfa_configuration.survival
+    total_stock = survival.stock(inflow, method=convolution_method)
+    return UsePhase(
+        inflow=inflow,
+        stock=total_stock,
+        stock_change=np.diff(total_stock, axis=-1, prepend=0),
+        outflow=survival.outflow(inflow, method=convolution_method),
+        stock_by_cohort_model=lambda: survival.stock_by_cohort(inflow),
+        outflow_by_cohort_model=lambda: survival.outflow_by_cohort(inflow),
+        scenario_by_cohort_models=lambda s: (
+            partial(survival.stock_by_cohort, inflow[s].copy()), partial(survival.outflow_by_cohort, inflow[s].copy())),
+    )
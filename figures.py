@@ -4,10 +4,19 @@ import pandas as pd
 import numpy as np
 import streamlit as st
 from dmfa.layered_dmfa import LayeredDMFA
-from dmfa.impacts import calculate_impacts
+from dmfa.results_frame import create_impacts_frame, create_recycled_inflow_frame, create_usephase_frame, select_rows
+from dmfa.impacts import ImpactsTable, calculate_impacts_table
+from dmfa.monte_carlo import Uncertainty, calculate_monte_carlo
+from dmfa.sensitivity import SENSITIVITY_OUTPUTS, calculate_sobol_indices
+from dmfa.incremental import fingerprint_fields
+from dmfa.result_cache import LRUCache
 from copy import deepcopy 
 import io
 
+# percentile bands by (scenario fingerprint, n_samples, relative_sd, seed), shared by all streamlit sessions and
+# reruns, so widget changes only redraw the bands of a previous calculation
+MONTE_CARLO_BANDS = LRUCache(maxsize=16)
+
 def download_df_button(df: pd.DataFrame, filename: str):
     
     buffer = io.BytesIO()
@@ -38,6 +47,10 @@ def select_scenario(layered_dmfas: list[LayeredDMFA], title: str) -> list[Layere
     return selected_layered_dmfas
     
 
+def get_scenario_numbers(layered_dmfas: list[LayeredDMFA]) -> list[int]:
+    return [layered_dmfa.scenario_input.scenario_number for layered_dmfa in layered_dmfas]
+
+
 def download_timeseries_button(df: pd.DataFrame, filename: str):
     """ assumes year name vlaue"""
     if df.empty: return 
@@ -60,69 +73,18 @@ def plot_usephase_inflow_and_outflow(layered_dmfas: list[LayeredDMFA]):
         default=['decaBDE', 'TPP'],
     )
     
-    time_list = layered_dmfas[0].plastic.dmfa_configruation.time_list
-    
-    rows_inflows_outflows = []
-    rows_stocks = []
-    for layered_dmfa in selected_layered_dmfas:
-        name = f'scenario={layered_dmfa.scenario_input.scenario_number}'
-        for i, year in enumerate(time_list):
-            if 'plastic' in selected_dmfas:
-                rows_inflows_outflows.append({
-                    'year': year,
-                    'name': name+'_inflow_plastic',
-                    'value': layered_dmfa.plastic.usephase.inflow[i]
-                })
-                rows_inflows_outflows.append({
-                    'year': year,
-                    'name': name+'_outflow_plastic',
-                    'value': layered_dmfa.plastic.usephase.outflow[i]
-                })
-                rows_stocks.append({
-                     'year': year,
-                    'name': name+'_stock_plastic',
-                    'value': layered_dmfa.plastic.usephase.stock[i]
-                })
-            if 'decaBDE' in selected_dmfas:
-                rows_inflows_outflows.append({
-                    'year': year,
-                    'name': name+'_inflow_decaBDE',
-                    'value': layered_dmfa.decaBDE.usephase.inflow[i]
-                })
-                rows_inflows_outflows.append({
-                    'year': year,
-                    'name': name+'_outflow_decaBDE',
-                    'value': layered_dmfa.decaBDE.usephase.outflow[i]
-                })  
-                rows_stocks.append({
-                     'year': year,
-                    'name': name+'_stock_decaBDE',
-                    'value': layered_dmfa.decaBDE.usephase.stock[i]
-                })
-            if 'TPP' in selected_dmfas:
-                rows_inflows_outflows.append({
-                    'year': year,
-                    'name': name+'_inflow_TPP',
-                    'value': layered_dmfa.TPP.usephase.inflow[i]
-                })
-                rows_inflows_outflows.append({
-                    'year': year,
-                    'name': name+'_outflow_TPP',
-                    'value': layered_dmfa.TPP.usephase.outflow[i]
-                })
-                
-                rows_stocks.append({
-                     'year': year,
-                    'name': name+'_stock_TPP',
-                    'value': layered_dmfa.TPP.usephase.stock[i]
-                })
+    df_usephase = select_rows(
+        create_usephase_frame(layered_dmfas),
+        scenario=get_scenario_numbers(selected_layered_dmfas),
+        layer=selected_dmfas,
+    )
             
-    df_plot = pd.DataFrame(rows_inflows_outflows)
+    df_plot = select_rows(df_usephase, quantity=['inflow', 'outflow'])
     fig = px.line(df_plot, x="year", y="value", color="name")
     st.plotly_chart(fig)
     download_timeseries_button(df_plot, "inflow outflow timeseries")
     
-    df_plot = pd.DataFrame(rows_stocks)
+    df_plot = select_rows(df_usephase, quantity=['stock'])
     fig = px.line(df_plot, x="year", y="value", color="name")
     st.plotly_chart(fig)
     download_timeseries_button(df_plot, "stocks timeseries")
@@ -152,11 +114,11 @@ def plot_flows_and_stocks(layered_dmfas: list[LayeredDMFA]):
             for selected_dmfa in selected_dmfas:
                 flow: Flow
                 if selected_dmfa == 'plastic':
-                    flow: Flow = layered_dmfa.plastic.__dict__[flow_name]
+                    flow: Flow = layered_dmfa.plastic.get_flow_or_stock(flow_name)
                 elif selected_dmfa == 'decaBDE':
-                    flow: Flow = layered_dmfa.decaBDE.__dict__[flow_name]
+                    flow: Flow = layered_dmfa.decaBDE.get_flow_or_stock(flow_name)
                 elif selected_dmfa == 'TPP':
-                    flow: Flow = layered_dmfa.TPP.__dict__[flow_name]
+                    flow: Flow = layered_dmfa.TPP.get_flow_or_stock(flow_name)
                 else: 
                     continue
                 flow = deepcopy(flow)
@@ -179,144 +141,92 @@ def plot_flows_and_stocks(layered_dmfas: list[LayeredDMFA]):
     st.plotly_chart(fig)
     download_timeseries_button(df_plot, "flows timeseries")
 
-def plot_impacts(layered_dmfas: list[LayeredDMFA]) -> None:
+def plot_impacts(layered_dmfas: list[LayeredDMFA], impacts_table: ImpactsTable = None) -> None:
+    """ impacts_table: impacts of the layered_dmfas, calculated when not given """
     st.write("health: eat your veggies")
     selected_layered_dmfas = select_scenario(layered_dmfas, "select that scenario baby")
+    if not selected_layered_dmfas:
+        st.write("No scenario selected")
+        return
+    impacts_table = (impacts_table or calculate_impacts_table(layered_dmfas)).select(
+        get_scenario_numbers(selected_layered_dmfas))
     
-    time_list = layered_dmfas[0].plastic.dmfa_configruation.time_list
-
-    rows_midpoint = []
-    rows_endpoint = []
-    rows_bars_human_health_without_global = []
-    rows_bars_human_health_split = []
-    rows_bars_ecosystem_health_without_global = []
-    rows_bars_ecosystem_health_split = []
-    rows_global_warming = []
-    
-    years = range(1980, 2050)
+    # the sums run from the start year up to (excluding) the stop year, so the last stop year is after the time axis
+    years = impacts_table.time_list.tolist()
     health_start_year = st.selectbox(
         "Select health barplot start year",
         years,
         index=0,
     )
     health_stop_year = st.selectbox(
-        "Select health barplot start year",
-        years,
+        "Select health barplot stop year",
+        years[1:] + [years[-1] + 1],
         index=len(years)-1,
     )
-    health_start_year_index = health_start_year-years[0]
-    health_stop_year_index = health_stop_year-years[0]
+    df_impacts = create_impacts_frame(selected_layered_dmfas, impacts_table)
     
-    for layered_dmfa in selected_layered_dmfas: 
-        impact = calculate_impacts(layered_dmfa)
-        
-        name = f'scenario={layered_dmfa.scenario_input.scenario_number}'
-        
-        midpoint_timeseries_dict = {
-            name+'_human_carcinogenic': impact.midpoint_impact.human_carcinogenic_toxicity,
-            name+'_human_non_carcinogenic': impact.midpoint_impact.human_non_carcinogenic_toxicity,
-            name+'_freshwata': impact.midpoint_impact.freshwater_ecotoxicity,
-            name+'_marine': impact.midpoint_impact.marine_ecotoxicity,
-            name+'_terrestrial': impact.midpoint_impact.terrestrial_ecotoxicity,
-        }
-        
-        endpoint_timeseries_dict = {
-            name+'_human_health': impact.endpoint_impact.human_health,
-            name+'_ecosystem_health': impact.endpoint_impact.ecosystem_health,
-        }
-        
-        rows_bars_human_health_without_global.append({
-            'name': name,
-            'value': sum(impact.endpoint_impact.human_health_without_global_warming[health_start_year_index:health_stop_year_index]),
-        })
-        rows_bars_human_health_split.append({
-            'name': name,
-            'value': sum(impact.endpoint_impact.human_health_without_global_warming[health_start_year_index:health_stop_year_index]),
-            'color': 'without global warming'
-        })
-        rows_bars_human_health_split.append({
-            'name': name,
-            'value': sum(impact.endpoint_impact.human_health_only_global_warming[health_start_year_index:health_stop_year_index]),
-            'color': 'only global warming'
-        })
-        
-        rows_bars_ecosystem_health_without_global.append({
-            'name': name,
-            'value': sum(impact.endpoint_impact.ecosystem_health_without_global_warming[health_start_year_index:health_stop_year_index]),
-        })
-        rows_bars_ecosystem_health_split.append({
-            'name': name,
-            'value': sum(impact.endpoint_impact.ecosystem_health_without_global_warming[health_start_year_index:health_stop_year_index]),
-            'color': "without global warming"
-        })
-        rows_bars_ecosystem_health_split.append({
-            'name': name,
-            'value': sum(impact.endpoint_impact.ecosystem_health_only_global_warming[health_start_year_index:health_stop_year_index]),
-            'color': "only global warming"
-        })
-            
-        for name, timeseries in midpoint_timeseries_dict.items():
-            for i, year in enumerate(time_list):
-                rows_midpoint.append({
-                    'year': year,
-                    'name': name,
-                    'value': timeseries[i],
-                })
-        
-        for i, year in enumerate(time_list):
-            rows_global_warming.append({
-                'name': name+"_gloabal_warming",
-                'year': year, 
-                'value': impact.midpoint_impact.CO2_global_warming[i]
-            })
-            
-        for name, timeseries in endpoint_timeseries_dict.items():
-            for i, year in enumerate(time_list):
-                rows_endpoint.append({
-                    'year': year,
-                    'name': name,
-                    'value': timeseries[i],
-                })
+    # differences of the cumulative sums of the impacts, no sum over the years on a rerun
+    df_sums = impacts_table.window_sums(health_start_year, health_stop_year)
+    names = [f'scenario={scenario}' for scenario in df_sums.index]
+    
+    df_bars_human_health_without_global = pd.DataFrame({
+        'name': names,
+        'value': df_sums['human_health_without_global_warming'].to_numpy(),
+    })
+    df_bars_human_health_split = pd.DataFrame({
+        'name': np.repeat(names, 2),
+        'value': df_sums[['human_health_without_global_warming', 'human_health_only_global_warming']].to_numpy().ravel(),
+        'color': np.tile(['without global warming', 'only global warming'], len(names)),
+    })
+    df_bars_ecosystem_health_without_global = pd.DataFrame({
+        'name': names,
+        'value': df_sums['ecosystem_health_without_global_warming'].to_numpy(),
+    })
+    df_bars_ecosystem_health_split = pd.DataFrame({
+        'name': np.repeat(names, 2),
+        'value': df_sums[['ecosystem_health_without_global_warming', 'ecosystem_health_only_global_warming']].to_numpy().ravel(),
+        'color': np.tile(['without global warming', 'only global warming'], len(names)),
+    })
 
     st.write('midpoint impacts')
-    df_plot = pd.DataFrame(rows_midpoint)
+    df_plot = select_rows(df_impacts, kind=['midpoint'])
     fig = px.line(df_plot, x='year', y='value', color='name')
     st.plotly_chart(fig)
     download_timeseries_button(df_plot, "midpoint timeseries")
     
     st.write('global warming')
-    df_plot = pd.DataFrame(rows_global_warming)
+    df_plot = select_rows(df_impacts, kind=['global warming'])
     fig = px.line(df_plot, x='year', y='value', color='name')
     st.plotly_chart(fig)
     download_timeseries_button(df_plot, "CO2 global warming")
     
     st.write('endpoints impacts')
-    df_plot = pd.DataFrame(rows_endpoint)
+    df_plot = select_rows(df_impacts, kind=['endpoint'])
     fig = px.line(df_plot, x='year', y='value', color='name')
     st.plotly_chart(fig)
     download_timeseries_button(df_plot, "endpoint timeseries")
     
     
     st.write('human health sums without global')
-    df_plot = pd.DataFrame(rows_bars_human_health_without_global)
+    df_plot = df_bars_human_health_without_global
     fig = px.bar(df_plot, x='name', y='value')
     st.plotly_chart(fig)
     download_barplot_button(df_plot, "human health bar without global")
     
     st.write('human health sums split')
-    df_plot = pd.DataFrame(rows_bars_human_health_split)
+    df_plot = df_bars_human_health_split
     fig = px.bar(df_plot, x='name', y='value', color="color")
     st.plotly_chart(fig)
     download_barplot_button(df_plot, "human health barplot split")
     
     st.write('ecosystem health sums without global')
-    df_plot = pd.DataFrame(rows_bars_ecosystem_health_without_global)
+    df_plot = df_bars_ecosystem_health_without_global
     fig = px.bar(df_plot, x='name', y='value')
     st.plotly_chart(fig)
     download_barplot_button(df_plot, "ecosystemhealthbarwithoutglobal")
     
     st.write('ecosystem health sums split')
-    df_plot = pd.DataFrame(rows_bars_ecosystem_health_split)
+    df_plot = df_bars_ecosystem_health_split
     fig = px.bar(df_plot, x='name', y='value', color="color")
     st.plotly_chart(fig)
     download_barplot_button(df_plot, "ecosystem health barplot split")
@@ -331,47 +241,72 @@ def plot_inflows(layered_dmfas: list[LayeredDMFA]) -> None:
         default=['plastic', 'decaBDE', 'TPP'],
     )
     
-    time_list = layered_dmfas[0].plastic.dmfa_configruation.time_list
+    df_plot = select_rows(
+        create_recycled_inflow_frame(layered_dmfas),
+        scenario=get_scenario_numbers(selected_layered_dmfas),
+        layer=selected_dmfas,
+    )
+    fig = px.line(df_plot, x='year', y='value', color='name')
+    st.plotly_chart(fig)
 
-    rows = []
-    for layered_dmfa in selected_layered_dmfas:
-        
-        name = f'{layered_dmfa.scenario_input.scenario_number}'
-        for i, year in enumerate(time_list):
-            if 'plastic' in selected_dmfas:
-                inflow = layered_dmfa.plastic.usephase.inflow[i]
-                inflow_recycled = (
-                    layered_dmfa.plastic.F_2_1.values[i] + 
-                    layered_dmfa.plastic.F_4_1.values[i] )
-                percentage = 100 * inflow_recycled / inflow if inflow != 0 else 0
-                rows.append({
-                    'value': percentage,
-                    'year': year,
-                    'name': name+'_percentage_recycled_inflow_plastic'
-                })
-            if 'decaBDE' in selected_dmfas:
-                inflow = layered_dmfa.decaBDE.usephase.inflow[i]
-                inflow_recycled = (
-                    layered_dmfa.decaBDE.F_2_1.values[i] + 
-                    layered_dmfa.decaBDE.F_4_1.values[i] )
-                percentage = 100 * inflow_recycled / inflow if inflow != 0 else 0 
-                rows.append({
-                    'value': percentage,
-                    'year': year,
-                    'name': name+'_percentage_recycled_inflow_decaBDE'
-                })
-            if 'TPP' in selected_dmfas:
-                inflow = layered_dmfa.TPP.usephase.inflow[i]
-                inflow_recycled = (
-                    layered_dmfa.TPP.F_2_1.values[i] + 
-                    layered_dmfa.TPP.F_4_1.values[i] )
-                percentage = 100 * inflow_recycled / inflow if inflow != 0 else 0 
-                rows.append({
-                    'value': percentage,
-                    'year': year,
-                    'name': name+'_percentage_recycled_inflow_TPP'
-                })
+def plot_monte_carlo(layered_dmfas: list[LayeredDMFA]) -> None:
+    st.write("Uncertainty: percentile bands over sampled transfer coefficients, inflow shares, emission factors and lifespans")
+    scenario_numbers = get_scenario_numbers(layered_dmfas)
+    scenario_number = st.selectbox('Select the scenario for the uncertainty', options=scenario_numbers)
+    n_samples = st.number_input('Number of samples', min_value=10, max_value=20000, value=1000, step=100)
+    relative_sd = st.slider('Relative standard deviation of the inputs', min_value=0.0, max_value=1.0, value=0.1)
+    seed = 0
+
+    # streamlit runs the expander even when it is collapsed, so the samples are only solved on request
+    scenario_input = layered_dmfas[scenario_numbers.index(scenario_number)].scenario_input
+    key = (tuple(sorted(fingerprint_fields(scenario_input).items())), int(n_samples), relative_sd, seed)
+    cached = MONTE_CARLO_BANDS.get_many([key])
+    if key in cached:
+        df_bands = cached[key]
+    elif st.button('Calculate percentile bands'):
+        result = calculate_monte_carlo(
+            scenario_input,
+            n_samples=int(n_samples),
+            uncertainty=Uncertainty(
+                transfer_coefficients=relative_sd, inflow_shares=relative_sd,
+                emission_factors=relative_sd, lifespan=relative_sd),
+            seed=seed,
+        )
+        df_bands = result.to_frame()
+        df_bands['series'] = df_bands['name'].astype(str) + '_' + df_bands['layer'].astype(str)
+        MONTE_CARLO_BANDS.put_many({key: df_bands})
+    else:
+        return
     
-    df_plot = pd.DataFrame(rows)
-    fig = px.line(df_plot, x='year', y='value', color='name')
-    st.plotly_chart(fig)    
\ No newline at end of file
+    selected_series = st.multiselect(
+        'Select flows, stocks and impacts',
+        options=list(dict.fromkeys(df_bands['series'])),
+        default=['human_health_impacts', 'ecosystem_health_impacts'],
+    )
+    df_plot = df_bands[df_bands['series'].isin(selected_series)]
+    fig = px.line(df_plot, x='year', y='value', color='series', line_dash='percentile')
+    st.plotly_chart(fig)
+    download_df_button(df_plot, "uncertainty percentile bands")
+
+def plot_sensitivity(layered_dmfas: list[LayeredDMFA]) -> None:
+    st.write("Sensitivity: Sobol indices of the summed endpoint impacts")
+    scenario_numbers = get_scenario_numbers(layered_dmfas)
+    scenario_number = st.selectbox('Select the scenario for the sensitivity analysis', options=scenario_numbers)
+    n_base_samples = st.selectbox('Number of base samples', options=[256, 512, 1024, 2048, 4096], index=2)
+    relative_range = st.slider('Relative range of the parameters', min_value=0.01, max_value=0.5, value=0.1)
+    output = st.selectbox('Select the impact', options=SENSITIVITY_OUTPUTS)
+    if not st.button('Calculate sensitivity indices'):
+        return 
+    
+    scenario_input = layered_dmfas[scenario_numbers.index(scenario_number)].scenario_input
+    result = calculate_sobol_indices(
+        scenario_input, 
+        n_base_samples=n_base_samples, 
+        relative_range=relative_range, 
+        seed=0,
+    )
+    df_indices = result.to_frame()
+    df_plot = df_indices[df_indices['output'] == output].sort_values('total_order', ascending=False)
+    fig = px.bar(df_plot, x='parameter', y=['first_order', 'total_order'], barmode='group')
+    st.plotly_chart(fig)
+    download_df_button(df_indices, "sobol indices")
@@ -1,10 +1,20 @@
+import json
 import streamlit as st
-from dmfa.scenario_input import import_scenarios
+from dmfa.scenario_cache import import_scenarios_cached
+from dmfa.scenario_input import ScenarioInput, import_scenarios as import_scenarios_uncached
 from dmfa.layered_dmfa import LayeredDMFA, calculate_layered_DMFA
-from figures import plot_flows_and_stocks, plot_impacts, plot_inflows, plot_usephase_inflow_and_outflow
+from dmfa.impacts import calculate_impacts_table
+from dmfa.profiling import Profiler
+from dmfa.incremental import INCREMENTAL_LAYERED_DMFA, import_scenarios_incremental
+from figures import plot_flows_and_stocks, plot_impacts, plot_inflows, plot_monte_carlo, plot_sensitivity, plot_usephase_inflow_and_outflow
 import streamlit as st
 st.set_page_config(page_title='Thesis', layout='wide')
 
+@st.cache
+def import_scenarios(excel_path) -> list[ScenarioInput]:
+    # an edited workbook only parses the sheets that changed
+    return import_scenarios_cached(excel_path, import_function=import_scenarios_incremental)
+
 def show_comparison():
 
     if not layered_dmfas:
@@ -12,7 +22,9 @@ def show_comparison():
         return 
         
     with st.expander("Impacts"):
-        plot_impacts(layered_dmfas)
+        # cached with its cumulative sums, changing the year window does not recompute the impacts
+        scenario_inputs = [layered_dmfa.scenario_input for layered_dmfa in layered_dmfas]
+        plot_impacts(layered_dmfas, INCREMENTAL_LAYERED_DMFA.calculate_impacts_table(scenario_inputs))
     
     with st.expander("Usephase"):
         plot_usephase_inflow_and_outflow(layered_dmfas)
@@ -20,6 +32,35 @@ def show_comparison():
     with st.expander("Flows and stocks"):
         plot_flows_and_stocks(layered_dmfas)
 
+    with st.expander("Uncertainty"):
+        plot_monte_carlo(layered_dmfas)
+
+    with st.expander("Sensitivity"):
+        plot_sensitivity(layered_dmfas)
+
+def show_profiling(uploaded_file):
+    """ Profiles the import, layers and impacts of the uploaded workbook, bypassing the scenario and result caches """
+    if uploaded_file is None:
+        return
+    with st.expander("Profiling"):
+        trace_memory = st.checkbox("Trace memory (slower)", value=True)
+        if not st.button("Profile an uncached run"):
+            return
+        with Profiler(trace_memory=trace_memory) as profiler:
+            uploaded_file.seek(0)
+            scenario_inputs = import_scenarios_uncached(uploaded_file)
+            calculate_impacts_table([calculate_layered_DMFA(scenario_input) for scenario_input in scenario_inputs])
+        st.write("stages, slowest first")
+        st.dataframe(profiler.summary())
+        st.write("every stage run")
+        st.dataframe(profiler.to_frame())
+        st.download_button(
+            label="Download profile",
+            data=json.dumps(profiler.to_dict(), indent=2),
+            file_name="profile.json",
+            mime="application/json",
+        )
+
 def show_sidebar():
     uploaded_file = st.sidebar.file_uploader("Upload", type=['xlsx', 'xls'])
 
@@ -32,10 +73,11 @@ def show_sidebar():
             f"✔️ number of scenarios found: {len(scenario_inputs)}")
 
         layered_dmfas.clear()  # reset
-        for scenario_input in scenario_inputs:
-            layered_dmfa = calculate_layered_DMFA(scenario_input)
-            layered_dmfas.append(layered_dmfa)
+        # only the layers whose inputs changed since a previous upload are solved again
+        layered_dmfas.extend(INCREMENTAL_LAYERED_DMFA.calculate(scenario_inputs))
+    return uploaded_file
 
 layered_dmfas: list[LayeredDMFA] = []
-show_sidebar()
-show_comparison()
\ No newline at end of file
+uploaded_file = show_sidebar()
+show_comparison()
+show_profiling(uploaded_file)
\ No newline at end of file
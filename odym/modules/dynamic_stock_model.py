@@ -24,7 +24,9 @@ Repository for this class, documentation, and tutorials: https://github.com/IndE
 """
 
 import numpy as np
+import scipy.linalg
 import scipy.stats
+from odym.modules import dynamic_stock_model_kernels as dsm_kernels
 
 def __version__():
     """Return a brief version string and statement for this class."""
@@ -212,55 +214,103 @@ class DynamicStockModel(object):
         The method compute outflow_sf returns an array year-by-cohort of the surviving fraction of a flow added to stock in year m (aka cohort m) in in year n. This value equals sf(n,m).
         This is the only method for the inflow-driven model where the lifetime distribution directly enters the computation. All other stock variables are determined by mass balance.
         The shape of the output sf array is NoofYears * NoofYears, and the meaning is years by age-cohorts.
+        The lifetime parameters ('Mean', 'StdDev', 'Shape', 'Scale') can change over time: they are given either for each age-cohort or as a single value for all age-cohorts.
+        The lifetime distribution is evaluated once, on the grid of ages m-n of all age-cohorts n <= m, with the parameters of each age-cohort.
         The method does nothing if the sf alreay exists. For example, sf could be assigned to the dynamic stock model from an exogenous computation to save time.
         """
         if self.sf is None:
             self.sf = np.zeros((len(self.t), len(self.t)))
-            # Perform specific computations and checks for each lifetime distribution:
-
-            if self.lt['Type'] == 'Fixed': # fixed lifetime, age-cohort leaves the stock in the model year when the age specified as 'Mean' is reached.
-                for m in range(0, len(self.t)):  # cohort index
-                    self.sf[m::,m] = np.multiply(1, (np.arange(0,len(self.t)-m) < self.lt['Mean'][m])) # converts bool to 0/1
-                # Example: if Lt is 3.5 years fixed, product will still be there after 0, 1, 2, and 3 years, gone after 4 years.
-
-            if self.lt['Type'] == 'Normal': # normally distributed lifetime with mean and standard deviation. Watch out for nonzero values 
-                # for negative ages, no correction or truncation done here. Cf. note below.
-                for m in range(0, len(self.t)):  # cohort index
-                    if self.lt['Mean'][m] != 0:  # For products with lifetime of 0, sf == 0
-                        self.sf[m::,m] = scipy.stats.norm.sf(np.arange(0,len(self.t)-m), loc=self.lt['Mean'][m], scale=self.lt['StdDev'][m])
-                        # NOTE: As normal distributions have nonzero pdf for negative ages, which are physically impossible, 
-                        # these outflow contributions can either be ignored (violates the mass balance) or
-                        # allocated to the zeroth year of residence, the latter being implemented in the method compute compute_o_c_from_s_c.
-                        # As alternative, use lognormal or folded normal distribution options.
-                        
-            if self.lt['Type'] == 'FoldedNormal': # Folded normal distribution, cf. https://en.wikipedia.org/wiki/Folded_normal_distribution
-                for m in range(0, len(self.t)):  # cohort index
-                    if self.lt['Mean'][m] != 0:  # For products with lifetime of 0, sf == 0
-                        self.sf[m::,m] = scipy.stats.foldnorm.sf(np.arange(0,len(self.t)-m), self.lt['Mean'][m]/self.lt['StdDev'][m], 0, scale=self.lt['StdDev'][m])
-                        # NOTE: call this option with the parameters of the normal distribution mu and sigma of curve BEFORE folding,
-                        # curve after folding will have different mu and sigma.
-                        
-            if self.lt['Type'] == 'LogNormal': # lognormal distribution
-                # Here, the mean and stddev of the lognormal curve, 
-                # not those of the underlying normal distribution, need to be specified! conversion of parameters done here:
-                for m in range(0, len(self.t)):  # cohort index
-                    if self.lt['Mean'][m] != 0:  # For products with lifetime of 0, sf == 0
-                        # calculate parameter mu    of underlying normal distribution:
-                        LT_LN = np.log(self.lt['Mean'][m] / np.sqrt(1 + self.lt['Mean'][m] * self.lt['Mean'][m] / (self.lt['StdDev'][m] * self.lt['StdDev'][m]))) 
-                        # calculate parameter sigma of underlying normal distribution:
-                        SG_LN = np.sqrt(np.log(1 + self.lt['Mean'][m] * self.lt['Mean'][m] / (self.lt['StdDev'][m] * self.lt['StdDev'][m])))
-                        # compute survial function
-                        self.sf[m::,m] = scipy.stats.lognorm.sf(np.arange(0,len(self.t)-m), s=SG_LN, loc = 0, scale=np.exp(LT_LN)) 
-                        # values chosen according to description on
-                        # https://docs.scipy.org/doc/scipy-0.13.0/reference/generated/scipy.stats.lognorm.html
-                        # Same result as EXCEL function "=LOGNORM.VERT(x;LT_LN;SG_LN;TRUE)"
-                        
-            if self.lt['Type'] == 'Weibull': # Weibull distribution with standard definition of scale and shape parameters
-                for m in range(0, len(self.t)):  # cohort index
-                    if self.lt['Shape'][m] != 0:  # For products with lifetime of 0, sf == 0
-                        self.sf[m::,m] = scipy.stats.weibull_min.sf(np.arange(0,len(self.t)-m), c=self.lt['Shape'][m], loc = 0, scale=self.lt['Scale'][m])
+            year, cohort = np.tril_indices(len(self.t)) # only age-cohorts n <= m are present in year m
+            self.sf[year, cohort] = self.compute_sf_by_age(year - cohort, cohort)
+            return self.sf
+        else:
+            # sf already exists
+            return self.sf
+        
+    def lifetime_parameter(self, name, m):
+        """
+        Parameter of the lifetime distribution for age-cohort m, or for an array of age-cohorts.
+        A parameter given as a single value is the same for all age-cohorts.
+        """
+        values = np.atleast_1d(np.asarray(self.lt[name], dtype=float))
+        if len(values) == 1:
+            return values[0]
+        return values[m]
 
+    def compute_sf_by_age(self, age, m):
+        """
+        Survival curve of age-cohort m: the share of the inflow of cohort m still present at the given ages (years after inflow).
+        m can also be an array of age-cohorts of the same shape as age, each age is then evaluated with the lifetime parameters of its age-cohort.
+        This is where the type of the lifetime distribution enters, see compute_sf.
+        """
+        age = np.asarray(age)
+        shape = np.broadcast(age, m).shape
+        sf_age = np.zeros(shape)
+
+        def evaluate(present, distribution_sf, *parameters):
+            """ Evaluates the survival function for the ages of the age-cohorts with a lifetime > 0, for the others sf == 0 """
+            present = np.broadcast_to(present, shape)
+            arguments = [np.broadcast_to(argument, shape)[present] for argument in (age,) + parameters]
+            sf_age[present] = distribution_sf(*arguments)
+            return sf_age
+
+        # Perform specific computations and checks for each lifetime distribution:
+
+        if self.lt['Type'] == 'Fixed': # fixed lifetime, age-cohort leaves the stock in the model year when the age specified as 'Mean' is reached.
+            sf_age = np.multiply(1, (age < self.lifetime_parameter('Mean', m))) # converts bool to 0/1
+            # Example: if Lt is 3.5 years fixed, product will still be there after 0, 1, 2, and 3 years, gone after 4 years.
+
+        if self.lt['Type'] == 'Normal': # normally distributed lifetime with mean and standard deviation. Watch out for nonzero values 
+            # for negative ages, no correction or truncation done here. Cf. note below.
+            Mean, StdDev = self.lifetime_parameter('Mean', m), self.lifetime_parameter('StdDev', m)
+            # For products with lifetime of 0, sf == 0
+            sf_age = evaluate(Mean != 0, lambda age, Mean, StdDev: scipy.stats.norm.sf(age, loc=Mean, scale=StdDev), Mean, StdDev)
+            # NOTE: As normal distributions have nonzero pdf for negative ages, which are physically impossible, 
+            # these outflow contributions can either be ignored (violates the mass balance) or
+            # allocated to the zeroth year of residence, the latter being implemented in the method compute compute_o_c_from_s_c.
+            # As alternative, use lognormal or folded normal distribution options.
+                
+        if self.lt['Type'] == 'FoldedNormal': # Folded normal distribution, cf. https://en.wikipedia.org/wiki/Folded_normal_distribution
+            Mean, StdDev = self.lifetime_parameter('Mean', m), self.lifetime_parameter('StdDev', m)
+            # For products with lifetime of 0, sf == 0
+            sf_age = evaluate(Mean != 0, lambda age, Mean, StdDev: scipy.stats.foldnorm.sf(age, Mean/StdDev, 0, scale=StdDev), Mean, StdDev)
+            # NOTE: call this option with the parameters of the normal distribution mu and sigma of curve BEFORE folding,
+            # curve after folding will have different mu and sigma.
+                
+        if self.lt['Type'] == 'LogNormal': # lognormal distribution
+            # Here, the mean and stddev of the lognormal curve, 
+            # not those of the underlying normal distribution, need to be specified! conversion of parameters done here:
+            def lognorm_sf(age, Mean, StdDev):
+                # calculate parameter mu    of underlying normal distribution:
+                LT_LN = np.log(Mean / np.sqrt(1 + Mean * Mean / (StdDev * StdDev))) 
+                # calculate parameter sigma of underlying normal distribution:
+                SG_LN = np.sqrt(np.log(1 + Mean * Mean / (StdDev * StdDev)))
+                # compute survial function
+                return scipy.stats.lognorm.sf(age, s=SG_LN, loc = 0, scale=np.exp(LT_LN)) 
+                # values chosen according to description on
+                # https://docs.scipy.org/doc/scipy-0.13.0/reference/generated/scipy.stats.lognorm.html
+                # Same result as EXCEL function "=LOGNORM.VERT(x;LT_LN;SG_LN;TRUE)"
+            Mean, StdDev = self.lifetime_parameter('Mean', m), self.lifetime_parameter('StdDev', m)
+            sf_age = evaluate(Mean != 0, lognorm_sf, Mean, StdDev) # For products with lifetime of 0, sf == 0
+                
+        if self.lt['Type'] == 'Weibull': # Weibull distribution with standard definition of scale and shape parameters
+            Shape, Scale = self.lifetime_parameter('Shape', m), self.lifetime_parameter('Scale', m)
+            # For products with lifetime of 0, sf == 0
+            sf_age = evaluate(Shape != 0, lambda age, Shape, Scale: scipy.stats.weibull_min.sf(age, c=Shape, loc = 0, scale=Scale), Shape, Scale)
+
+        return sf_age
 
+    def compute_sf_time_invariant(self):
+        """
+        Survival table for lifetime distributions that are the same for all age-cohorts, cf. compute_sf.
+        Then sf(m,n) only depends on the age m-n, so the lifetime distribution is evaluated once, for age-cohort 0,
+        and its survival curve is shifted down the diagonals for all other age-cohorts (Toeplitz layout).
+        Gives the same result as compute_sf with one distribution evaluation instead of one per age-cohort.
+        The method does nothing if the sf alreay exists.
+        """
+        if self.sf is None:
+            sf_age = self.compute_sf_by_age(np.arange(0,len(self.t)), 0)
+            self.sf = scipy.linalg.toeplitz(sf_age, np.zeros(len(self.t))) # sf[m,n] = sf_age[m-n] for m >= n, 0 otherwise
             return self.sf
         else:
             # sf already exists
@@ -380,6 +430,9 @@ class DynamicStockModel(object):
                     self.i[0] = self.s[0] / self.sf[0, 0]
                 self.s_c[:, 0] = self.i[0] * self.sf[:, 0] # Future decay of age-cohort of year 0.
                 self.o_c[0, 0] = self.i[0] - self.s_c[0, 0]
+                if dsm_kernels.USE_KERNELS: # same loop, compiled
+                    dsm_kernels.stock_driven(self.s, self.sf, self.s_c, self.o_c, self.i, NegativeInflowCorrect is True)
+                    return self.s_c, self.o_c, self.i
                 # all other years:
                 for m in range(1, len(self.t)):  # for all years m, starting in second year
                     # 1) Compute outflow from previous age-cohorts up to m-1
@@ -428,6 +481,91 @@ class DynamicStockModel(object):
             return None, None, None
         
 
+    def compute_stock_driven_model_vectorized(self, NegativeInflowCorrect = False):
+        """ Vectorized version of compute_stock_driven_model, with the same arguments and return values.
+            The total stock is s = sf @ i, with sf lower triangular, so the inflow follows from one triangular solve
+            and s_c and o_c are then built in bulk instead of row by row.
+            The triangular solve requires sf[m,m] != 0 for all m, else compute_stock_driven_model is used.
+            NegativeInflowCorrect: the correction only alters the model from the first year in which the uncorrected
+            inflow would be negative. If the triangular solve yields no negative inflow, the corrected model is equal to the
+            uncorrected one and is returned directly (fast path). Otherwise compute_stock_driven_model_negative_inflow_corrected is used.
+        """
+        if self.s is not None:
+            if self.lt is not None:
+                # construct the sf of a product of cohort tc remaining in the stock in year t
+                self.compute_sf() # Computes sf if not present already.
+                sf = np.tril(self.sf) # only cohorts c <= t are present in year t
+                if np.any(sf.diagonal() == 0): # inflow is 0 in these years, handled by the year-by-year model
+                    if NegativeInflowCorrect is True:
+                        return self.compute_stock_driven_model_negative_inflow_corrected()
+                    return self.compute_stock_driven_model(NegativeInflowCorrect = NegativeInflowCorrect)
+                i = scipy.linalg.solve_triangular(sf, self.s, lower=True) # s[m] = sum_c sf[m,c] * i[c]
+                if NegativeInflowCorrect is True and np.any(i < 0): # correction is needed from the first negative inflow onwards
+                    return self.compute_stock_driven_model_negative_inflow_corrected()
+                self.i = i
+                self.s_c = np.einsum('c,tc->tc', self.i, sf) # s_c[t,c] = i[c] * sf[t,c]
+                self.o_c = np.zeros((len(self.t), len(self.t)))
+                self.o_c[1::, :] = -1 * np.diff(self.s_c, n=1, axis=0) # outflow from previous age-cohorts
+                self.o_c[np.diag_indices(len(self.t))] = self.i * (1 - sf.diagonal()) # outflow during first year
+                return self.s_c, self.o_c, self.i
+            else:
+                # No lifetime distribution specified
+                return None, None, None
+        else:
+            # No stock specified
+            return None, None, None
+
+    def compute_stock_driven_model_negative_inflow_corrected(self):
+        """ Same result as compute_stock_driven_model(NegativeInflowCorrect = True), up to rounding, in O(Nt^2) instead of O(Nt^3).
+            The year-by-year model rescales all future stock of the existing cohorts, s_c[m::, 0:m], by (1 - Delta_percent)
+            in every year m with a negative inflow test. Here these factors are only tracked as a cumulative product g:
+            the stock of cohort c in year t is i[c] * sf[t,c] * g[t] / g[c], and s_c and o_c are built once at the end.
+            A year with Delta_percent = 1 removes the whole stock, after it g restarts at 1 and the older cohorts stay 0.
+        """
+        if self.s is not None:
+            if self.lt is not None:
+                self.compute_sf() # Computes sf if not present already.
+                sf = np.tril(self.sf) # only cohorts c <= t are present in year t
+                Nt = len(self.t)
+                self.i = np.zeros(Nt)
+                g = np.ones(Nt) # g[t]: product of the factors (1 - Delta_percent) of the years up to t, since the last restart
+                first_cohort = np.zeros(Nt, dtype=int) # first cohort still in the stock in year t (older ones were removed)
+                if sf[0, 0] != 0: # Else, inflow is 0.
+                    self.i[0] = self.s[0] / sf[0, 0]
+                w = np.zeros(Nt) # w[c] = i[c] / g[c]
+                w[0] = self.i[0]
+                if dsm_kernels.USE_KERNELS: # same loop, compiled
+                    dsm_kernels.stock_driven_negative_inflow_corrected(self.s, sf, self.i, g, first_cohort, w)
+                else:
+                    for m in range(1, Nt):  # for all years m, starting in second year
+                        lo = first_cohort[m-1]
+                        # stock of the previous age-cohorts in year m, before a correction in year m
+                        stock_previous = g[m-1] * (sf[m, lo:m] * w[lo:m]).sum()
+                        InflowTest = self.s[m] - stock_previous
+                        g[m], first_cohort[m] = g[m-1], lo
+                        if InflowTest < 0: # if stock-driven model would yield negative inflow, inflow stays 0
+                            Delta_percent = -1 * InflowTest / stock_previous if stock_previous != 0 else 0
+                            g[m] = g[m-1] * (1 - Delta_percent) # shrink the stock of the previous cohorts in year m and after
+                            if g[m] == 0: # whole stock removed
+                                g[m], first_cohort[m] = 1, m
+                        elif sf[m, m] != 0: # Else, inflow is 0.
+                            self.i[m] = InflowTest / sf[m, m] # allow for outflow during first year by rescaling with 1/sf[m,m]
+                        w[m] = self.i[m] / g[m]
+                # s_c[t,c] = i[c] * sf[t,c] * g[t] / g[c], for the cohorts c still in the stock in year t
+                self.s_c = sf * w[np.newaxis, :] * g[:, np.newaxis]
+                self.s_c[np.arange(Nt)[np.newaxis, :] < first_cohort[:, np.newaxis]] = 0
+                # the outflow of the previous cohorts, including the stock removed by the correction, is the decrease of their stock
+                self.o_c = np.zeros((Nt, Nt))
+                self.o_c[1::, :] = -1 * np.diff(self.s_c, n=1, axis=0)
+                self.o_c[np.diag_indices(Nt)] = self.i * (1 - sf.diagonal()) # outflow during first year
+                return self.s_c, self.o_c, self.i
+            else:
+                # No lifetime distribution specified
+                return None, None, None
+        else:
+            # No stock specified
+            return None, None, None
+
     def compute_stock_driven_model_initialstock(self,InitialStock,SwitchTime,NegativeInflowCorrect = False):
         """ With given total stock and lifetime distribution, the method builds the stock by cohort and the inflow.
         The extra parameter InitialStock is a vector that contains the age structure of the stock at the END of the year Switchtime -1 = t0.
@@ -462,6 +600,10 @@ class DynamicStockModel(object):
                          
                 # Add stock from historic inflow
                 self.s_c[:,0:SwitchTime-1] = np.einsum('tc,c->tc',self.sf[:,0:SwitchTime-1],self.i[0:SwitchTime-1])
+                if dsm_kernels.USE_KERNELS: # historic outflow and future years, compiled
+                    dsm_kernels.stock_driven_initialstock(self.s, self.sf, self.s_c, self.o_c, self.i, SwitchTime, NegativeInflowCorrect is True)
+                    self.s[0:SwitchTime-1]= self.s_c[0:SwitchTime-1,:].sum(axis =1).copy()
+                    return self.s_c, self.o_c, self.i
                 # calculate historic outflow
                 for m in range(0,SwitchTime-1):
                     self.o_c[m, m]    = self.i[m] * (1 - self.sf[m, m])
@@ -571,23 +713,26 @@ class DynamicStockModel(object):
                          # Such items will be ignored and break the mass balance.
             
                 # year-by-year computation, starting from SwitchTime
-                for t in range(SwitchTime, Ntt):  # for all years t, starting at SwitchTime
-                    # 1) Compute stock at the end of the year:
-                    s_cg[t - SwitchTime,:,:] = np.einsum('cg,cg->cg',i_g,SFArrayCombined[t,:,:])
-                    # 2) Compute outflow during year t from previous age-cohorts:
-                    if t == SwitchTime:
-                        o_cg[t -SwitchTime,:,:] = InitialStock - s_cg[t -SwitchTime,:,:]
-                    else:
-                        o_cg[t -SwitchTime,:,:] = s_cg[t -SwitchTime -1,:,:] - s_cg[t -SwitchTime,:,:] # outflow table is filled row-wise, for each year t.
-                    # 3) Determine total inflow from mass balance:
-                    i0 = FutureStock[t -SwitchTime] - s_cg[t - SwitchTime,:,:].sum()
-                    # 4) Add new inflow to stock and determine future decay of new age-cohort
-                    i_g[t,:] = TypeSplit[t -SwitchTime,:] * i0
-                    for g in range(0,Ng): # Correct for share of inflow leaving during first year.
-                        if SFArrayCombined[t,t,g] != 0: # Else, inflow leaves within the same year and stock modelling is useless
-                            i_g[t,g] = i_g[t,g] / SFArrayCombined[t,t,g] # allow for outflow during first year by rescaling with 1/SF[t,t,g]
-                        s_cg[t -SwitchTime,t,g]  = i_g[t,g] * SFArrayCombined[t,t,g]
-                        o_cg[t -SwitchTime,t,g]  = i_g[t,g] * (1 - SFArrayCombined[t,t,g])
+                if dsm_kernels.USE_KERNELS: # same loop, compiled
+                    dsm_kernels.stock_driven_initialstock_typesplit(FutureStock, InitialStock, SFArrayCombined, TypeSplit, s_cg, o_cg, i_g, SwitchTime)
+                else:
+                    for t in range(SwitchTime, Ntt):  # for all years t, starting at SwitchTime
+                        # 1) Compute stock at the end of the year:
+                        s_cg[t - SwitchTime,:,:] = np.einsum('cg,cg->cg',i_g,SFArrayCombined[t,:,:])
+                        # 2) Compute outflow during year t from previous age-cohorts:
+                        if t == SwitchTime:
+                            o_cg[t -SwitchTime,:,:] = InitialStock - s_cg[t -SwitchTime,:,:]
+                        else:
+                            o_cg[t -SwitchTime,:,:] = s_cg[t -SwitchTime -1,:,:] - s_cg[t -SwitchTime,:,:] # outflow table is filled row-wise, for each year t.
+                        # 3) Determine total inflow from mass balance:
+                        i0 = FutureStock[t -SwitchTime] - s_cg[t - SwitchTime,:,:].sum()
+                        # 4) Add new inflow to stock and determine future decay of new age-cohort
+                        i_g[t,:] = TypeSplit[t -SwitchTime,:] * i0
+                        for g in range(0,Ng): # Correct for share of inflow leaving during first year.
+                            if SFArrayCombined[t,t,g] != 0: # Else, inflow leaves within the same year and stock modelling is useless
+                                i_g[t,g] = i_g[t,g] / SFArrayCombined[t,t,g] # allow for outflow during first year by rescaling with 1/SF[t,t,g]
+                            s_cg[t -SwitchTime,t,g]  = i_g[t,g] * SFArrayCombined[t,t,g]
+                            o_cg[t -SwitchTime,t,g]  = i_g[t,g] * (1 - SFArrayCombined[t,t,g])
                     
                 # Add total values of parameter to enable mass balance check:
                 self.s_c = s_cg.sum(axis =2)
@@ -675,7 +820,9 @@ class DynamicStockModel(object):
                 self.s[0:SwitchTime] = np.einsum('tcg->t',s_cg[0:SwitchTime,:,:])
                 
                 # for future: year-by-year computation, starting from SwitchTime
-                if NegativeInflowCorrect is False:
+                if dsm_kernels.USE_KERNELS: # same loops, compiled
+                    dsm_kernels.stock_driven_initialstock_typesplit_negativeinflowcorrect(self.s, SFArrayCombined, TypeSplit, s_cg, o_cg, i_g, NIC_Flags, SwitchTime, NegativeInflowCorrect is True)
+                elif NegativeInflowCorrect is False:
                     for m in range(SwitchTime, len(self.t)):  # for all years m, starting at SwitchTime
                         # 1) Determine inflow from mass balance:
                         i0_test = self.s[m] - s_cg[m,:,:].sum()
@@ -692,7 +839,7 @@ class DynamicStockModel(object):
                             o_cg[m,m,g]     = i_g[m,g] * (1 - SFArrayCombined[m,m,g])
                             o_cg[m+1::,m,g] = s_cg[m:-1,m,g] - s_cg[m+1::,m,g]
                             
-                if NegativeInflowCorrect is True:
+                elif NegativeInflowCorrect is True:
                     for m in range(SwitchTime, len(self.t)):  # for all years m, starting at SwitchTime
                         # 1) Determine inflow from mass balance:
                         i0_test = self.s[m] - s_cg[m,:,:].sum()
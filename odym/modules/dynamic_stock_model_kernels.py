@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+"""
+Compiled kernels for the year-by-year recursions of the DynamicStockModel
+
+The stock-driven models, including compute_stock_driven_model_negative_inflow_corrected that the
+negative inflow correction of compute_stock_driven_model_vectorized runs, compute the inflow of year m
+from the stock left over from all previous years, so their loops over the years cannot be vectorized.
+The kernels below run the same loops element by element and are compiled with numba when it is installed,
+which removes the Python overhead of the numpy slicing in every year.
+Without numba, USE_KERNELS is False and the DynamicStockModel runs its numpy implementation.
+
+The kernels perform the same floating point operations in the same order as the numpy implementation,
+including the pairwise summation numpy uses for sums, so both give bit-for-bit the same results.
+
+dependencies:
+    numpy >= 1.9
+    numba (optional)
+"""
+
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+NUMBA_AVAILABLE = numba is not None
+USE_KERNELS = NUMBA_AVAILABLE # set to False to run the numpy implementation even if numba is installed
+
+
+def jit(function):
+    """ Compiles the function with numba if it is installed, else returns it unchanged """
+    if numba is None:
+        return function
+    return numba.njit(cache=True)(function)
+
+
+@jit
+def _block_sum(a, start, n):
+    """ Sum of a[start:start+n] for n <= 128, numpy's block size, in the order numpy adds the elements """
+    res = 0.
+    if n < 8:
+        for k in range(start, start + n):
+            res += a[k]
+        return res
+    r0, r1, r2, r3 = a[start], a[start + 1], a[start + 2], a[start + 3]
+    r4, r5, r6, r7 = a[start + 4], a[start + 5], a[start + 6], a[start + 7]
+    k = start + 8
+    stop = start + n - (n % 8)
+    while k < stop: # 8 partial sums
+        r0 += a[k]
+        r1 += a[k + 1]
+        r2 += a[k + 2]
+        r3 += a[k + 3]
+        r4 += a[k + 4]
+        r5 += a[k + 5]
+        r6 += a[k + 6]
+        r7 += a[k + 7]
+        k += 8
+    res = ((r0 + r1) + (r2 + r3)) + ((r4 + r5) + (r6 + r7))
+    while k < start + n:
+        res += a[k]
+        k += 1
+    return res
+
+
+@jit
+def _pairwise_sum(a):
+    """ Same as a.sum() for a 1d array: numpy splits the array in halves (rounded to multiples of 8) until the parts
+        fit in a block, and adds the sums of the halves. The recursion is unrolled on an explicit stack """
+    n = a.shape[0]
+    if n <= 128:
+        return _block_sum(a, 0, n)
+    depth = 2 * (64 + 1)
+    starts = np.empty(depth, dtype=np.int64)
+    sizes = np.empty(depth, dtype=np.int64)
+    combine = np.empty(depth, dtype=np.bool_) # True: both halves of the part are summed, add them
+    values = np.empty(depth)
+    starts[0], sizes[0], combine[0] = 0, n, False
+    top, n_values = 1, 0
+    while top > 0:
+        top -= 1
+        start, size = starts[top], sizes[top]
+        if combine[top]:
+            n_values -= 1
+            values[n_values - 1] = values[n_values - 1] + values[n_values]
+        elif size <= 128:
+            values[n_values] = _block_sum(a, start, size)
+            n_values += 1
+        else:
+            n2 = size // 2
+            n2 -= n2 % 8
+            combine[top] = True
+            starts[top + 1], sizes[top + 1], combine[top + 1] = start + n2, size - n2, False
+            starts[top + 2], sizes[top + 2], combine[top + 2] = start, n2, False
+            top += 3
+    return values[0]
+
+
+@jit
+def total(a):
+    """ Same as a.sum() for a C-contiguous array """
+    return _pairwise_sum(a.ravel())
+
+
+@jit
+def _add_cohort(sf, s_c, o_c, i, m):
+    """ Adds the stock and first year outflow of the inflow i[m] of year m """
+    for t in range(m, sf.shape[0]):
+        s_c[t, m] = i[m] * sf[t, m]
+    o_c[m, m] = i[m] * (1 - sf[m, m])
+
+
+@jit
+def _correct_negative_inflow(s_c, o_c, m, InflowTest):
+    """ Removes the stock surplus -InflowTest from the previous age-cohorts in year m, each cohort loses the same fraction,
+        which also shrinks their stock in the future years """
+    Delta = -1 * InflowTest
+    stock = total(s_c[m, :])
+    Delta_percent = Delta / stock if stock != 0 else 0.
+    for c in range(s_c.shape[1]):
+        o_c[m, c] = o_c[m, c] + s_c[m, c] * Delta_percent
+    for t in range(m, s_c.shape[0]):
+        for c in range(m):
+            s_c[t, c] = s_c[t, c] * (1 - Delta_percent)
+
+
+@jit
+def stock_driven(s, sf, s_c, o_c, i, NegativeInflowCorrect):
+    """ Years 1 to Nt-1 of DynamicStockModel.compute_stock_driven_model, s_c, o_c and i are filled in place """
+    for m in range(1, s_c.shape[0]):
+        for c in range(m):
+            o_c[m, c] = s_c[m-1, c] - s_c[m, c]
+        InflowTest = s[m] - total(s_c[m, :])
+        if NegativeInflowCorrect and InflowTest < 0:
+            i[m] = 0
+            _correct_negative_inflow(s_c, o_c, m, InflowTest)
+        else:
+            if sf[m, m] != 0: # Else, inflow is 0.
+                i[m] = InflowTest / sf[m, m]
+            _add_cohort(sf, s_c, o_c, i, m)
+
+
+@jit
+def stock_driven_initialstock(s, sf, s_c, o_c, i, SwitchTime, NegativeInflowCorrect):
+    """ Historic outflows and future years of DynamicStockModel.compute_stock_driven_model_initialstock,
+        after the stock of the historic inflows was added to s_c """
+    Nt = s_c.shape[0]
+    for m in range(0, SwitchTime-1):
+        o_c[m, m] = i[m] * (1 - sf[m, m])
+        for t in range(m+1, Nt):
+            o_c[t, m] = s_c[t-1, m] - s_c[t, m]
+    for m in range(SwitchTime-1, Nt):
+        if NegativeInflowCorrect:
+            for c in range(m):
+                o_c[m, c] = s_c[m-1, c] - s_c[m, c]
+        InflowTest = s[m] - total(s_c[m, :])
+        if NegativeInflowCorrect and InflowTest < 0:
+            i[m] = 0
+            _correct_negative_inflow(s_c, o_c, m, InflowTest)
+        else:
+            if sf[m, m] != 0: # Else, inflow is 0.
+                i[m] = InflowTest / sf[m, m]
+            _add_cohort(sf, s_c, o_c, i, m)
+            if not NegativeInflowCorrect:
+                for t in range(m+1, Nt):
+                    o_c[t, m] = s_c[t-1, m] - s_c[t, m]
+
+
+@jit
+def stock_driven_initialstock_typesplit(FutureStock, InitialStock, SFArrayCombined, TypeSplit, s_cg, o_cg, i_g, SwitchTime):
+    """ Future years of DynamicStockModel.compute_stock_driven_model_initialstock_typesplit, after the historic inflows """
+    Ntt, Ng = SFArrayCombined.shape[0], SFArrayCombined.shape[2]
+    for t in range(SwitchTime, Ntt):
+        m = t - SwitchTime
+        for c in range(Ntt):
+            for g in range(Ng):
+                s_cg[m, c, g] = i_g[c, g] * SFArrayCombined[t, c, g]
+                if t == SwitchTime:
+                    o_cg[m, c, g] = InitialStock[c, g] - s_cg[m, c, g]
+                else:
+                    o_cg[m, c, g] = s_cg[m-1, c, g] - s_cg[m, c, g]
+        i0 = FutureStock[m] - total(s_cg[m])
+        for g in range(Ng): # Correct for share of inflow leaving during first year.
+            i_g[t, g] = TypeSplit[m, g] * i0
+            if SFArrayCombined[t, t, g] != 0:
+                i_g[t, g] = i_g[t, g] / SFArrayCombined[t, t, g]
+            s_cg[m, t, g] = i_g[t, g] * SFArrayCombined[t, t, g]
+            o_cg[m, t, g] = i_g[t, g] * (1 - SFArrayCombined[t, t, g])
+
+
+@jit
+def stock_driven_initialstock_typesplit_negativeinflowcorrect(s, SFArrayCombined, TypeSplit, s_cg, o_cg, i_g, NIC_Flags,
+                                                             SwitchTime, NegativeInflowCorrect):
+    """ Future years of DynamicStockModel.compute_stock_driven_model_initialstock_typesplit_negativeinflowcorrect,
+        after the stock and outflow of the historic inflows were computed """
+    Ntt, Ng = SFArrayCombined.shape[0], SFArrayCombined.shape[2]
+    for m in range(SwitchTime, Ntt):
+        i0_test = s[m] - total(s_cg[m])
+        if i0_test < 0:
+            NIC_Flags[m, 0] = i0_test
+        if NegativeInflowCorrect and i0_test < 0:
+            Delta = -1 * i0_test
+            stock = total(s_cg[m])
+            Delta_percent = Delta / stock if stock != 0 else 0.
+            for g in range(Ng):
+                i_g[m, g] = 0
+            for c in range(Ntt):
+                for g in range(Ng):
+                    o_cg[m, c, g] = o_cg[m, c, g] + s_cg[m, c, g] * Delta_percent
+            for t in range(m, Ntt):
+                for c in range(m):
+                    for g in range(Ng):
+                        s_cg[t, c, g] = s_cg[t, c, g] * (1 - Delta_percent)
+            for t in range(m+1, Ntt): # recalculate future outflows
+                for c in range(Ntt):
+                    for g in range(Ng):
+                        o_cg[t, c, g] = s_cg[t-1, c, g] - s_cg[t, c, g]
+        else:
+            for g in range(Ng):
+                if SFArrayCombined[m, m, g] != 0: # Else, inflow is 0.
+                    i_g[m, g] = TypeSplit[m, g] * i0_test / SFArrayCombined[m, m, g]
+                for t in range(m, Ntt):
+                    s_cg[t, m, g] = i_g[m, g] * SFArrayCombined[t, m, g]
+                o_cg[m, m, g] = i_g[m, g] * (1 - SFArrayCombined[m, m, g])
+                for t in range(m+1, Ntt):
+                    o_cg[t, m, g] = s_cg[t-1, m, g] - s_cg[t, m, g]
+
+
+@jit
+def stock_driven_negative_inflow_corrected(s, sf, i, g, first_cohort, w):
+    """ Years 1 to Nt-1 of DynamicStockModel.compute_stock_driven_model_negative_inflow_corrected, i, g, first_cohort
+        and w are filled in place. sf is lower triangular """
+    products = np.empty(s.shape[0])
+    for m in range(1, s.shape[0]):
+        lo = first_cohort[m-1]
+        for c in range(lo, m):
+            products[c - lo] = sf[m, c] * w[c]
+        stock_previous = g[m-1] * _pairwise_sum(products[:m - lo])
+        InflowTest = s[m] - stock_previous
+        g[m], first_cohort[m] = g[m-1], lo
+        if InflowTest < 0:
+            Delta_percent = -1 * InflowTest / stock_previous if stock_previous != 0 else 0.
+            g[m] = g[m-1] * (1 - Delta_percent)
+            if g[m] == 0: # whole stock removed
+                g[m], first_cohort[m] = 1, m
+        elif sf[m, m] != 0: # Else, inflow is 0.
+            i[m] = InflowTest / sf[m, m]
+        w[m] = i[m] / g[m]
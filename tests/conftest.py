@@ -0,0 +1,20 @@
+from pathlib import Path
+
+import pytest
+
+from dmfa.layered_dmfa import calculate_layered_DMFA
+from dmfa.scenario_input import import_scenarios
+
+SCENARIO_WORKBOOK = Path(__file__).parent.parent / 'data' / 'dmfa_data.xlsx'
+
+
+@pytest.fixture(scope='session')
+def scenario_inputs():
+    """ The scenarios of the bundled scenario workbook """
+    return import_scenarios(SCENARIO_WORKBOOK)
+
+
+@pytest.fixture(scope='session')
+def layered_dmfas(scenario_inputs):
+    """ The reference results: every scenario solved on its own with calculate_layered_DMFA """
+    return [calculate_layered_DMFA(scenario_input) for scenario_input in scenario_inputs]
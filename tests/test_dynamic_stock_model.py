@@ -0,0 +1,54 @@
+""" The vectorized stock-driven models must give the results of the year-by-year compute_stock_driven_model """
+import numpy as np
+import pytest
+
+from odym.modules.dynamic_stock_model import DynamicStockModel
+
+N_YEARS = [1, 2, 30, 150]
+
+
+def lifetime():
+    """ A new dict for every model, the DynamicStockModel tiles the parameters of the given dict in place """
+    return {'Type': 'Normal', 'Mean': np.array([12.]), 'StdDev': np.array([4.])}
+
+
+def random_stock(Nt, declining):
+    """ A random stock time series, a declining one has years with a negative inflow """
+    rng = np.random.default_rng(Nt)
+    if declining:
+        return np.maximum(np.cumsum(rng.normal(0, 3, Nt)) + 50, 0) * np.linspace(1, 0.2, Nt)
+    return np.cumsum(rng.uniform(0, 10, Nt))
+
+
+def assert_same_model(dsm, reference):
+    """ Stock, stock by cohort, outflow by cohort and inflow, compared relative to the largest stock """
+    atol = 1e-12 * np.abs(reference.s).max()
+    for name in ['s', 's_c', 'o_c', 'i']:
+        np.testing.assert_allclose(getattr(dsm, name), getattr(reference, name), rtol=1e-10, atol=atol, err_msg=name)
+
+
+def solve(method, Nt, s, *args):
+    dsm = DynamicStockModel(t=np.arange(Nt), s=s.copy(), lt=lifetime())
+    getattr(dsm, method)(*args)
+    return dsm
+
+
+@pytest.mark.parametrize('Nt', N_YEARS)
+@pytest.mark.parametrize('declining, NegativeInflowCorrect', [(False, False), (False, True), (True, False)])
+def test_vectorized_stock_driven_model(Nt, declining, NegativeInflowCorrect):
+    s = random_stock(Nt, declining)
+    assert_same_model(solve('compute_stock_driven_model_vectorized', Nt, s, NegativeInflowCorrect),
+                      solve('compute_stock_driven_model', Nt, s, NegativeInflowCorrect))
+
+
+@pytest.mark.parametrize('Nt', N_YEARS)
+@pytest.mark.parametrize('stock', ['growing', 'declining', 'drops to zero', 'zero at the start'])
+def test_negative_inflow_corrected_stock_driven_model(Nt, stock):
+    s = random_stock(Nt, stock != 'growing')
+    if stock == 'drops to zero':  # the whole stock is removed, then built up again
+        s[Nt // 2:Nt // 2 + 3] = 0
+    elif stock == 'zero at the start':
+        s[:Nt // 3] = 0
+    reference = solve('compute_stock_driven_model', Nt, s, True)
+    assert_same_model(solve('compute_stock_driven_model_negative_inflow_corrected', Nt, s), reference)
+    assert_same_model(solve('compute_stock_driven_model_vectorized', Nt, s, True), reference)
@@ -0,0 +1,134 @@
+""" The kernels of dynamic_stock_model_kernels must give bit-for-bit the same results as the numpy implementation """
+import copy
+import importlib
+import sys
+
+import numpy as np
+import pytest
+
+from odym.modules import dynamic_stock_model_kernels
+from odym.modules.dynamic_stock_model import DynamicStockModel
+
+N_YEARS = [1, 2, 5, 9, 30, 140, 300]  # 140 and 300 years exceed numpy's summation block of 128 elements
+
+
+def random_stock(rng, Nt, declining):
+    """ A random stock time series, a declining one has years with a negative inflow """
+    return np.maximum(np.cumsum(rng.normal(0 if declining else 1, 3, Nt)) + 50, 0)
+
+
+def random_lifetime(rng):
+    return {'Type': 'Normal', 'Mean': np.array([rng.uniform(3, 20)]), 'StdDev': np.array([rng.uniform(1, 5)])}
+
+
+def random_type_split(rng, Nt, Ng=3):
+    """ Survival functions (Nt, Nt, Ng), a type split (Nt, Ng) and the age structure of an initial stock (Nt, Ng) """
+    SFArrayCombined = rng.uniform(0.2, 1, (Nt, Nt, Ng)) * np.tril(np.ones((Nt, Nt)))[:, :, np.newaxis]
+    TypeSplit = rng.dirichlet(np.ones(Ng), Nt)
+    InitialStock = rng.uniform(0, 5, (Nt, Ng))
+    return SFArrayCombined, TypeSplit, InitialStock
+
+
+def run(method, dsm_args, args, use_kernels):
+    """ The results and the stock, stock by cohort, outflow by cohort and inflow of the model after calling the method """
+    dynamic_stock_model_kernels.USE_KERNELS = use_kernels
+    dsm = DynamicStockModel(**copy.deepcopy(dsm_args))
+    results = getattr(dsm, method)(*copy.deepcopy(args))
+    return [np.asarray(result, dtype=float) for result in results] + [dsm.s, dsm.s_c, dsm.o_c, dsm.i]
+
+
+def assert_kernels_equal_numpy(method, dsm_args, args):
+    use_kernels = dynamic_stock_model_kernels.USE_KERNELS
+    try:
+        expected = run(method, dsm_args, args, use_kernels=False)
+        actual = run(method, dsm_args, args, use_kernels=True)
+    finally:
+        dynamic_stock_model_kernels.USE_KERNELS = use_kernels
+    assert len(actual) == len(expected)
+    for a, e in zip(actual, expected):
+        assert np.array_equal(a, e)
+
+
+@pytest.fixture(params=['compiled', 'uncompiled'])
+def kernels(request, monkeypatch):
+    """ Runs the test with the kernels compiled by numba, if it is installed, and with the kernels as plain python,
+        as when numba is missing """
+    if request.param == 'compiled':
+        if not dynamic_stock_model_kernels.NUMBA_AVAILABLE:
+            pytest.skip('numba is not installed')
+        yield dynamic_stock_model_kernels
+        return
+    monkeypatch.setitem(sys.modules, 'numba', None)  # import numba raises ImportError
+    importlib.reload(dynamic_stock_model_kernels)
+    assert not dynamic_stock_model_kernels.NUMBA_AVAILABLE
+    yield dynamic_stock_model_kernels
+    monkeypatch.undo()
+    importlib.reload(dynamic_stock_model_kernels)
+
+
+@pytest.mark.parametrize('Nt', N_YEARS)
+@pytest.mark.parametrize('declining', [False, True])
+@pytest.mark.parametrize('NegativeInflowCorrect', [False, True])
+def test_stock_driven_model(kernels, Nt, declining, NegativeInflowCorrect):
+    rng = np.random.default_rng(Nt)
+    dsm_args = dict(t=np.arange(Nt), s=random_stock(rng, Nt, declining), lt=random_lifetime(rng))
+    assert_kernels_equal_numpy('compute_stock_driven_model', dsm_args, (NegativeInflowCorrect,))
+
+
+@pytest.mark.parametrize('Nt', N_YEARS)
+@pytest.mark.parametrize('declining', [False, True])
+def test_stock_driven_model_negative_inflow_corrected(kernels, Nt, declining):
+    rng = np.random.default_rng(Nt)
+    s = random_stock(rng, Nt, declining)
+    s[Nt // 2:Nt // 2 + 3] = 0  # the whole stock is removed
+    dsm_args = dict(t=np.arange(Nt), s=s, lt=random_lifetime(rng))
+    assert_kernels_equal_numpy('compute_stock_driven_model_negative_inflow_corrected', dsm_args, ())
+
+
+@pytest.mark.parametrize('Nt', N_YEARS[2:])
+@pytest.mark.parametrize('declining', [False, True])
+@pytest.mark.parametrize('NegativeInflowCorrect', [False, True])
+def test_stock_driven_model_initialstock(kernels, Nt, declining, NegativeInflowCorrect):
+    rng = np.random.default_rng(Nt)
+    SwitchTime = Nt // 3 + 1
+    s = random_stock(rng, Nt, declining)
+    s[:SwitchTime - 1] = 0
+    InitialStock = rng.uniform(0, 5, SwitchTime - 1)
+    dsm_args = dict(t=np.arange(Nt), s=s, lt=random_lifetime(rng))
+    assert_kernels_equal_numpy('compute_stock_driven_model_initialstock', dsm_args,
+                               (InitialStock, SwitchTime, NegativeInflowCorrect))
+
+
+@pytest.mark.parametrize('Nt', N_YEARS[2:])
+@pytest.mark.parametrize('declining', [False, True])
+def test_stock_driven_model_initialstock_typesplit(kernels, Nt, declining):
+    rng = np.random.default_rng(Nt)
+    SwitchTime = Nt // 3 + 1
+    s = random_stock(rng, Nt, declining)
+    SFArrayCombined, TypeSplit, InitialStock = random_type_split(rng, Nt)
+    InitialStock[SwitchTime:] = 0
+    dsm_args = dict(t=np.arange(Nt), s=s, lt=random_lifetime(rng))
+    assert_kernels_equal_numpy('compute_stock_driven_model_initialstock_typesplit', dsm_args,
+                               (s[SwitchTime:], InitialStock, SFArrayCombined, TypeSplit[SwitchTime:]))
+
+
+@pytest.mark.parametrize('Nt', N_YEARS[2:])
+@pytest.mark.parametrize('declining', [False, True])
+@pytest.mark.parametrize('NegativeInflowCorrect', [False, True])
+def test_stock_driven_model_initialstock_typesplit_negativeinflowcorrect(kernels, Nt, declining, NegativeInflowCorrect):
+    rng = np.random.default_rng(Nt)
+    SwitchTime = Nt // 3 + 1
+    s = random_stock(rng, Nt, declining)
+    s[:SwitchTime] = 0
+    SFArrayCombined, TypeSplit, InitialStock = random_type_split(rng, Nt)
+    InitialStock[SwitchTime:] = 0
+    dsm_args = dict(t=np.arange(Nt), s=s, lt=random_lifetime(rng))
+    assert_kernels_equal_numpy('compute_stock_driven_model_initialstock_typesplit_negativeinflowcorrect', dsm_args,
+                               (SwitchTime, InitialStock, SFArrayCombined, TypeSplit, NegativeInflowCorrect))
+
+
+def test_total_matches_numpy_sum(kernels):
+    rng = np.random.default_rng(0)
+    for n in [0, 1, 7, 8, 127, 128, 129, 1000, 4099]:
+        a = rng.normal(size=n) * 10.0 ** rng.integers(-8, 8, n)
+        assert kernels.total(a) == a.sum()
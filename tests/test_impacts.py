@@ -0,0 +1,89 @@
+""" The impacts of all scenarios, computed as one characterization matrix product, must give the impacts
+    of the original per scenario formulas """
+import numpy as np
+
+from dmfa.impacts import IMPACT_CATEGORIES, calculate_impacts, calculate_impacts_table
+from dmfa.layered_dmfa_batch import calculate_layered_DMFA_batch
+
+MIDPOINT = 'mid point characterization factor (kg 1,4-DCB / kg)'
+DALY = 'end point characterization factor (DALY/kg)'
+SPECIES = 'end point characterization factor (species.yr/kg)'
+
+
+def reference_impacts(layered_dmfa) -> dict[str, np.ndarray]:
+    """ The impacts of one scenario, written out category by category """
+    scenario_input = layered_dmfa.scenario_input
+    decaBDE_CFs, TPP_CFs = scenario_input.df_decaBDE_CFs, scenario_input.df_TPP_CFs
+    dS_0_decaBDE = layered_dmfa.decaBDE.dS_0.values
+    dS_0_TPP = layered_dmfa.TPP.dS_0.values
+    CO2 = ((layered_dmfa.decaBDE.F_2_3.values - layered_dmfa.decaBDE.F_3_0.values) * 0.055047
+           + (layered_dmfa.TPP.F_2_3.values - layered_dmfa.TPP.F_3_0.values) * 2.4273)
+
+    human_health_without_global_warming = dS_0_decaBDE * (
+        decaBDE_CFs.loc['human carcinogenic toxicity', DALY] + decaBDE_CFs.loc['human non-carcinogenic toxicity', DALY])
+    human_health_only_global_warming = scenario_input.CO2_endpoint_CF_health * CO2
+    ecosystem_health_without_global_warming = dS_0_TPP * (
+        TPP_CFs.loc['terrestrial ecotoxicity', SPECIES] + TPP_CFs.loc['freshwater ecotoxicity', SPECIES]
+        + TPP_CFs.loc['marine ecotoxicity', SPECIES])
+    ecosystem_health_only_global_warming = CO2 * (
+        scenario_input.CO2_endpoint_CF_terrestrial + scenario_input.CO2_endpoint_CF_freshwater)
+    return {
+        'human_carcinogenic_toxicity': dS_0_decaBDE * decaBDE_CFs.loc['human carcinogenic toxicity', MIDPOINT],
+        'human_non_carcinogenic_toxicity': dS_0_decaBDE * decaBDE_CFs.loc['human non-carcinogenic toxicity', MIDPOINT],
+        'terrestrial_ecotoxicity': dS_0_TPP * TPP_CFs.loc['terrestrial ecotoxicity', MIDPOINT],
+        'freshwater_ecotoxicity': dS_0_TPP * TPP_CFs.loc['freshwater ecotoxicity', MIDPOINT],
+        'marine_ecotoxicity': dS_0_TPP * TPP_CFs.loc['marine ecotoxicity', MIDPOINT],
+        'CO2_global_warming': CO2,
+        'human_health': human_health_without_global_warming + human_health_only_global_warming,
+        'human_health_without_global_warming': human_health_without_global_warming,
+        'human_health_only_global_warming': human_health_only_global_warming,
+        'ecosystem_health': ecosystem_health_without_global_warming + ecosystem_health_only_global_warming,
+        'ecosystem_health_without_global_warming': ecosystem_health_without_global_warming,
+        'ecosystem_health_only_global_warming': ecosystem_health_only_global_warming,
+    }
+
+
+def assert_close(actual, expected, rtol=1e-12):
+    np.testing.assert_allclose(actual, expected, rtol=rtol, atol=rtol * np.abs(expected).max())
+
+
+def test_impacts_table_matches_the_per_scenario_impacts(scenario_inputs, layered_dmfas):
+    impacts_table = calculate_impacts_table(calculate_layered_DMFA_batch(scenario_inputs))
+    assert impacts_table.scenario_numbers == [scenario_input.scenario_number for scenario_input in scenario_inputs]
+    assert list(impacts_table.time_list) == list(layered_dmfas[0].plastic.dmfa_configruation.time_list)
+    for s, layered_dmfa in enumerate(layered_dmfas):
+        expected = reference_impacts(layered_dmfa)
+        impacts = calculate_impacts(layered_dmfa)
+        for category in IMPACT_CATEGORIES:
+            impact = getattr(impacts.midpoint_impact, category, None)
+            if impact is None:
+                impact = getattr(impacts.endpoint_impact, category)
+            assert_close(impact, expected[category])
+            assert_close(impacts_table.get(category)[s], expected[category])
+
+
+def test_window_sums_match_the_sums_over_the_years(scenario_inputs):
+    impacts_table = calculate_impacts_table(calculate_layered_DMFA_batch(scenario_inputs))
+    years = impacts_table.time_list
+    first, last = int(years[0]), int(years[-1])
+    windows = [
+        (None, None), (first, None), (None, last + 1), (first + 10, first + 40), (first + 10, first + 11),
+        (first - 50, first + 5), (last - 5, last + 50), (first + 20, first + 20), (first + 30, first + 10),
+        (last + 10, last + 20),
+    ]
+    for start_year, stop_year in windows:
+        in_window = np.ones(len(years), dtype=bool)
+        if start_year is not None:
+            in_window &= years >= start_year
+        if stop_year is not None:
+            in_window &= years < stop_year
+        expected = impacts_table.values[:, :, in_window].sum(axis=-1)
+
+        df_sums = impacts_table.window_sums(start_year, stop_year)
+        assert list(df_sums.index) == impacts_table.scenario_numbers
+        assert list(df_sums.columns) == IMPACT_CATEGORIES
+        for c, category in enumerate(IMPACT_CATEGORIES):
+            scale = np.abs(impacts_table.get(category)).sum()
+            np.testing.assert_allclose(impacts_table.window_sum(category, start_year, stop_year),
+                                       expected[:, c], rtol=1e-12, atol=1e-12 * scale)
+            np.testing.assert_allclose(df_sums[category].to_numpy(), expected[:, c], rtol=1e-12, atol=1e-12 * scale)
@@ -0,0 +1,48 @@
+""" IncrementalLayeredDMFA must give the results of a full calculation, whatever is cached """
+import dataclasses
+
+import numpy as np
+
+from dmfa.incremental import IncrementalLayeredDMFA
+from dmfa.layered_dmfa import calculate_layered_DMFA
+from dmfa.layered_dmfa_batch import LAYERS
+from dmfa.usephase import USEPHASE_TOTALS
+
+
+def assert_close(actual, expected, rtol=1e-12):
+    """ The stacked solvers round differently than the per scenario solvers, compared relative to the largest value """
+    np.testing.assert_allclose(actual, expected, rtol=rtol, atol=rtol * np.abs(expected).max())
+
+
+def test_impacts_of_scenarios_with_the_same_inputs_keep_their_scenario_number(scenario_inputs):
+    scenario = scenario_inputs[0]
+    twin = dataclasses.replace(scenario, scenario_number=99)
+    incremental = IncrementalLayeredDMFA()
+
+    first = incremental.calculate_impacts_table([scenario, twin])
+    assert first.scenario_numbers == [scenario.scenario_number, 99]
+    second = incremental.calculate_impacts_table([scenario, twin])
+    assert incremental.recomputed == []
+    assert second.scenario_numbers == [scenario.scenario_number, 99]
+    assert np.array_equal(second.values, first.values)
+    assert incremental.calculate_impacts_table([scenario]).scenario_numbers == [scenario.scenario_number]
+    assert incremental.calculate_impacts_table([twin]).scenario_numbers == [99]
+
+
+def test_cached_layers_own_their_arrays(scenario_inputs):
+    scenario = scenario_inputs[0]
+    stock = scenario.plastic_stock.copy()
+    stock.iloc[len(stock) // 2:] *= 0.3  # the drop needs the negative inflow correction
+    scenario_inputs = scenario_inputs + [dataclasses.replace(scenario, scenario_number=99, plastic_stock=stock)]
+    incremental = IncrementalLayeredDMFA()
+    for scenario_input, layered_dmfa in zip(scenario_inputs, incremental.calculate(scenario_inputs)):
+        expected = calculate_layered_DMFA(scenario_input)
+        for layer in LAYERS:
+            dmfa, expected_dmfa = getattr(layered_dmfa, layer), getattr(expected, layer)
+            # a view would keep the stacked arrays of all scenarios solved with it alive in the cache
+            assert dmfa.values.base is None and dmfa.transfer_coefficients.base is None
+            for name in USEPHASE_TOTALS:
+                assert getattr(dmfa.usephase, name).base is None
+            assert_close(dmfa.values, expected_dmfa.values)
+            assert_close(dmfa.usephase.stock_by_cohort, expected_dmfa.usephase.stock_by_cohort)
+            assert_close(dmfa.usephase.outflow_by_cohort, expected_dmfa.usephase.outflow_by_cohort)
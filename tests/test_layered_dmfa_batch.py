@@ -0,0 +1,32 @@
+""" The stacked batch solver must give the results of calculate_layered_DMFA for every scenario """
+import numpy as np
+
+from dmfa.layered_dmfa_batch import LAYERS, calculate_layered_DMFA_batch
+from dmfa.usephase import USEPHASE_TOTALS
+
+
+def assert_close(actual, expected, rtol=1e-12):
+    """ The stacked solvers round differently than the per scenario solvers, compared relative to the largest value """
+    np.testing.assert_allclose(actual, expected, rtol=rtol, atol=rtol * np.abs(expected).max())
+
+
+def test_batch_matches_calculate_layered_DMFA(scenario_inputs, layered_dmfas):
+    batch = calculate_layered_DMFA_batch(scenario_inputs)
+    assert [layered_dmfa.scenario_input for layered_dmfa in batch] == scenario_inputs
+    for layered_dmfa, expected in zip(batch, layered_dmfas):
+        for layer in LAYERS:
+            dmfa, expected_dmfa = getattr(layered_dmfa, layer), getattr(expected, layer)
+            assert_close(dmfa.transfer_coefficients, expected_dmfa.transfer_coefficients)
+            for name, flow_or_stock in (expected_dmfa.flows | expected_dmfa.stocks).items():
+                assert_close(dmfa.get_flow_or_stock(name).values, flow_or_stock.values)
+            for name in USEPHASE_TOTALS:
+                assert_close(getattr(dmfa.usephase, name), getattr(expected_dmfa.usephase, name))
+            assert_close(dmfa.usephase.stock_by_cohort, expected_dmfa.usephase.stock_by_cohort)
+            assert_close(dmfa.usephase.outflow_by_cohort, expected_dmfa.usephase.outflow_by_cohort)
+
+
+def test_batch_of_one_scenario(scenario_inputs, layered_dmfas):
+    for scenario_input, expected in zip(scenario_inputs, layered_dmfas):
+        [layered_dmfa] = calculate_layered_DMFA_batch([scenario_input])
+        for layer in LAYERS:
+            assert_close(getattr(layered_dmfa, layer).values, getattr(expected, layer).values)
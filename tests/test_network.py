@@ -0,0 +1,20 @@
+""" The compiled flow network must give the results of the per year solve_flows_and_stocks """
+import numpy as np
+
+from dmfa.dmfa import DMFA
+from dmfa.layered_dmfa import calculate_layered_DMFA
+from dmfa.layered_dmfa_batch import LAYERS
+
+
+def solve_year_by_year(dmfa, usephase):
+    for t in range(dmfa.dmfa_configruation.Nt):
+        dmfa.solve_flows_and_stocks(usephase, t)
+
+
+def test_compiled_network_matches_the_per_year_solver(scenario_inputs, layered_dmfas, monkeypatch):
+    monkeypatch.setattr(DMFA, 'solve_all_flows_and_stocks', solve_year_by_year)
+    for scenario_input, layered_dmfa in zip(scenario_inputs, layered_dmfas):
+        expected = calculate_layered_DMFA(scenario_input)
+        for layer in LAYERS:
+            np.testing.assert_allclose(getattr(layered_dmfa, layer).values, getattr(expected, layer).values,
+                                       rtol=1e-12, atol=0)
@@ -0,0 +1,72 @@
+""" The long format results frames must hold the timeseries of calculate_layered_DMFA for every scenario,
+    under the series names the figures used before """
+import numpy as np
+import pandas as pd
+import pytest
+
+from dmfa.impacts import calculate_impacts
+from dmfa.layered_dmfa_batch import LAYERS, calculate_layered_DMFA_batch
+from dmfa.results_frame import (IMPACT_SERIES, create_flows_frame, create_impacts_frame, create_recycled_inflow_frame,
+                                create_usephase_frame, select_rows)
+
+
+@pytest.fixture(scope='module')
+def batch(scenario_inputs):
+    return calculate_layered_DMFA_batch(scenario_inputs)
+
+
+def assert_frame_matches(df, expected_series, time_list):
+    """ expected_series: the timeseries by name, the frame must have one row per name and year """
+    assert all(isinstance(df[column].dtype, pd.CategoricalDtype) for column in df.columns if column not in ('year', 'value'))
+    assert len(df) == len(expected_series) * len(time_list)
+    values = df.pivot(index='name', columns='year', values='value')
+    assert sorted(values.index) == sorted(expected_series)
+    assert list(values.columns) == list(time_list)
+    for name, expected in expected_series.items():
+        np.testing.assert_allclose(values.loc[name].to_numpy(), expected, rtol=1e-12,
+                                   atol=1e-12 * np.abs(expected).max(), err_msg=name)
+
+
+def test_usephase_frame(batch, layered_dmfas):
+    expected = {
+        f'scenario={layered_dmfa.scenario_input.scenario_number}_{quantity}_{layer}':
+            getattr(getattr(layered_dmfa, layer).usephase, quantity)
+        for layered_dmfa in layered_dmfas for layer in LAYERS for quantity in ['inflow', 'outflow', 'stock']
+    }
+    df = create_usephase_frame(batch)
+    assert_frame_matches(df, expected, layered_dmfas[0].plastic.dmfa_configruation.time_list)
+    df_TPP = select_rows(df, layer=['TPP'], quantity=['stock'])
+    assert list(df_TPP['layer'].cat.categories) == ['TPP']
+    assert len(df_TPP) == len(layered_dmfas) * len(layered_dmfas[0].plastic.dmfa_configruation.time_list)
+
+
+def test_recycled_inflow_frame(batch, layered_dmfas):
+    expected = {}
+    for layered_dmfa in layered_dmfas:
+        for layer in LAYERS:
+            dmfa = getattr(layered_dmfa, layer)
+            inflow = dmfa.usephase.inflow
+            recycled = dmfa.F_2_1.values + dmfa.F_4_1.values
+            name = f'{layered_dmfa.scenario_input.scenario_number}_percentage_recycled_inflow_{layer}'
+            expected[name] = np.where(inflow != 0, 100 * recycled / np.where(inflow != 0, inflow, 1), 0)
+    assert_frame_matches(create_recycled_inflow_frame(batch), expected,
+                         layered_dmfas[0].plastic.dmfa_configruation.time_list)
+
+
+def test_flows_frame(batch, layered_dmfas):
+    expected = {
+        f'{flow.name}_{layer}_scenario={layered_dmfa.scenario_input.scenario_number}': flow.values
+        for layered_dmfa in layered_dmfas for layer in LAYERS
+        for flow in getattr(layered_dmfa, layer).get_flows_and_stocks()
+    }
+    assert_frame_matches(create_flows_frame(batch), expected, layered_dmfas[0].plastic.dmfa_configruation.time_list)
+
+
+def test_impacts_frame(batch, layered_dmfas):
+    expected = {}
+    for layered_dmfa in layered_dmfas:
+        impacts = calculate_impacts(layered_dmfa)
+        for kind, attribute, label in IMPACT_SERIES:
+            impact = impacts.midpoint_impact if kind in ('midpoint', 'global warming') else impacts.endpoint_impact
+            expected[f'scenario={layered_dmfa.scenario_input.scenario_number}_{label}'] = getattr(impact, attribute)
+    assert_frame_matches(create_impacts_frame(batch), expected, layered_dmfas[0].plastic.dmfa_configruation.time_list)
@@ -0,0 +1,47 @@
+""" ToeplitzSurvival must reproduce the stock and outflow by cohort of the DynamicStockModel """
+import numpy as np
+import pytest
+
+from dmfa.dmfa_configuration import DMFAConfiguration
+from odym.modules.dynamic_stock_model import DynamicStockModel
+
+
+@pytest.fixture(params=[(1, 15), (51, 15), (51, 40), (300, 15)], ids=lambda p: f'{p[0]} years, lifespan {p[1]}')
+def dmfa_configuration(request):
+    n_years, lifespan = request.param
+    return DMFAConfiguration(time_start=2000, time_end=2000 + n_years - 1, lifespan=lifespan)
+
+
+def test_dense_survival_function(dmfa_configuration):
+    np.testing.assert_allclose(dmfa_configuration.survival.to_dense(), dmfa_configuration.sf, rtol=1e-12, atol=1e-15)
+
+
+def test_inverse_sf_age(dmfa_configuration):
+    survival = dmfa_configuration.survival
+    inverse = survival.convolve(np.eye(survival.Nt), survival.inverse_sf_age)  # rows are the columns of the inverse
+    np.testing.assert_allclose(survival.to_dense() @ inverse.T, np.eye(survival.Nt), atol=1e-12)
+
+
+def test_inflow_driven(dmfa_configuration):
+    survival = dmfa_configuration.survival
+    inflow = np.random.default_rng(0).uniform(0, 100, survival.Nt)
+    dsm = DynamicStockModel(t=np.arange(survival.Nt), lt=dmfa_configuration.lt, i=inflow, sf=dmfa_configuration.sf)
+    S_C = dsm.compute_s_c_inflow_driven()
+    O_C = dsm.compute_o_c_from_s_c()
+
+    atol = 1e-12 * inflow.sum()  # the outflows are differences of stocks
+    np.testing.assert_allclose(survival.stock_by_cohort(inflow), S_C, rtol=1e-12, atol=atol)
+    np.testing.assert_allclose(survival.outflow_by_cohort(inflow), O_C, rtol=1e-12, atol=atol)
+    np.testing.assert_allclose(survival.stock(inflow), S_C.sum(axis=1), rtol=1e-12, atol=atol)
+    np.testing.assert_allclose(survival.outflow(inflow), O_C.sum(axis=1), rtol=1e-12, atol=atol)
+
+
+def test_stock_driven(dmfa_configuration):
+    survival = dmfa_configuration.survival
+    stock = np.cumsum(np.random.default_rng(0).uniform(0, 100, survival.Nt))  # growing, no negative inflow
+    dsm = DynamicStockModel(t=np.arange(survival.Nt), lt=dmfa_configuration.lt, s=stock, sf=dmfa_configuration.sf)
+    S_C, O_C, inflow = dsm.compute_stock_driven_model()
+
+    np.testing.assert_allclose(survival.inflow(stock), inflow, rtol=1e-10)
+    np.testing.assert_allclose(survival.stock_by_cohort(inflow), S_C, rtol=1e-12, atol=1e-12 * stock.max())
+    np.testing.assert_allclose(survival.outflow_by_cohort(inflow), O_C, rtol=1e-12, atol=1e-12 * stock.max())
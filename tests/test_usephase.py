@@ -0,0 +1,32 @@
+""" The use phase totals computed by convolution must match the DynamicStockModel """
+import numpy as np
+import pytest
+
+from dmfa.dmfa_configuration import DMFAConfiguration
+from dmfa.usephase import calculate_use_phase_inflowdriven, calculate_use_phase_inflowdriven_stacked
+from odym.modules.dynamic_stock_model import DynamicStockModel
+
+
+def dsm_use_phase(inflow, dmfa_configuration):
+    """ Stock and outflow by cohort of the DynamicStockModel """
+    dsm = DynamicStockModel(t=np.arange(dmfa_configuration.Nt), lt=dmfa_configuration.lt, i=inflow,
+                            sf=dmfa_configuration.sf)
+    return dsm.compute_s_c_inflow_driven(), dsm.compute_o_c_from_s_c()
+
+
+@pytest.mark.parametrize('n_years', [30, 500])  # scipy picks the fft for 500 years with method='auto'
+def test_inflowdriven_matches_dynamic_stock_model(n_years):
+    dmfa_configuration = DMFAConfiguration(time_start=2000, time_end=2000 + n_years - 1, lifespan=15)
+    inflow = np.random.default_rng(0).uniform(0, 100, (3, n_years))
+    inflow[:, :n_years // 3] = 0  # no stock before the first inflow
+
+    stacked = calculate_use_phase_inflowdriven_stacked(inflow, dmfa_configuration)
+    for s in range(len(inflow)):
+        S_C, O_C = dsm_use_phase(inflow[s], dmfa_configuration)
+        for usephase in [calculate_use_phase_inflowdriven(inflow[s], dmfa_configuration), stacked.get_scenario(s)]:
+            np.testing.assert_allclose(usephase.stock, S_C.sum(axis=1), rtol=1e-12)
+            np.testing.assert_allclose(usephase.outflow, O_C.sum(axis=1), rtol=1e-12)
+            np.testing.assert_allclose(usephase.stock_by_cohort, S_C, rtol=1e-12)
+            np.testing.assert_allclose(usephase.outflow_by_cohort, O_C, rtol=1e-12)
+            assert np.all(usephase.stock[:n_years // 3] == 0)
+            assert np.all(usephase.outflow[:n_years // 3] == 0)